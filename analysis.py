@@ -4,28 +4,30 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 import os
 
-def load_clean_data(filepath='cleaned_master_stock_data.csv'):
-    df = pd.read_csv(filepath, parse_dates=['date'])
-    for col in ['open', 'high', 'low', 'close', 'volume']:
-        df[col] = pd.to_numeric(df[col], errors='coerce')
-    df = df.dropna(subset=['date', 'close']).sort_values(['ticker', 'date'])
-    return df
-
+from store import load_master
+from panel import open_panel
+from correlation import LARGE_UNIVERSE, top_correlated
+from features import first_last_close, daily_returns, cumulative_returns, monthly_returns
+from instrument import traced
+
+@traced()
+def load_clean_data(filepath='cleaned_master_stock_data.csv', columns=None, tickers=None, start=None, end=None):
+    # Reads the partitioned columnar store when comb_load.py/ingest.py wrote one
+    # (only the requested columns/partitions), else parses the master CSV
+    return load_master(columns, tickers, start, end, csv_path=filepath)
+
+@traced()
 def compute_yearly_returns(df):
-    results = []
-    for ticker, group in df.groupby('ticker'):
-        group = group.sort_values('date')
-        first = group.iloc[0]['close']
-        last = group.iloc[-1]['close']
-        y_return = (last - first) / first * 100
-        results.append({'ticker': ticker, 'yearly_return': y_return, 'first_close': first, 'last_close': last})
-    return pd.DataFrame(results)
+    tickers, first, last, _ = first_last_close(df)
+    y_return = (last - first) / first * 100
+    return pd.DataFrame({'ticker': tickers, 'yearly_return': y_return, 'first_close': first, 'last_close': last})
 
 def get_top_bottom_stocks(returns_df, n=10):
     top = returns_df.sort_values('yearly_return', ascending=False).head(n)
     bottom = returns_df.sort_values('yearly_return').head(n)
     return top, bottom
 
+@traced()
 def market_summary(df, returns_df):
     n_green = (returns_df['yearly_return'] > 0).sum()
     n_red   = (returns_df['yearly_return'] <= 0).sum()
@@ -33,9 +35,10 @@ def market_summary(df, returns_df):
     avg_volume = df['volume'].mean()
     return {'n_green': n_green, 'n_red': n_red, 'avg_price': avg_price, 'avg_volume': avg_volume}
 
+@traced()
 def compute_volatility(df):
-    df['daily_return'] = df.groupby('ticker')['close'].pct_change()
-    vol_df = df.groupby('ticker')['daily_return'].std().reset_index()
+    # df is left untouched: the daily returns are a standalone series
+    vol_df = daily_returns(df).groupby(df['ticker'], observed=True).std().reset_index()
     vol_df.columns = ['ticker', 'volatility']
     return vol_df.sort_values('volatility', ascending=False)
 
@@ -50,11 +53,15 @@ def plot_volatility(vol_df, n=10):
     plt.tight_layout()
     plt.show()
 
+@traced()
 def compute_cumulative_return(df):
-    df = df.copy()
-    df['daily_return'] = df.groupby('ticker')['close'].pct_change().fillna(0)
-    df['cumulative_return'] = df.groupby('ticker')['daily_return'].apply(lambda x: (1 + x).cumprod() - 1)
-    return df
+    # (ticker, date, daily_return, cumulative_return) over df's own ticker and
+    # date columns, without copying the OHLCV frame. This used to return a copy
+    # of df with the two return columns added; the result keeps df's index, so
+    # df.join(result[['daily_return', 'cumulative_return']]) gives that frame
+    daily_return = daily_returns(df).fillna(0)
+    return pd.DataFrame({'ticker': df['ticker'], 'date': df['date'], 'daily_return': daily_return,
+                         'cumulative_return': cumulative_returns(df, daily_return)}, copy=False)
 
 def plot_cumulative_return(df, top_tickers):
     plt.figure(figsize=(12,8))
@@ -68,6 +75,7 @@ def plot_cumulative_return(df, top_tickers):
     plt.tight_layout()
     plt.show()
 
+@traced()
 def sector_performance(returns_df, sector_map_path='sector_map.csv'):
     sector_map = pd.read_csv(sector_map_path)
     merged = returns_df.merge(sector_map, on='ticker')
@@ -84,10 +92,26 @@ def plot_sector_performance(sector_perf):
     plt.tight_layout()
     plt.show()
 
-def stock_price_correlation(df):
-    pivot = df.pivot(index='date', columns='ticker', values='close')
+@traced()
+def stock_price_correlation(df, panel=None):
+    # With a memory-mapped panel, the close "pivot" is a view over the tickers
+    # and dates of df instead of a freshly built pivot table
+    if panel is not None:
+        pivot = panel.frame('close', tickers=df['ticker'].unique(), start=df['date'].min(), end=df['date'].max())
+    else:
+        pivot = df.pivot(index='date', columns='ticker', values='close')
     return pivot.corr()
 
+@traced()
+def top_correlated_pairs(df, k=5, n_pairs=20, panel=None):
+    # Large-universe mode: k most/least correlated peers per ticker plus the
+    # global top pairs, computed blockwise without the full N x N matrix
+    if panel is not None:
+        pivot = panel.frame('close', tickers=df['ticker'].unique(), start=df['date'].min(), end=df['date'].max())
+    else:
+        pivot = df.pivot(index='date', columns='ticker', values='close')
+    return top_correlated(pivot, k=k, n_pairs=n_pairs)
+
 def plot_correlation_heatmap(corr_matrix):
     plt.figure(figsize=(12,10))
     sns.heatmap(corr_matrix, cmap='coolwarm')
@@ -95,21 +119,23 @@ def plot_correlation_heatmap(corr_matrix):
     plt.tight_layout()
     plt.show()
 
-def monthly_gainers_losers(df):
-    df['month'] = df['date'].dt.to_period('M')
-    monthly = df.groupby(['ticker', 'month']).agg({'close': ['first', 'last']})
-    monthly.columns = ['first_close', 'last_close']
-    monthly = monthly.reset_index()
-    monthly['monthly_return'] = (monthly['last_close'] - monthly['first_close']) / monthly['first_close'] * 100
+@traced()
+def monthly_gainers_losers(df, n=5):
+    monthly = monthly_returns(df)
+
+    # Rank every month at once (one sort per direction, NaN last as before)
+    # and keep the first n rows of each month
+    cols = ['ticker', 'monthly_return']
+    top = (monthly.sort_values(['month', 'monthly_return'], ascending=[True, False], kind='stable')
+           .groupby('month', sort=False).head(n))
+    bottom = (monthly.sort_values(['month', 'monthly_return'], kind='stable')
+              .groupby('month', sort=False).head(n))
+    top = {m: g[cols] for m, g in top.groupby('month', sort=False)}
+    bottom = {m: g[cols] for m, g in bottom.groupby('month', sort=False)}
+
     results = {}
     for m in monthly['month'].unique():
-        this_month = monthly[monthly['month'] == m]
-        top5 = this_month.sort_values('monthly_return', ascending=False).head(5)
-        bottom5 = this_month.sort_values('monthly_return').head(5)
-        results[str(m)] = {
-            'top5': top5[['ticker', 'monthly_return']],
-            'bottom5': bottom5[['ticker', 'monthly_return']]
-        }
+        results[str(m)] = {'top5': top[m], 'bottom5': bottom[m]}
     return results
 
 # ------------------ MAIN ------------------------
@@ -141,9 +167,15 @@ if __name__ == '__main__':
     print("\nSector-wise Performance:\n", sector_perf)
     plot_sector_performance(sector_perf)
 
-    # 7. Correlation Matrix
-    corr_matrix = stock_price_correlation(full_df)
-    plot_correlation_heatmap(corr_matrix)
+    # 7. Correlation Matrix (top-k peer lists for large universes)
+    if full_df['ticker'].nunique() > LARGE_UNIVERSE:
+        top_corr = top_correlated_pairs(full_df, panel=open_panel())
+        print("\nMost Correlated Pairs:\n", top_corr['pairs'])
+        print("\nMost Correlated Peers:\n", top_corr['most'])
+        print("\nLeast Correlated Peers:\n", top_corr['least'])
+    else:
+        corr_matrix = stock_price_correlation(full_df, open_panel())
+        plot_correlation_heatmap(corr_matrix)
 
     # 8. Monthly Gainers/Losers
     month_stats = monthly_gainers_losers(full_df)
@@ -1,67 +1,119 @@
+import time
 import streamlit as st
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
 
+from store import master_version
+from dataset import CompactDataset
+from panel import PANEL_DIR, PricePanel, panel_version
+from dashboard_metrics import (PrefixIndex, close_prices, correlation_matrix,
+                               monthly_gainers_losers, sector_performance)
+from dashboard_cache import LRUCache, filter_signature, render_png
+from correlation import LARGE_UNIVERSE, top_correlated
+from instrument import span, start_collecting, stop_collecting
+
 st.set_page_config(page_title="Nifty 50 Stock Dashboard", layout="wide")
 
+METRIC_CACHE_SIZE = 16   # filter signatures whose derived metrics are kept
+CHART_CACHE_SIZE = 64    # rendered PNGs, keyed by (chart, filter signature)
+CORR_CACHE_SIZE = 8      # full-universe correlation matrices, keyed by data version and date window
+DEBUG_PANEL = False      # default of the per-rerun timing breakdown (Advanced Options)
+
+def data_version():
+    # (master, panel) versions, resolved once per rerun: the dataset, index,
+    # panel and every cache entry below belong to one version, so a rebuild
+    # mid-session reloads them instead of mixing old and new data
+    return master_version(), panel_version()
+
+@st.cache_resource(max_entries=2)
+def load_dataset(version):
+    # Compact typed master (dataset.py), loaded once per server process and
+    # master version and shared by every session: ticker/date selections are
+    # offset slices into it
+    return CompactDataset.load()
+
 @st.cache_data
 def load_data():
-    df = pd.read_csv('cleaned_master_stock_data.csv', parse_dates=['date'])
-    for col in ['open', 'high', 'low', 'close', 'volume']:
-        df[col] = pd.to_numeric(df[col], errors='coerce')
-    df = df.dropna(subset=['date', 'close']).sort_values(['ticker', 'date'])
     sector_map = pd.read_csv('Sector_data - Sheet1.csv')
     sector_map['ticker'] = sector_map['Symbol'].apply(lambda x: x.split(': ')[-1])
     sector_map = sector_map[['ticker', 'sector']]
-    return df, sector_map
-
-def yearly_returns(df):
-    results = []
-    for ticker, group in df.groupby('ticker'):
-        group = group.sort_values('date')
-        if len(group) < 2:
-            continue
-        first = group.iloc[0]['close']
-        last = group.iloc[-1]['close']
-        y_return = (last - first) / first * 100
-        results.append({'ticker': ticker, 'yearly_return': y_return})
-    return pd.DataFrame(results)
-
-def volatility(df):
-    df = df.copy()
-    df['daily_return'] = df.groupby('ticker')['close'].pct_change()
-    vol_df = df.groupby('ticker')['daily_return'].std().reset_index()
-    vol_df.columns = ['ticker', 'volatility']
-    return vol_df.sort_values('volatility', ascending=False)
-
-def cumulative_return(df):
-    df = df.copy()
-    df['daily_return'] = df.groupby('ticker')['close'].pct_change().fillna(0)
-    df['cumulative_return'] = df.groupby('ticker')['daily_return'].transform(lambda x: (1 + x).cumprod() - 1)
-    return df
-
-def sector_performance(returns_df, sector_map):
-    merged = returns_df.merge(sector_map, on='ticker')
-    sector_perf = merged.groupby('sector')['yearly_return'].mean().reset_index()
-    return sector_perf.sort_values('yearly_return', ascending=False)
-
-def correlation_matrix(df):
-    close_pivot = df.pivot(index='date', columns='ticker', values='close')
-    return close_pivot.corr()
-
-def monthly_gainers_losers(df):
-    df = df.copy()
-    df['month'] = df['date'].dt.to_period('M')
-    monthly = df.groupby(['ticker', 'month']).agg({'close': ['first', 'last']})
-    monthly.columns = ['first_close', 'last_close']
-    monthly = monthly.reset_index()
-    monthly['monthly_return'] = (monthly['last_close'] - monthly['first_close']) / monthly['first_close'] * 100
-    return monthly
+    return sector_map
+
+@st.cache_resource(max_entries=2)
+def open_panel_version(version):
+    # Memory-mapped once per server process and panel version; every session
+    # reads the same pages. Maps the version it is cached under, not whatever
+    # CURRENT names by now. None without a panel, or when later builds already
+    # removed that version (the page then pivots the long frame).
+    if version is None:
+        return None
+    try:
+        return PricePanel(PANEL_DIR, version)
+    except FileNotFoundError:
+        return None
+
+def load_panel():
+    # The panel of this rerun's version: a rebuilt panel gets a fresh mapping,
+    # and the old one is dropped once it falls out of the cache
+    return open_panel_version(version[1])
+
+@st.cache_resource(max_entries=2)
+def load_index(version):
+    # Per-ticker prefix sums over the full history, built once per server
+    # process and master version
+    with span("app.PrefixIndex"):
+        return PrefixIndex(load_dataset(version))
+
+@st.cache_resource
+def metric_cache():
+    # One bounded cache per server process, shared by all sessions
+    return LRUCache(maxsize=METRIC_CACHE_SIZE)
+
+@st.cache_resource
+def chart_cache():
+    return LRUCache(maxsize=CHART_CACHE_SIZE)
+
+def show_chart(name, draw):
+    # draw() builds the matplotlib figure; it only runs on a cache miss
+    def render():
+        with span(f"app.render.{name}"):
+            return render_png(draw())
+    png = chart_cache().get_or_compute((name, signature), render)
+    st.image(png, use_container_width=True)
+
+@st.cache_resource
+def corr_cache():
+    return LRUCache(maxsize=CORR_CACHE_SIZE)
+
+def window_correlation(start, end):
+    # Full-universe close correlation for one date window. A pair's Pearson value
+    # doesn't depend on which other tickers are selected, so ticker and sector
+    # changes slice this matrix; only a new date window (or data version)
+    # recomputes it.
+    def compute():
+        with span("app.window_correlation"):
+            panel = load_panel()
+            if panel is not None:
+                return panel.frame('close', start=start, end=end).corr()
+            frame = data.select(start=start, end=end, columns=['date', 'ticker', 'close'])
+            return frame.pivot(index='date', columns='ticker', values='close').corr()
+    return corr_cache().get_or_compute((version, start.isoformat(), end.isoformat()), compute)
+
+# The debug panel lists every span of this rerun; whatever was served from a
+# cache simply doesn't show up
+debug = st.session_state.get("debug_panel", DEBUG_PANEL)
+rerun_start = time.perf_counter()
+if debug:
+    start_collecting()
+else:
+    stop_collecting()
 
 # ----------- LOAD DATA -----------
-df, sector_map = load_data()
+version = data_version()
+data = load_dataset(version[0])
+sector_map = load_data()
 
 # ----------- SIDEBAR ------------
 with st.sidebar:
@@ -72,7 +124,7 @@ with st.sidebar:
     if selected_sector != "All":
         sector_tickers = sector_map[sector_map['sector'] == selected_sector]['ticker'].unique().tolist()
     else:
-        sector_tickers = sorted(df['ticker'].unique())
+        sector_tickers = list(data.tickers)
 
     selected_tickers = st.multiselect(
         "Stocks (tickers)", 
@@ -81,8 +133,7 @@ with st.sidebar:
         help="You can select one or more stocks. List auto-filters if sector is selected."
     )
 
-    date_min = df['date'].min()
-    date_max = df['date'].max()
+    date_min, date_max = data.date_range()
     date_range = st.date_input(
         "Date Range", 
         [date_min, date_max], 
@@ -90,6 +141,10 @@ with st.sidebar:
     )
 
     with st.expander("⚙️ Advanced Options", expanded=False):
+        cache_stats = metric_cache().stats()
+        st.caption(f"Metric cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses, "
+                   f"{cache_stats['size']}/{cache_stats['maxsize']} filters cached")
+        st.checkbox("Show timing breakdown", value=DEBUG_PANEL, key="debug_panel")
         st.markdown("**Reset all filters** below:")
         if st.button("🔄 Reset Filters"):
             st.session_state['Sector'] = "All"
@@ -102,25 +157,74 @@ with st.sidebar:
         )
 
 # ----------- DATA FILTERING -----------
-mask = (
-    df['ticker'].isin(selected_tickers)
-    & df['date'].between(pd.to_datetime(date_range[0]), pd.to_datetime(date_range[1]))
-)
-filtered_df = df[mask]
-filtered_sector_map = sector_map[sector_map['ticker'].isin(filtered_df['ticker'].unique())]
-
-if filtered_df.empty:
+start_date, end_date = pd.to_datetime(date_range[0]), pd.to_datetime(date_range[1])
+index = load_index(version[0])
+with span("app.window") as s:
+    window = index.window(selected_tickers, start_date, end_date)
+    s.rows = int((window['hi'] - window['lo']).sum())
+
+if window.empty:
     st.error("❗ No data matches your filters. Try expanding your date range or choosing more stocks.")
     st.stop()
 
 # ------------- RECOMPUTE ALL METRICS AND PLOTS WITH FILTERED DATA ---------------
 
-returns_df = yearly_returns(filtered_df)
-vol_df = volatility(filtered_df)
-cum_df = cumulative_return(filtered_df)
-sector_perf = sector_performance(returns_df, filtered_sector_map)
-corr = correlation_matrix(filtered_df)
-monthly = monthly_gainers_losers(filtered_df)
+def compute_metrics():
+    # The window's offsets select the rows: no mask over the full frame, and
+    # only the columns the row-based metrics below read
+    with span("app.filter") as s:
+        filtered_df = data.frame(window, columns=['date', 'ticker', 'close'])
+        s.rows = len(filtered_df)
+    filtered_sector_map = sector_map[sector_map['ticker'].isin(window['ticker'])]
+
+    # Window metrics come from the prefix-sum index: O(tickers), not O(rows)
+    returns_df = index.yearly_returns(window)
+    avg_price, avg_vol = index.averages(window)
+    top10 = returns_df.sort_values('yearly_return', ascending=False).head(10)
+    monthly = monthly_gainers_losers(filtered_df)
+    monthly['month_str'] = monthly['month'].astype(str)
+
+    # Large selections get top-k peer lists instead of a dense matrix/heatmap.
+    # Otherwise slice the cached full-universe matrix for this date window (when
+    # the universe itself is small enough to keep a dense matrix around).
+    selected = list(window['ticker'])
+    corr, top_corr = None, None
+    with span("app.correlation", tickers=len(selected)):
+        if len(selected) > LARGE_UNIVERSE:
+            top_corr = top_correlated(close_prices(filtered_df, load_panel()))
+        elif len(index.tickers) <= LARGE_UNIVERSE:
+            # reindex: a ticker the panel doesn't have yet gets NaN, not a KeyError
+            corr = window_correlation(start_date, end_date).reindex(index=selected, columns=selected)
+        else:
+            corr = correlation_matrix(filtered_df, load_panel())
+    return {
+        'returns_df': returns_df,
+        'top10': top10,
+        'bottom10': returns_df.sort_values('yearly_return').head(10),
+        'vol_df': index.volatility(window),
+        'avg_price': avg_price,
+        'avg_vol': avg_vol,
+        'cum_df': index.cumulative_return(window, top10['ticker'].values),
+        'sector_perf': sector_performance(returns_df, filtered_sector_map),
+        'corr': corr,
+        'top_corr': top_corr,
+        'monthly': monthly,
+    }
+
+# Reruns that don't change the filters (e.g. picking another month) are cache hits.
+# Cached frames are shared between sessions, so the page below must not mutate them.
+# Keys carry the data version: entries of a replaced master or panel are never served.
+signature = (version, filter_signature(selected_tickers, start_date, end_date, selected_sector))
+with span("app.metrics"):
+    metrics = metric_cache().get_or_compute(signature, compute_metrics)
+returns_df = metrics['returns_df']
+vol_df = metrics['vol_df']
+avg_price, avg_vol = metrics['avg_price'], metrics['avg_vol']
+cum_df = metrics['cum_df']
+sector_perf = metrics['sector_perf']
+corr = metrics['corr']
+top_corr = metrics['top_corr']
+monthly = metrics['monthly']
 
 st.title("📈 Nifty 50 Stock Performance Dashboard")
 st.markdown("Use the sidebar to filter by sector, stocks, or date range. All analytics update in real-time.")
@@ -131,8 +235,6 @@ st.divider()
 st.subheader("Market Summary")
 n_green = (returns_df['yearly_return'] > 0).sum()
 n_red = (returns_df['yearly_return'] <= 0).sum()
-avg_price = filtered_df['close'].mean()
-avg_vol = filtered_df['volume'].mean()
 col1, col2, col3, col4 = st.columns(4)
 col1.metric("Green Stocks", n_green)
 col2.metric("Red Stocks", n_red)
@@ -143,8 +245,7 @@ st.divider()
 
 # ----------- TOP/BOTTOM 10 TABLES -----------
 st.subheader("Top 10 Green and Red Stocks (Yearly Return)")
-top10 = returns_df.sort_values('yearly_return', ascending=False).head(10)
-bottom10 = returns_df.sort_values('yearly_return').head(10)
+top10, bottom10 = metrics['top10'], metrics['bottom10']
 col1, col2 = st.columns(2)
 col1.write("**Top 10 Green**")
 col1.dataframe(top10.rename(columns={"yearly_return": "Yearly Return (%)"}), use_container_width=True, hide_index=True)
@@ -155,41 +256,47 @@ st.divider()
 
 # ----------- VOLATILITY CHART -----------
 st.subheader("Top 10 Most Volatile Stocks")
-fig, ax = plt.subplots(figsize=(9,4))
-top_vol = vol_df.head(10)
-sns.barplot(data=top_vol, x="ticker", y="volatility", ax=ax, palette="crest")
-ax.set_ylabel("Volatility (Std Dev)")
-ax.set_xlabel("Ticker")
-ax.set_title("Top 10 Most Volatile Stocks")
-ax.tick_params(axis='x', rotation=45)
-st.pyplot(fig)
+def draw_volatility():
+    fig, ax = plt.subplots(figsize=(9,4))
+    top_vol = vol_df.head(10)
+    sns.barplot(data=top_vol, x="ticker", y="volatility", ax=ax, palette="crest")
+    ax.set_ylabel("Volatility (Std Dev)")
+    ax.set_xlabel("Ticker")
+    ax.set_title("Top 10 Most Volatile Stocks")
+    ax.tick_params(axis='x', rotation=45)
+    return fig
+show_chart("volatility", draw_volatility)
 st.divider()
 
 # ----------- CUMULATIVE RETURN CHART -----------
 st.subheader("Cumulative Return of Top 5 Performing Stocks")
 top5_tickers = top10['ticker'].values
-fig2, ax2 = plt.subplots(figsize=(11,5))
-for ticker in top5_tickers:
-    plot_data = cum_df[cum_df['ticker']==ticker]
-    ax2.plot(plot_data['date'], plot_data['cumulative_return'], label=ticker)
-ax2.legend()
-ax2.set_ylabel("Cumulative Return")
-ax2.set_xlabel("Date")
-fig2.tight_layout()
-st.pyplot(fig2)
+def draw_cumulative_return():
+    fig2, ax2 = plt.subplots(figsize=(11,5))
+    for ticker in top5_tickers:
+        plot_data = cum_df[cum_df['ticker']==ticker]
+        ax2.plot(plot_data['date'], plot_data['cumulative_return'], label=ticker)
+    ax2.legend()
+    ax2.set_ylabel("Cumulative Return")
+    ax2.set_xlabel("Date")
+    fig2.tight_layout()
+    return fig2
+show_chart("cumulative_return", draw_cumulative_return)
 st.divider()
 
 # ----------- SECTOR PERFORMANCE BAR CHART -----------
 st.subheader("Average Yearly Return by Sector")
 if not sector_perf.empty:
-    fig3, ax3 = plt.subplots(figsize=(10,5))
-    sns.barplot(data=sector_perf, x="sector", y="yearly_return", ax=ax3, palette="tab20")
-    ax3.set_ylabel("Avg Yearly Return (%)")
-    ax3.set_xlabel("Sector")
-    ax3.set_title("Average Yearly Return by Sector")
-    ax3.tick_params(axis='x', rotation=45)
-    fig3.tight_layout()
-    st.pyplot(fig3)
+    def draw_sector_performance():
+        fig3, ax3 = plt.subplots(figsize=(10,5))
+        sns.barplot(data=sector_perf, x="sector", y="yearly_return", ax=ax3, palette="tab20")
+        ax3.set_ylabel("Avg Yearly Return (%)")
+        ax3.set_xlabel("Sector")
+        ax3.set_title("Average Yearly Return by Sector")
+        ax3.tick_params(axis='x', rotation=45)
+        fig3.tight_layout()
+        return fig3
+    show_chart("sector_performance", draw_sector_performance)
 else:
     st.info("No sector data to display for this filter.")
 
@@ -197,11 +304,23 @@ st.divider()
 
 # ----------- CORRELATION HEATMAP -----------
 st.subheader("Stock Price Correlation Heatmap")
-if corr.shape[0] > 1:
-    fig4, ax4 = plt.subplots(figsize=(12,8))
-    sns.heatmap(corr, cmap='coolwarm', ax=ax4)
-    ax4.set_title("Stock Price Correlation Heatmap")
-    st.pyplot(fig4)
+if top_corr is not None:
+    st.caption(f"More than {LARGE_UNIVERSE} stocks selected: showing the most and least correlated peers instead of the full heatmap.")
+    st.write("**Most Correlated Pairs**")
+    st.dataframe(top_corr['pairs'], use_container_width=True, hide_index=True)
+    col5, col6 = st.columns(2)
+    col5.write("**Most Correlated Peers per Stock**")
+    col5.dataframe(top_corr['most'], use_container_width=True, hide_index=True)
+    col6.write("**Least Correlated Peers per Stock**")
+    col6.dataframe(top_corr['least'], use_container_width=True, hide_index=True)
+elif corr.shape[0] > 1:
+    # The heatmap is the slowest figure on the page; it is drawn once per filter
+    def draw_correlation_heatmap():
+        fig4, ax4 = plt.subplots(figsize=(12,8))
+        sns.heatmap(corr, cmap='coolwarm', ax=ax4)
+        ax4.set_title("Stock Price Correlation Heatmap")
+        return fig4
+    show_chart("correlation_heatmap", draw_correlation_heatmap)
 else:
     st.info("Need at least two stocks for correlation heatmap.")
 
@@ -209,7 +328,6 @@ st.divider()
 
 # ----------- MONTHLY GAINERS/LOSERS -----------
 st.subheader("Top 5 Gainers & Losers Each Month")
-monthly['month_str'] = monthly['month'].astype(str)
 if not monthly['month_str'].empty:
     selected_month = st.selectbox("Select Month", sorted(monthly['month_str'].unique()), key="month_select")
     month_data = monthly[monthly['month_str']==selected_month]
@@ -223,4 +341,17 @@ if not monthly['month_str'].empty:
 else:
     st.info("No monthly data to display for this filter.")
 
+# ----------- DEBUG PANEL -----------
+if debug:
+    records = stop_collecting()
+    st.divider()
+    st.subheader("🐞 Timing Breakdown (this rerun)")
+    st.caption(f"Rerun took {time.perf_counter() - rerun_start:.3f}s. Steps served from a cache are not listed; "
+               "peak memory needs STOCKS_TRACE=memory.")
+    if records:
+        spans = pd.DataFrame(records).sort_values('ts')
+        spans['span'] = ['· ' * depth + name for depth, name in zip(spans['depth'], spans['span'])]
+        columns = [c for c in ['span', 'seconds', 'rows', 'peak_mb'] if c in spans]
+        st.dataframe(spans[columns], use_container_width=True, hide_index=True)
+
 st.caption("Powered by Streamlit & Python • Dashboard auto-updates as you change filters")
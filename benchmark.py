@@ -0,0 +1,348 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tracemalloc
+from contextlib import redirect_stdout
+import numpy as np
+import pandas as pd
+
+# Benchmark suite: writes a deterministic synthetic market (data/<month>/*.yaml
+# plus the master CSV and sector sheets) at any tickers x days scale, runs every
+# stage of the project on it and records wall time and peak allocation per
+# stage. Results are compared with benchmark_baseline.json (one entry per
+# scale); anything slower or bigger than TOLERANCE above the baseline is a
+# regression and makes the run exit with status 1.
+#
+#   python benchmark.py --tickers 50 --days 250                  (compare)
+#   python benchmark.py --tickers 50 --days 250 --save-baseline  (record)
+#   python benchmark.py --tickers 2000 --days 6000 --no-yaml --skip xl_combine
+#
+# Wall time is the best of REPEAT runs with tracing off. Peak memory comes from
+# one extra run under tracemalloc, so it covers Python, numpy and pandas
+# allocations of this process, not ingest's parser processes or Arrow's pool.
+
+BENCH_DIR = "bench_data"
+BASELINE_PATH = "benchmark_baseline.json"
+META_FILE = "bench_meta.json"
+REPEAT = 3
+TOLERANCE = 0.25         # allowed slowdown / growth over the baseline
+MIN_SECONDS = 0.05       # timing differences below this are noise
+MIN_MB = 1.0             # memory differences below this are noise
+# app.rerun (a full-universe dashboard rerun) may allocate at most this many
+# times the size of the CompactDataset it reads; checked on every run, with or
+# without a baseline
+RERUN_PEAK_RATIO = 3.0
+START_DATE = "2000-01-03"
+SECTORS = ["AUTOMOBILE", "BANKING", "CEMENT", "ENERGY", "FINANCE", "FMCG",
+           "INSURANCE", "IT", "METALS", "PHARMACEUTICALS", "RETAILING", "TELECOM"]
+
+YAML_ENTRY = ("- Ticker: {ticker}\n  close: {close:.2f}\n  date: '{date}'\n  high: {high:.2f}\n"
+              "  low: {low:.2f}\n  month: {month}\n  open: {open:.2f}\n  volume: {volume}\n")
+
+
+# ----------- SYNTHETIC DATA -----------
+
+def synthetic_market(n_tickers, n_days, seed=0, start=START_DATE):
+    # (tickers, business days, {field: days x tickers array}): a geometric random
+    # walk per ticker; the same arguments always give the same numbers
+    rng = np.random.default_rng(seed)
+    width = max(2, len(str(n_tickers - 1)))
+    tickers = [f"TK{i:0{width}d}" for i in range(n_tickers)]
+    dates = pd.bdate_range(start, periods=n_days) + pd.Timedelta(hours=5, minutes=30)
+
+    growth = np.cumprod(1 + rng.normal(0.0003, 0.02, (n_days, n_tickers)), axis=0)
+    close = (rng.uniform(100, 3000, n_tickers) * growth).round(2)
+    open_ = (close * (1 + rng.normal(0, 0.005, close.shape))).round(2)
+    high = (np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.01, close.shape)))).round(2)
+    low = (np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.01, close.shape)))).round(2)
+    volume = rng.integers(10_000, 5_000_000, close.shape)
+    return tickers, dates, {'open': open_, 'high': high, 'low': low, 'close': close, 'volume': volume}
+
+
+def write_yaml_tree(tickers, dates, fields, input_dir):
+    # One file per trading day in its month folder, laid out like the source data
+    for i, date in enumerate(dates):
+        month = date.strftime("%Y-%m")
+        os.makedirs(os.path.join(input_dir, month), exist_ok=True)
+        stamp = date.strftime("%Y-%m-%d %H:%M:%S")
+        entries = [YAML_ENTRY.format(ticker=t, date=stamp, month=month, open=fields['open'][i, j],
+                                     high=fields['high'][i, j], low=fields['low'][i, j],
+                                     close=fields['close'][i, j], volume=fields['volume'][i, j])
+                   for j, t in enumerate(tickers)]
+        with open(os.path.join(input_dir, month, date.strftime("%Y-%m-%d_%H-%M-%S") + ".yaml"), "w") as f:
+            f.write("".join(entries))
+
+
+def generate(out_dir=BENCH_DIR, n_tickers=50, n_days=250, seed=0, yaml_tree=True):
+    # Writes data/ (optional), the cleaned master CSV and both sector sheets into
+    # out_dir; reuses them when the scale and seed match the last generation
+    import ingest
+    from features import SECTOR_CSV
+
+    meta = {"tickers": n_tickers, "days": n_days, "seed": seed, "yaml": yaml_tree}
+    meta_path = os.path.join(out_dir, META_FILE)
+    if os.path.exists(meta_path):
+        with open(meta_path) as f:
+            if json.load(f) == meta:
+                return False
+        shutil.rmtree(out_dir)
+    os.makedirs(out_dir, exist_ok=True)
+
+    tickers, dates, fields = synthetic_market(n_tickers, n_days, seed)
+    if yaml_tree:
+        write_yaml_tree(tickers, dates, fields, os.path.join(out_dir, ingest.INPUT_DIR))
+
+    # Long (ticker, date)-sorted master, as comb_load.py / ingest.py save it
+    master = pd.DataFrame({'date': np.tile(dates.to_numpy(), n_tickers)})
+    for name, values in fields.items():
+        master[name] = values.T.ravel()
+    master['ticker'] = np.repeat(tickers, n_days)
+    master.to_csv(os.path.join(out_dir, ingest.MASTER_CSV), index=False)
+
+    sectors = [SECTORS[i % len(SECTORS)] for i in range(n_tickers)]
+    pd.DataFrame({'COMPANY': [f"Company {t}" for t in tickers], 'sector': sectors,
+                  'Symbol': [f"{t}: {t}" for t in tickers]}).to_csv(os.path.join(out_dir, SECTOR_CSV), index=False)
+    pd.DataFrame({'ticker': tickers, 'sector': sectors}).to_csv(os.path.join(out_dir, "sector_map.csv"), index=False)
+
+    with open(meta_path, "w") as f:
+        json.dump(meta, f)
+    return True
+
+
+# ----------- MEASUREMENT -----------
+
+def measure(func, repeat=REPEAT, setup=None):
+    # (result, best wall time in seconds, peak traced allocation in bytes)
+    best, result = None, None
+    for _ in range(max(1, repeat)):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    if setup:
+        setup()
+    tracemalloc.start()
+    try:
+        with open(os.devnull, "w") as quiet, redirect_stdout(quiet):
+            func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, best, peak
+
+
+def remove_path(path):
+    def setup():
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        elif os.path.exists(path):
+            os.remove(path)
+    return setup
+
+
+def benchmark_stages(ctx):
+    # (name, func, setup) in run order. Each func reads the outputs of earlier
+    # stages from ctx, where the runner stores its result under the stage name.
+    import ingest
+    import csv_yearwise
+    import comb_load
+    import analysis
+    import dashboard_metrics
+    import powerBI_data
+    import xl_combine
+    from store import pa, read_master_csv
+    from panel import open_panel
+    from correlation import CORR_STATE, LARGE_UNIVERSE, top_correlated
+    from features import SECTOR_CSV, load_sector_map, build_features
+    from dataset import CompactDataset
+
+    def df():
+        return ctx['load_clean_data']
+
+    def returns():
+        return ctx['analysis.compute_yearly_returns']
+
+    def large():
+        return df()['ticker'].nunique() > LARGE_UNIVERSE
+
+    def selection():
+        # A third of the tickers over the middle half of the history
+        first, last = df()['date'].min(), df()['date'].max()
+        tickers = sorted(df()['ticker'].unique())[::3]
+        return tickers, first + (last - first) / 4, last - (last - first) / 4
+
+    def mask_filter():
+        tickers, start, end = selection()
+        frame = df()
+        return frame[frame['ticker'].isin(tickers) & frame['date'].between(start, end)]
+
+    def full_rerun():
+        # app.py's compute_metrics on a cache miss with every ticker and the
+        # whole history selected: the worst case for one Streamlit rerun
+        data, index = ctx['app.CompactDataset'], ctx['app.PrefixIndex']
+        window = index.window(data.tickers, *data.date_range())
+        filtered_df = data.frame(window, columns=['date', 'ticker', 'close'])
+        returns_df = index.yearly_returns(window)
+        top10 = returns_df.sort_values('yearly_return', ascending=False).head(10)
+        if len(window) > LARGE_UNIVERSE:
+            corr = top_correlated(dashboard_metrics.close_prices(filtered_df, open_panel()))
+        else:
+            corr = dashboard_metrics.correlation_matrix(filtered_df, open_panel())
+        return (returns_df, index.averages(window), index.volatility(window),
+                index.cumulative_return(window, top10['ticker'].values),
+                dashboard_metrics.sector_performance(returns_df, ctx['sector_map']),
+                dashboard_metrics.monthly_gainers_losers(filtered_df), corr)
+
+    stages = []
+    if os.path.isdir(ingest.INPUT_DIR):
+        stages += [
+            ("csv_yearwise", csv_yearwise.main, None),
+            ("comb_load", lambda: comb_load.clean_master(comb_load.load_ticker_csvs()), None),
+            ("ingest.save_master", lambda: ingest.save_master(ctx['comb_load']), None),
+        ]
+    else:
+        stages.append(("ingest.save_master", lambda: ingest.save_master(read_master_csv()), None))
+    stages += [
+        ("load_clean_data", analysis.load_clean_data, None),
+        ("analysis.compute_yearly_returns", lambda: analysis.compute_yearly_returns(df()), None),
+        ("analysis.get_top_bottom_stocks", lambda: analysis.get_top_bottom_stocks(returns()), None),
+        ("analysis.market_summary", lambda: analysis.market_summary(df(), returns()), None),
+        ("analysis.compute_volatility", lambda: analysis.compute_volatility(df()), None),
+        ("analysis.compute_cumulative_return", lambda: analysis.compute_cumulative_return(df()), None),
+        ("analysis.sector_performance", lambda: analysis.sector_performance(returns(), "sector_map.csv"), None),
+        ("analysis.stock_price_correlation",
+         lambda: analysis.top_correlated_pairs(df(), panel=open_panel()) if large()
+         else analysis.stock_price_correlation(df(), open_panel()), None),
+        ("analysis.monthly_gainers_losers", lambda: analysis.monthly_gainers_losers(df()), None),
+        ("sector_map", lambda: load_sector_map(SECTOR_CSV), None),
+        ("app.yearly_returns", lambda: dashboard_metrics.yearly_returns(df()), None),
+        ("app.volatility", lambda: dashboard_metrics.volatility(df()), None),
+        ("app.cumulative_return", lambda: dashboard_metrics.cumulative_return(df()), None),
+        ("app.sector_performance",
+         lambda: dashboard_metrics.sector_performance(ctx['app.yearly_returns'], ctx['sector_map']), None),
+        ("app.correlation_matrix",
+         lambda: top_correlated(dashboard_metrics.close_prices(df(), open_panel())) if large()
+         else dashboard_metrics.correlation_matrix(df(), open_panel()), None),
+        ("app.monthly_gainers_losers", lambda: dashboard_metrics.monthly_gainers_losers(df()), None),
+        ("app.CompactDataset", lambda: CompactDataset.from_frame(df()), None),
+        ("app.mask_filter", mask_filter, None),
+        ("app.select", lambda: ctx['app.CompactDataset'].select(*selection()), None),
+        ("app.PrefixIndex", lambda: dashboard_metrics.PrefixIndex(ctx['app.CompactDataset']), None),
+        ("app.rerun", full_rerun, None),
+        # A full rebuild each time: the running correlation state would turn
+        # every repeat after the first into a no-op
+        ("build_features", lambda: build_features(df(), ctx['sector_map']), remove_path(CORR_STATE)),
+        ("powerBI_data.flat", lambda: powerBI_data.export_flat(ctx['build_features']), None),
+        ("xl_combine", lambda: xl_combine.export(ctx['build_features']), remove_path(xl_combine.excel_out)),
+    ]
+    if pa is not None:
+        stages.append(("powerBI_data.star", lambda: powerBI_data.export_star(ctx['build_features']),
+                       remove_path(powerBI_data.star_dir)))
+    return stages
+
+
+def run(repeat=REPEAT, only=None, skip=()):
+    # Runs in the current directory (the generated data); returns
+    # ({stage: {seconds, peak_mb}}, {stage: output})
+    ctx, results = {}, {}
+    for name, func, setup in benchmark_stages(ctx):
+        if (only and name not in only) or name in skip:
+            continue
+        ctx[name], seconds, peak = measure(func, repeat, setup)
+        results[name] = {"seconds": round(seconds, 4), "peak_mb": round(peak / 2**20, 2)}
+        print(f"   {name:<36} {seconds:8.3f}s {peak / 2**20:9.1f} MB")
+    return results, ctx
+
+
+def rerun_peak_limit(ctx, ratio=RERUN_PEAK_RATIO):
+    # MB a full-universe rerun may allocate, or None when it wasn't measured
+    if 'app.rerun' not in ctx or 'app.CompactDataset' not in ctx:
+        return None
+    return max(ctx['app.CompactDataset'].nbytes() / 2**20 * ratio, MIN_MB)
+
+
+# ----------- BASELINE -----------
+
+def load_baseline(path=BASELINE_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(baseline, path=BASELINE_PATH):
+    with open(path + ".tmp", "w") as f:
+        json.dump(baseline, f, indent=1, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    # Regressions as (stage, metric, baseline value, current value)
+    regressions = []
+    for name, current in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        for metric, floor in (("seconds", MIN_SECONDS), ("peak_mb", MIN_MB)):
+            if current[metric] > base[metric] * (1 + tolerance) and current[metric] - base[metric] > floor:
+                regressions.append((name, metric, base[metric], current[metric]))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Time every stage on a synthetic market")
+    parser.add_argument("--tickers", type=int, default=50)
+    parser.add_argument("--days", type=int, default=250, help="business days of history")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--dir", default=BENCH_DIR, help="where the synthetic data is written")
+    parser.add_argument("--no-yaml", action="store_true", help="only write the master CSV (skips the YAML stages)")
+    parser.add_argument("--generate-only", action="store_true")
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    parser.add_argument("--only", nargs="*", default=None, help="stage names to run")
+    parser.add_argument("--skip", nargs="*", default=(), help="stage names to leave out")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    args = parser.parse_args()
+
+    baseline_path = os.path.abspath(args.baseline)
+    scale = f"{args.tickers}x{args.days}" + ("" if args.no_yaml else "+yaml")
+    start = time.perf_counter()
+    created = generate(args.dir, args.tickers, args.days, args.seed, yaml_tree=not args.no_yaml)
+    print(f"{'✅ Generated' if created else '♻️ Reusing'} {scale} synthetic market in {args.dir}/ "
+          f"({time.perf_counter() - start:.1f}s)")
+    if args.generate_only:
+        sys.exit(0)
+
+    # The project's scripts use paths relative to the working directory
+    os.chdir(args.dir)
+    results, ctx = run(args.repeat, args.only, args.skip)
+
+    limit = rerun_peak_limit(ctx)
+    if limit is not None:
+        peak = results['app.rerun']['peak_mb']
+        if peak > limit:
+            print(f"❌ app.rerun allocated {peak:.1f} MB, over {RERUN_PEAK_RATIO:g}x the compact dataset ({limit:.1f} MB)")
+            sys.exit(1)
+        print(f"✅ app.rerun allocated {peak:.1f} MB of {limit:.1f} MB allowed")
+
+    baseline = load_baseline(baseline_path)
+    if args.save_baseline:
+        baseline[scale] = {**baseline.get(scale, {}), **results}
+        save_baseline(baseline, baseline_path)
+        print(f"✅ Baseline for {scale} saved to {baseline_path}")
+        sys.exit(0)
+    if scale not in baseline:
+        print(f"⚠️ No baseline for {scale} yet; record one with --save-baseline")
+        sys.exit(0)
+    regressions = compare(results, baseline[scale], args.tolerance)
+    for name, metric, before, after in regressions:
+        print(f"❌ {name}: {metric} {before} -> {after} (+{(after / before - 1) * 100:.0f}%)")
+    if regressions:
+        sys.exit(1)
+    print(f"✅ No regressions against the {scale} baseline (tolerance {args.tolerance:.0%})")
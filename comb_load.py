@@ -4,42 +4,56 @@ import glob
 
 # Path to your per-ticker CSVs
 DATA_DIR = "CSV_data_full_year"
+MASTER_CSV = "cleaned_master_stock_data.csv"
+WRITE_CSV = True     # the CSV is now an optional export next to the columnar store
 
-# Step 1: Load all CSVs and add a 'ticker' column
-all_files = glob.glob(os.path.join(DATA_DIR, "*.csv"))
-dataframes = []
 
-for file in all_files:
-    df = pd.read_csv(file)
-    ticker = os.path.splitext(os.path.basename(file))[0]
-    df['ticker'] = ticker
-    dataframes.append(df)
+def load_ticker_csvs(data_dir=DATA_DIR):
+    # Step 1: Load all CSVs and add a 'ticker' column
+    all_files = glob.glob(os.path.join(data_dir, "*.csv"))
+    dataframes = []
 
-# Step 2: Concatenate into a single DataFrame
-full_df = pd.concat(dataframes, ignore_index=True)
+    for file in all_files:
+        df = pd.read_csv(file)
+        ticker = os.path.splitext(os.path.basename(file))[0]
+        df['ticker'] = ticker
+        dataframes.append(df)
 
-# Step 3: Data Cleaning
-# Convert date to datetime, and numeric columns to proper type
-full_df['date'] = pd.to_datetime(full_df['date'])
-for col in ['open', 'high', 'low', 'close', 'volume']:
-    full_df[col] = pd.to_numeric(full_df[col], errors='coerce')
+    # Step 2: Concatenate into a single DataFrame
+    return pd.concat(dataframes, ignore_index=True)
 
-# Step 4: Drop rows with missing crucial data (e.g., missing date or close)
-full_df.dropna(subset=['date', 'close'], inplace=True)
 
-# Step 5: Remove duplicates
-full_df.drop_duplicates(subset=['ticker', 'date'], inplace=True)
+def clean_master(full_df):
+    # Step 3: Data Cleaning
+    # Convert date to datetime, and numeric columns to proper type
+    full_df['date'] = pd.to_datetime(full_df['date'])
+    for col in ['open', 'high', 'low', 'close', 'volume']:
+        full_df[col] = pd.to_numeric(full_df[col], errors='coerce')
 
-# Step 6: Sort for easy downstream processing
-full_df.sort_values(['ticker', 'date'], inplace=True)
+    # Step 4: Drop rows with missing crucial data (e.g., missing date or close)
+    full_df.dropna(subset=['date', 'close'], inplace=True)
 
-# Optional: Reset index
-full_df.reset_index(drop=True, inplace=True)
+    # Step 5: Remove duplicates
+    full_df.drop_duplicates(subset=['ticker', 'date'], inplace=True)
 
-# Step 7: Quick Data Check
-print(full_df.info())
-print(full_df.head())
-print(full_df['ticker'].value_counts())
+    # Step 6: Sort for easy downstream processing
+    full_df.sort_values(['ticker', 'date'], inplace=True)
 
-# Optional: Save the clean master CSV
-full_df.to_csv("cleaned_master_stock_data.csv", index=False)
+    # Optional: Reset index
+    full_df.reset_index(drop=True, inplace=True)
+    return full_df
+
+
+if __name__ == '__main__':
+    full_df = clean_master(load_ticker_csvs(DATA_DIR))
+
+    # Step 7: Quick Data Check
+    print(full_df.info())
+    print(full_df.head())
+    print(full_df['ticker'].value_counts())
+
+    # Step 8: Save like a full ingest.py rebuild: the typed columnar store, the
+    # memory-mapped price panel, a reset running correlation state and the
+    # optional master CSV (imported here: ingest imports this module)
+    import ingest
+    ingest.save_master(full_df, MASTER_CSV)
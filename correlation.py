@@ -0,0 +1,215 @@
+import os
+import numpy as np
+import pandas as pd
+
+CORR_STATE = "corr_state.npz"   # persisted running co-moments between pipeline runs
+LARGE_UNIVERSE = 100            # above this many tickers, show top-k peer lists instead of a heatmap
+
+
+class RunningCorrelation:
+    # Pairwise Pearson correlation from running co-moments. For every ticker
+    # pair (i, j) it keeps, over the dates where BOTH have a value:
+    #   n[i, j], sx[i, j] = sum x_i, sxx[i, j] = sum x_i^2, sxy[i, j] = sum x_i x_j
+    # so a missing value only drops the pairs it belongs to (like DataFrame.corr)
+    # and appending trading days costs O(N^2) per day without rescanning history.
+    #
+    # on='price' correlates closing prices (the dashboards' heatmap); on='returns'
+    # correlates day-over-day returns, where a return is NaN if either day is missing.
+    def __init__(self, on='price'):
+        if on not in ('price', 'returns'):
+            raise ValueError("on must be 'price' or 'returns'")
+        self.on = on
+        self.tickers = []
+        self.last_date = None
+        self.n_dates = 0
+        self.shift = np.zeros(0)            # per-ticker offset, keeps the raw sums well conditioned
+        self.last_values = np.zeros(0)      # previous day's prices, for on='returns'
+        self.n = np.zeros((0, 0))
+        self.sx = np.zeros((0, 0))
+        self.sxx = np.zeros((0, 0))
+        self.sxy = np.zeros((0, 0))
+
+    def _add_tickers(self, tickers):
+        new = [t for t in tickers if t not in set(self.tickers)]
+        if not new:
+            return
+        k = len(self.tickers) + len(new)
+
+        def grow(m):
+            out = np.zeros((k, k))
+            out[:m.shape[0], :m.shape[1]] = m
+            return out
+
+        self.n, self.sx, self.sxx, self.sxy = (grow(m) for m in (self.n, self.sx, self.sxx, self.sxy))
+        self.shift = np.r_[self.shift, np.full(len(new), np.nan)]
+        self.last_values = np.r_[self.last_values, np.full(len(new), np.nan)]
+        self.tickers = self.tickers + new
+
+    def update(self, wide):
+        # `wide` is a date x ticker price frame (the shape of df.pivot or
+        # PricePanel.frame). Only dates after the last one seen are applied.
+        wide = wide.sort_index()
+        if self.last_date is not None:
+            wide = wide[wide.index > self.last_date]
+        if wide.empty:
+            return self
+        self._add_tickers(list(wide.columns))
+        wide = wide.reindex(columns=self.tickers)
+        prices = wide.to_numpy(dtype='float64')
+
+        if self.on == 'returns':
+            previous = np.vstack([self.last_values, prices[:-1]])
+            values = prices / previous - 1
+            self.last_values = prices[-1].copy()
+        else:
+            values = prices
+
+        # The first value seen for a ticker becomes its shift (correlation is shift-invariant)
+        unset = np.isnan(self.shift)
+        if unset.any():
+            first_seen = pd.DataFrame(values[:, unset]).bfill().iloc[0].to_numpy() if len(values) else []
+            self.shift[unset] = first_seen
+        present = ~np.isnan(values)
+        x = np.where(present, values - np.nan_to_num(self.shift), 0.0)
+        m = present.astype('float64')
+
+        self.n += m.T @ m
+        self.sx += x.T @ m
+        self.sxx += (x * x).T @ m
+        self.sxy += x.T @ x
+        self.last_date = wide.index[-1]
+        self.n_dates += len(wide)
+        return self
+
+    def matrix(self):
+        # DataFrame laid out like pivot.corr(): tickers sorted on both axes
+        n, sx, sxx, sxy = self.n, self.sx, self.sxx, self.sxy
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cov = n * sxy - sx * sx.T
+            var_i = n * sxx - sx * sx
+            var_j = var_i.T
+            corr = cov / np.sqrt(var_i * var_j)
+        valid = (n >= 2) & (var_i > 0) & (var_j > 0)
+        corr = np.where(valid, np.clip(corr, -1.0, 1.0), np.nan)
+        np.fill_diagonal(corr, np.where(np.diag(valid), 1.0, np.nan))
+        labels = pd.Index(self.tickers, name='ticker')
+        out = pd.DataFrame(corr, index=labels, columns=labels)
+        return out.sort_index().sort_index(axis=1)
+
+    def save(self, path=CORR_STATE):
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, on=self.on, tickers=np.array(self.tickers, dtype=str),
+                 last_date=np.datetime64(self.last_date, 'ns') if self.last_date is not None else np.datetime64('NaT'),
+                 n_dates=self.n_dates, shift=self.shift, last_values=self.last_values,
+                 n=self.n, sx=self.sx, sxx=self.sxx, sxy=self.sxy)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=CORR_STATE):
+        with np.load(path) as state:
+            engine = cls(on=str(state['on']))
+            engine.tickers = [str(t) for t in state['tickers']]
+            last_date = state['last_date'][()]
+            engine.last_date = None if np.isnat(last_date) else pd.Timestamp(last_date)
+            engine.n_dates = int(state['n_dates'])
+            for name in ('shift', 'last_values', 'n', 'sx', 'sxx', 'sxy'):
+                setattr(engine, name, state[name])
+        return engine
+
+
+def update_correlation(wide, on='price', state_path=CORR_STATE):
+    # Pipeline helper: resume from the saved state when it still describes the
+    # head of `wide`, apply only the new trading days, and save the state again.
+    # A restated history (different dates up to last_date) rebuilds from scratch.
+    engine = None
+    if state_path and os.path.exists(state_path):
+        engine = RunningCorrelation.load(state_path)
+        seen = wide.index[wide.index <= engine.last_date] if engine.last_date is not None else wide.index[:0]
+        if engine.on != on or len(seen) != engine.n_dates:
+            engine = None
+    if engine is None:
+        engine = RunningCorrelation(on=on)
+    engine.update(wide)
+    if state_path:
+        engine.save(state_path)
+    return engine
+
+
+def _standardize(wide):
+    # Each column centered on its own observed values and scaled to unit norm,
+    # missing values contributing 0. For complete columns Z_i . Z_j is exactly
+    # Pearson's r; with gaps it is a close, bounded approximation of the
+    # pairwise-complete value that avoids an O(N^2 * dates) masked product.
+    x = wide.to_numpy(dtype='float64')
+    present = ~np.isnan(x)
+    counts = present.sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.nansum(x, axis=0) / counts
+        centered = np.where(present, x - mean, 0.0)
+        norm = np.sqrt((centered * centered).sum(axis=0))
+    valid = (counts >= 2) & (norm > 0)
+    z = centered[:, valid] / norm[valid]
+    return np.ascontiguousarray(z.T, dtype='float32'), wide.columns[valid]
+
+
+def top_correlated(wide, k=5, n_pairs=20, block_size=256):
+    # Blocked search over a date x ticker price frame: standardized float32
+    # rows of Z are multiplied one block of tickers at a time (block x N), and
+    # each block only keeps its k most / least correlated peers per ticker and
+    # its best candidate pairs, so memory stays O(block_size * N).
+    # Returns {'most': ..., 'least': ..., 'pairs': ...} long-format frames.
+    zt, tickers = _standardize(wide.sort_index(axis=1))
+    n = len(tickers)
+    k = max(0, min(k, n - 1))
+    names = np.asarray(tickers)
+    most, least = [], []
+    pair_i = np.array([], dtype=int)
+    pair_j = np.array([], dtype=int)
+    pair_r = np.array([], dtype='float32')
+
+    for start in range(0, n, block_size):
+        stop = min(start + block_size, n)
+        rows = np.arange(stop - start)
+        block = zt[start:stop] @ zt.T
+        np.clip(block, -1.0, 1.0, out=block)
+
+        if k:
+            high = block.copy()
+            high[rows, start + rows] = -np.inf          # never your own peer
+            idx = np.argpartition(-high, k - 1, axis=1)[:, :k]
+            vals = np.take_along_axis(high, idx, axis=1)
+            order = np.argsort(-vals, axis=1)
+            most.append((start + rows, np.take_along_axis(idx, order, axis=1), np.take_along_axis(vals, order, axis=1)))
+
+            low = block.copy()
+            low[rows, start + rows] = np.inf
+            idx = np.argpartition(low, k - 1, axis=1)[:, :k]
+            vals = np.take_along_axis(low, idx, axis=1)
+            order = np.argsort(vals, axis=1)
+            least.append((start + rows, np.take_along_axis(idx, order, axis=1), np.take_along_axis(vals, order, axis=1)))
+
+        # Global pairs: upper triangle only (j > i), merged with the running best
+        upper = np.where(np.arange(n)[None, :] > (start + rows)[:, None], block, -np.inf).ravel()
+        take = min(n_pairs, int(np.isfinite(upper).sum()))
+        if take:
+            flat = np.argpartition(-upper, take - 1)[:take]
+            pair_i = np.r_[pair_i, start + flat // n]
+            pair_j = np.r_[pair_j, flat % n]
+            pair_r = np.r_[pair_r, upper[flat]]
+            if len(pair_r) > n_pairs:
+                keep = np.argpartition(-pair_r, n_pairs - 1)[:n_pairs]
+                pair_i, pair_j, pair_r = pair_i[keep], pair_j[keep], pair_r[keep]
+
+    def peers(parts):
+        if not parts:
+            return pd.DataFrame(columns=['ticker', 'rank', 'peer', 'corr'])
+        t = np.concatenate([np.repeat(r, k) for r, _, _ in parts])
+        p = np.concatenate([i.ravel() for _, i, _ in parts])
+        v = np.concatenate([c.ravel() for _, _, c in parts])
+        return pd.DataFrame({'ticker': names[t], 'rank': np.tile(np.arange(1, k + 1), len(t) // k),
+                             'peer': names[p], 'corr': v.astype('float64')})
+
+    order = np.argsort(-pair_r)
+    pairs = pd.DataFrame({'ticker_a': names[pair_i[order]], 'ticker_b': names[pair_j[order]],
+                          'corr': pair_r[order].astype('float64')})
+    return {'most': peers(most), 'least': peers(least), 'pairs': pairs}
@@ -0,0 +1,65 @@
+import io
+import threading
+from collections import OrderedDict
+
+import matplotlib.pyplot as plt
+import pandas as pd
+
+
+def filter_signature(tickers, start, end, sector):
+    # Normalized sidebar state: ticker order and duplicates don't matter, dates
+    # are compared as timestamps
+    return (
+        tuple(sorted(set(tickers))),
+        pd.Timestamp(start).isoformat(),
+        pd.Timestamp(end).isoformat(),
+        sector,
+    )
+
+
+class LRUCache:
+    # Small thread-safe LRU map with hit/miss counters. Streamlit serves every
+    # session from threads of one process, so a single instance held in
+    # st.cache_resource is shared by all users.
+    def __init__(self, maxsize=16):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, key, compute):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+
+        # Computed outside the lock so one slow filter doesn't block other sessions
+        value = compute()
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return value
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._data), 'maxsize': self.maxsize}
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+def render_png(fig, dpi=100):
+    # Encode the figure once and close it right away, so a long session doesn't
+    # keep every matplotlib figure it ever drew alive
+    buf = io.BytesIO()
+    try:
+        fig.savefig(buf, format='png', dpi=dpi, bbox_inches='tight')
+    finally:
+        plt.close(fig)
+    return buf.getvalue()
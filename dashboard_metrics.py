@@ -0,0 +1,141 @@
+import numpy as np
+import pandas as pd
+
+from features import first_last_close, daily_returns, cumulative_returns
+from instrument import traced
+from dataset import CompactDataset
+
+
+class PrefixIndex:
+    # Per-ticker prefix sums over the full (ticker, date)-sorted frame, built once
+    # at load time. Any [start, end] window of a ticker is a row range [lo, hi)
+    # found with two binary searches, and window sums are P[hi] - P[lo], so
+    # return/volatility/average metrics cost O(tickers) per filter change
+    # instead of O(rows). Rows, offsets and prices are shared with the
+    # CompactDataset it is built on (a frame is converted first).
+    def __init__(self, data):
+        if not isinstance(data, CompactDataset):
+            data = CompactDataset.from_frame(data)
+        self.data = data
+        self.tickers = data.tickers
+        self.starts = data.starts
+        self.ends = data.ends
+        self.close = data.columns['close']
+        close = self.close.astype('float64')
+        volume = data.columns['volume'].astype('float64')
+
+        # Daily simple return of each row vs. the previous row of the same
+        # ticker; 0 on each ticker's first row (it never enters a window sum)
+        n = len(close)
+        ret = np.zeros(n)
+        if n > 1:
+            ret[1:] = close[1:] / close[:-1] - 1
+        ret[self.starts[self.starts < n]] = 0.0
+        has_volume = ~np.isnan(volume)
+        self.cum_ret = np.r_[0.0, np.cumsum(ret)]
+        self.cum_ret2 = np.r_[0.0, np.cumsum(ret * ret)]
+        self.cum_close = np.r_[0.0, np.cumsum(close)]
+        self.cum_volume = np.r_[0.0, np.cumsum(np.where(has_volume, volume, 0.0))]
+        self.cum_volume_n = np.r_[0, np.cumsum(has_volume)]
+
+    def window(self, tickers, start, end):
+        # Row offsets [lo, hi) of each selected ticker inside [start, end] (inclusive,
+        # like Series.between); tickers with no rows in the window are dropped
+        return self.data.window(tickers, start, end)
+
+    def yearly_returns(self, window):
+        # First-to-last close return (%) of tickers with at least two rows
+        w = window[window['hi'] - window['lo'] >= 2]
+        first = self.close[w['lo'].to_numpy()].astype('float64')
+        last = self.close[w['hi'].to_numpy() - 1].astype('float64')
+        return pd.DataFrame({'ticker': w['ticker'].to_numpy(), 'yearly_return': (last - first) / first * 100})
+
+    def volatility(self, window):
+        # Sample std (ddof=1) of the daily returns inside the window; the window's
+        # first row has no previous close, exactly like pct_change on the filtered frame
+        lo = window['lo'].to_numpy() + 1
+        hi = window['hi'].to_numpy()
+        m = (hi - lo).astype('float64')
+        total = self.cum_ret[hi] - self.cum_ret[lo]
+        total2 = self.cum_ret2[hi] - self.cum_ret2[lo]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            var = (total2 - total * total / m) / (m - 1)
+        vol = np.where(m >= 2, np.sqrt(np.clip(var, 0, None)), np.nan)
+        vol_df = pd.DataFrame({'ticker': window['ticker'].to_numpy(), 'volatility': vol})
+        return vol_df.sort_values('volatility', ascending=False)
+
+    def averages(self, window):
+        # (mean close, mean volume) over every row in the window, as filtered_df.mean() would give
+        lo = window['lo'].to_numpy()
+        hi = window['hi'].to_numpy()
+        n_rows = (hi - lo).sum()
+        n_volume = (self.cum_volume_n[hi] - self.cum_volume_n[lo]).sum()
+        avg_price = (self.cum_close[hi] - self.cum_close[lo]).sum() / n_rows if n_rows else np.nan
+        avg_volume = (self.cum_volume[hi] - self.cum_volume[lo]).sum() / n_volume if n_volume else np.nan
+        return avg_price, avg_volume
+
+    def cumulative_return(self, window, tickers):
+        # Long (ticker, date, cumulative_return) frame for just the plotted tickers;
+        # compounding the daily returns from the window start is close / first close - 1
+        parts = []
+        for row in window[window['ticker'].isin(list(tickers))].itertuples(index=False):
+            close = self.close[row.lo:row.hi].astype('float64')
+            dates = self.data.calendar[self.data.day[row.lo:row.hi]]
+            parts.append(pd.DataFrame({'ticker': row.ticker, 'date': dates,
+                                       'cumulative_return': close / close[0] - 1}))
+        if not parts:
+            return pd.DataFrame(columns=['ticker', 'date', 'cumulative_return'])
+        return pd.concat(parts, ignore_index=True)
+
+
+# Row-based metric functions used by app.py (and benchmark.py). The page answers
+# returns, volatility, averages and cumulative returns from PrefixIndex in
+# O(tickers); these remain the reference implementations over an arbitrary frame.
+# Derived columns are computed as standalone series and returned in new, narrow
+# frames: the input frame is never copied or modified.
+@traced()
+def yearly_returns(df):
+    tickers, first, last, counts = first_last_close(df)
+    keep = counts >= 2
+    y_return = (last[keep] - first[keep]) / first[keep] * 100
+    return pd.DataFrame({'ticker': tickers[keep], 'yearly_return': y_return})
+
+@traced()
+def volatility(df):
+    daily_return = daily_returns(df)
+    vol_df = daily_return.groupby(df['ticker'], observed=True).std().reset_index()
+    vol_df.columns = ['ticker', 'volatility']
+    return vol_df.sort_values('volatility', ascending=False)
+
+@traced()
+def cumulative_return(df):
+    # (ticker, date, daily_return, cumulative_return); ticker and date are the
+    # input's own columns, not copies. Like analysis.compute_cumulative_return
+    # this used to return all of df's columns; join on the shared index for them
+    daily_return = daily_returns(df).fillna(0)
+    return pd.DataFrame({'ticker': df['ticker'], 'date': df['date'], 'daily_return': daily_return,
+                         'cumulative_return': cumulative_returns(df, daily_return)}, copy=False)
+
+@traced()
+def sector_performance(returns_df, sector_map):
+    merged = returns_df.merge(sector_map, on='ticker')
+    sector_perf = merged.groupby('sector')['yearly_return'].mean().reset_index()
+    return sector_perf.sort_values('yearly_return', ascending=False)
+
+def close_prices(df, panel=None):
+    if panel is not None:
+        return panel.frame('close', tickers=df['ticker'].unique(), start=df['date'].min(), end=df['date'].max())
+    return df.pivot(index='date', columns='ticker', values='close')
+
+@traced()
+def correlation_matrix(df, panel=None):
+    return close_prices(df, panel).corr()
+
+@traced()
+def monthly_gainers_losers(df):
+    month = df['date'].dt.to_period('M').rename('month')
+    monthly = df.groupby([df['ticker'], month], observed=True)['close'].agg(['first', 'last'])
+    monthly.columns = ['first_close', 'last_close']
+    monthly = monthly.reset_index()
+    monthly['monthly_return'] = (monthly['last_close'] - monthly['first_close']) / monthly['first_close'] * 100
+    return monthly
@@ -0,0 +1,141 @@
+import numpy as np
+import pandas as pd
+
+from store import load_master
+from instrument import traced
+
+# Compact in-memory master: the (ticker, date)-sorted rows as plain numpy
+# columns -- small integer ticker codes, int32 day numbers into one shared
+# calendar, float32 prices (see PRICE_DTYPE) and integer volume -- plus a
+# per-ticker [start, end) row offset table. Selecting tickers and a date range
+# is a binary search inside each selected ticker's run instead of boolean
+# masks over every row, and frame() materializes only the selected rows.
+
+PRICE_DTYPE = "auto"      # "float32", "float64", or "auto": float32 when every price survives the cast
+PRICE_TOLERANCE = 0.005   # "auto": largest float32 rounding error accepted (half a paisa)
+PRICE_COLS = ['open', 'high', 'low', 'close']
+
+
+def price_dtype(values, policy=PRICE_DTYPE, tolerance=PRICE_TOLERANCE):
+    if policy != "auto":
+        return np.dtype(policy)
+    finite = values[np.isfinite(values)]
+    if finite.size == 0:
+        return np.dtype('float32')
+    error = np.abs(finite.astype('float32').astype('float64') - finite).max()
+    return np.dtype('float32') if error <= tolerance else np.dtype('float64')
+
+
+def volume_dtype(values):
+    # Whole share counts fit an integer column; missing volumes keep float64 (NaN)
+    if np.isnan(values).any() or (values != np.round(values)).any():
+        return np.dtype('float64')
+    if values.size == 0 or (values.min() >= np.iinfo('int32').min and values.max() <= np.iinfo('int32').max):
+        return np.dtype('int32')
+    return np.dtype('int64')
+
+
+class CompactDataset:
+    def __init__(self, tickers, codes, calendar, day, columns):
+        self.tickers = tickers      # sorted ticker names; row codes index into it
+        self.codes = codes
+        self.calendar = calendar    # sorted distinct dates (datetime64, unit of the source)
+        self.day = day              # per row: position of its date in calendar
+        self.columns = columns      # {'open': ..., 'volume': ...} per-row arrays
+        bounds = np.searchsorted(codes, np.arange(len(tickers) + 1))
+        self.starts = bounds[:-1]
+        self.ends = bounds[1:]
+        self.position = {t: i for i, t in enumerate(tickers)}
+
+    @classmethod
+    @traced("dataset.from_frame")
+    def from_frame(cls, df, price_policy=PRICE_DTYPE):
+        ticker = pd.Categorical(df['ticker'])
+        tickers = np.asarray(ticker.categories, dtype=object)
+        code_dtype = 'int16' if len(tickers) < np.iinfo('int16').max else 'int32'
+        codes = ticker.codes.astype(code_dtype)
+        calendar, day = np.unique(df['date'].to_numpy(), return_inverse=True)
+        day = day.astype('int32')
+        order = np.lexsort((day, codes))
+
+        columns = {}
+        for col in PRICE_COLS:
+            if col in df:
+                values = df[col].to_numpy(dtype='float64')[order]
+                columns[col] = values.astype(price_dtype(values, price_policy))
+        if 'volume' in df:
+            values = df['volume'].to_numpy(dtype='float64')[order]
+            columns['volume'] = values.astype(volume_dtype(values))
+        return cls(tickers, codes[order], calendar, day[order], columns)
+
+    @classmethod
+    def load(cls, tickers=None, start=None, end=None, price_policy=PRICE_DTYPE, **kwargs):
+        # Same arguments as store.load_master (columnar store, else the master CSV)
+        return cls.from_frame(load_master(tickers=tickers, start=start, end=end, **kwargs), price_policy)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def nbytes(self):
+        arrays = [self.codes, self.calendar, self.day, self.starts, self.ends, *self.columns.values()]
+        return sum(a.nbytes for a in arrays)
+
+    def date_range(self):
+        if len(self.calendar) == 0:
+            return None, None
+        return pd.Timestamp(self.calendar[0]), pd.Timestamp(self.calendar[-1])
+
+    def _date(self, value):
+        return pd.Timestamp(value).to_datetime64().astype(self.calendar.dtype)
+
+    def window(self, tickers=None, start=None, end=None):
+        # Row offsets [lo, hi) of each selected ticker inside [start, end]
+        # (inclusive, like Series.between); unknown tickers and tickers with no
+        # rows in the window are dropped. Sorted by ticker.
+        first = 0 if start is None else self.calendar.searchsorted(self._date(start), side='left')
+        last = len(self.calendar) if end is None else self.calendar.searchsorted(self._date(end), side='right')
+        if tickers is None:
+            positions = range(len(self.tickers))
+        else:
+            positions = sorted(self.position[t] for t in set(tickers) if t in self.position)
+        names, lo, hi = [], [], []
+        for i in positions:
+            s, e = self.starts[i], self.ends[i]
+            days = self.day[s:e]
+            a = s + days.searchsorted(first, side='left')
+            b = s + days.searchsorted(last, side='left')
+            if b > a:
+                names.append(self.tickers[i])
+                lo.append(a)
+                hi.append(b)
+        return pd.DataFrame({'ticker': names, 'lo': np.array(lo, dtype=int), 'hi': np.array(hi, dtype=int)})
+
+    def rows(self, window):
+        # Row positions covered by a window, in (ticker, date) order
+        lo = window['lo'].to_numpy()
+        lengths = window['hi'].to_numpy() - lo
+        if lengths.sum() == 0:
+            return np.array([], dtype=int)
+        shift = np.repeat(lo - np.r_[0, np.cumsum(lengths)[:-1]], lengths)
+        return shift + np.arange(lengths.sum())
+
+    def frame(self, window=None, columns=None):
+        # DataFrame of the window's rows (all rows without one) in the master
+        # layout; ticker is categorical over just the tickers present
+        rows = np.arange(len(self)) if window is None else self.rows(window)
+        columns = list(columns or ['date', *self.columns, 'ticker'])
+        data = {}
+        for col in columns:
+            if col == 'date':
+                data[col] = self.calendar[self.day[rows]]
+            elif col == 'ticker':
+                codes = self.codes[rows]
+                present = np.unique(codes)
+                data[col] = pd.Categorical.from_codes(np.searchsorted(present, codes), categories=self.tickers[present])
+            else:
+                data[col] = self.columns[col][rows]
+        return pd.DataFrame(data, columns=columns)
+
+    @traced("dataset.select")
+    def select(self, tickers=None, start=None, end=None, columns=None):
+        return self.frame(self.window(tickers, start, end), columns)
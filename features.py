@@ -0,0 +1,128 @@
+import numpy as np
+import pandas as pd
+
+from panel import open_panel
+from correlation import update_correlation
+from instrument import traced
+
+# Features shared by powerBI_data.py, xl_combine.py, analysis.py and pipeline.py.
+# Every function takes the (ticker, date)-sorted master frame that
+# store.load_master returns and leaves its input untouched.
+
+SECTOR_CSV = "Sector_data - Sheet1.csv"
+
+
+def load_sector_map(sector_csv=SECTOR_CSV):
+    # (ticker, sector) from the sector sheet, whose Symbol column reads "NAME: TICKER"
+    sector_map = pd.read_csv(sector_csv)
+    sector_map['ticker'] = sector_map['Symbol'].apply(lambda x: x.split(': ')[-1])
+    return sector_map[['ticker', 'sector']]
+
+
+def first_last_close(df):
+    # One stable (ticker, date) sort, then the first/last row of each ticker run:
+    # returns (tickers, first_close, last_close, n_rows) arrays in ticker order
+    df = df.sort_values(['ticker', 'date'], kind='stable')
+    tickers = df['ticker'].to_numpy()
+    close = df['close'].to_numpy()
+    if len(tickers) == 0:
+        return tickers, close, close, np.array([], dtype=int)
+    starts = np.flatnonzero(np.r_[True, tickers[1:] != tickers[:-1]])
+    ends = np.r_[starts[1:], len(tickers)]
+    return tickers[starts], close[starts], close[ends - 1], ends - starts
+
+
+def daily_returns(df):
+    # Close-to-close return vs. the previous row of the same ticker
+    return df.groupby('ticker', observed=True)['close'].pct_change().rename('daily_return')
+
+
+def cumulative_returns(df, daily_return=None):
+    # Compounded daily returns since each ticker's first row (0 on that row)
+    if daily_return is None:
+        daily_return = daily_returns(df)
+    growth = (1 + daily_return.fillna(0)).groupby(df['ticker'], observed=True).cumprod()
+    return (growth - 1).rename('cumulative_return')
+
+
+def ticker_stats(df, daily_return=None):
+    # Per ticker: first-to-last close return (%), NaN below two rows, and the
+    # std of daily returns
+    if daily_return is None:
+        daily_return = daily_returns(df)
+    tickers, first, last, counts = first_last_close(df)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        yearly = np.where(counts >= 2, (last - first) / first * 100, np.nan)
+    volatility = daily_return.groupby(df['ticker'], observed=True).std()
+    return pd.DataFrame({'ticker': tickers, 'yearly_return': yearly,
+                         'volatility': volatility.reindex(tickers).to_numpy()})
+
+
+def monthly_returns(df):
+    # (ticker, month, monthly_return %) from each month's first and last close
+    month = df['date'].dt.to_period('M').rename('month')
+    monthly = df.groupby([df['ticker'], month], observed=True)['close'].agg(['first', 'last'])
+    monthly_return = (monthly['last'] - monthly['first']) / monthly['first'] * 100
+    return monthly_return.rename('monthly_return').reset_index()
+
+
+@traced()
+def close_correlation(df, panel=None):
+    # Closing-price correlation matrix: the memory-mapped panel when built, else
+    # a pivot of df; running co-moments in corr_state.npz mean only trading days
+    # added since the last run are folded in
+    panel = open_panel() if panel is None else panel
+    if panel is not None:
+        close_pivot = panel.frame("close")
+    else:
+        close_pivot = df.pivot(index="date", columns="ticker", values="close")
+    return update_correlation(close_pivot).matrix()
+
+
+@traced()
+def return_features(df, sector_map):
+    # 'daily': the master rows with sector, daily and cumulative return;
+    # 'ticker_stats' and 'monthly' hold the per-ticker / per-month values once
+    daily = df.merge(sector_map, on="ticker", how="left")
+    daily['daily_return'] = daily_returns(daily)
+    daily['cumulative_return'] = cumulative_returns(daily, daily['daily_return'])
+    return {'daily': daily,
+            'ticker_stats': ticker_stats(daily, daily['daily_return']),
+            'monthly': monthly_returns(daily)}
+
+
+@traced()
+def build_features(df, sector_map, panel=None):
+    features = return_features(df, sector_map)
+    features['corr'] = close_correlation(df, panel)
+    return features
+
+
+@traced()
+def flat_analytics(features):
+    # The denormalized analytics frame: ticker stats and monthly return repeated
+    # on every daily row. Built as a new frame, so `features` can be shared.
+    daily = features['daily']
+    stats = features['ticker_stats'].set_index('ticker')
+    flat = daily.assign(yearly_return=daily['ticker'].map(stats['yearly_return']),
+                        volatility=daily['ticker'].map(stats['volatility']),
+                        month=daily['date'].dt.to_period('M'))
+    return pd.merge(flat, features['monthly'], on=['ticker', 'month'], how='left')
+
+
+def flat_analytics_chunks(features, chunk_rows):
+    # flat_analytics in consecutive blocks of at most chunk_rows rows, each one
+    # built from its daily rows and the per-ticker / per-month lookups, so the
+    # whole denormalized frame never exists at once. Always yields at least one
+    # (possibly empty) block, which carries the column names.
+    daily = features['daily']
+    stats = features['ticker_stats'].set_index('ticker')
+    monthly = features['monthly'].set_index(['ticker', 'month'])['monthly_return']
+    for start in range(0, max(len(daily), 1), chunk_rows):
+        part = daily.iloc[start:start + chunk_rows]
+        month = part['date'].dt.to_period('M')
+        keys = pd.MultiIndex.from_arrays([part['ticker'], month])
+        yield part.assign(yearly_return=part['ticker'].map(stats['yearly_return']),
+                          volatility=part['ticker'].map(stats['volatility']),
+                          month=month,
+                          monthly_return=monthly.reindex(keys).to_numpy())
@@ -0,0 +1,366 @@
+import os
+import sys
+import json
+import hashlib
+import yaml
+import pandas as pd
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import store
+from panel import build_panel, update_panel
+from correlation import CORR_STATE, RunningCorrelation
+from comb_load import WRITE_CSV, clean_master
+
+# libyaml's C loader parses several times faster than the pure-Python one.
+# Fall back to the regular SafeLoader when PyYAML was built without libyaml.
+try:
+    from yaml import CSafeLoader as YamlLoader
+except ImportError:
+    from yaml import SafeLoader as YamlLoader
+
+INPUT_DIR = "data"
+MONTHLY_DIR = "CSV_data"              # <month>/<ticker>.csv
+FULL_YEAR_DIR = "CSV_data_full_year"  # <ticker>.csv
+MASTER_CSV = "cleaned_master_stock_data.csv"
+MANIFEST_PATH = "ingest_manifest.json"  # YAML files already merged into the master
+# Number of parser processes (1 = serial). Override with INGEST_WORKERS=<n>.
+WORKERS = int(os.environ.get("INGEST_WORKERS", os.cpu_count() or 1))
+
+
+def list_yaml_files(input_dir=INPUT_DIR):
+    # (month_folder, file_path) pairs, in the same order the converters walk them
+    files = []
+    for month_folder in os.listdir(input_dir):
+        month_path = os.path.join(input_dir, month_folder)
+        if not os.path.isdir(month_path):
+            continue
+        for file in os.listdir(month_path):
+            if file.endswith(".yaml"):
+                files.append((month_folder, os.path.join(month_path, file)))
+    return files
+
+
+def parse_yaml_file(file_path):
+    # Returns ({ticker: [records]}, error message or None)
+    try:
+        with open(file_path, 'r') as f:
+            entries = yaml.load(f, Loader=YamlLoader)
+    except Exception as e:
+        return {}, f"⚠️ Error reading {file_path}: {e}"
+
+    ticker_data = defaultdict(list)
+    for row in entries or []:
+        ticker = row.get("Ticker")
+        if not ticker:
+            continue
+        ticker_data[ticker].append({
+            "date": row.get("date"),
+            "open": row.get("open"),
+            "high": row.get("high"),
+            "low": row.get("low"),
+            "close": row.get("close"),
+            "volume": row.get("volume")
+        })
+    return dict(ticker_data), None
+
+
+def parse_files(files, workers=WORKERS):
+    # Yields (month_folder, {ticker: [records]}) per file, in input order, so
+    # merging the per-file buckets gives exactly the serial record order.
+    paths = [path for _, path in files]
+    if workers <= 1 or len(paths) <= 1:
+        results = map(parse_yaml_file, paths)
+        for (month_folder, _), (ticker_data, error) in zip(files, results):
+            if error:
+                print(error)
+            yield month_folder, ticker_data
+        return
+
+    chunksize = max(1, len(paths) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(parse_yaml_file, paths, chunksize=chunksize)
+        for (month_folder, _), (ticker_data, error) in zip(files, results):
+            if error:
+                print(error)
+            yield month_folder, ticker_data
+
+
+def merge_ticker_data(target, ticker_data):
+    for ticker, records in ticker_data.items():
+        target[ticker].extend(records)
+    return target
+
+
+def ticker_frame(records):
+    df = pd.DataFrame(records)
+    df.sort_values("date", inplace=True)
+    return df
+
+
+def full_year_data(month_data):
+    # Concatenating the month buckets in walk order gives the same per-ticker
+    # record order as a single pass over the whole tree
+    ticker_data = defaultdict(list)
+    for month_buckets in month_data.values():
+        merge_ticker_data(ticker_data, month_buckets)
+    return ticker_data
+
+
+# ----------- SINKS -----------
+# Each sink takes the parsed {month: {ticker: [records]}} buckets.
+
+def write_monthly_csvs(month_data, output_dir=MONTHLY_DIR):
+    os.makedirs(output_dir, exist_ok=True)
+    for month_folder, ticker_data in month_data.items():
+        month_output_dir = os.path.join(output_dir, month_folder)
+        os.makedirs(month_output_dir, exist_ok=True)
+        for ticker, records in ticker_data.items():
+            ticker_frame(records).to_csv(os.path.join(month_output_dir, f"{ticker}.csv"), index=False)
+        print(f"✅ Done: {month_folder} -> {month_output_dir}/")
+
+
+def write_full_year_csvs(month_data, output_dir=FULL_YEAR_DIR):
+    os.makedirs(output_dir, exist_ok=True)
+    for ticker, records in full_year_data(month_data).items():
+        ticker_frame(records).to_csv(os.path.join(output_dir, f"{ticker}.csv"), index=False)
+    print(f"✅ Full-year ticker CSVs saved in '{output_dir}'")
+
+
+def build_master(month_data):
+    # Same frame comb_load.py builds from the full-year CSVs, without the CSV round trip
+    dataframes = []
+    for ticker, records in full_year_data(month_data).items():
+        df = ticker_frame(records)
+        df['ticker'] = ticker
+        dataframes.append(df)
+    if not dataframes:
+        return clean_master(pd.DataFrame(columns=store.COLUMNS))
+    return clean_master(pd.concat(dataframes, ignore_index=True))
+
+
+def invalidate_correlation_state(since=None, state_path=CORR_STATE):
+    # The running correlation can only append days after its last_date; if
+    # days from `since` on were (re)written, drop the state so the next export
+    # rebuilds it
+    if not os.path.exists(state_path):
+        return
+    if since is not None:
+        last_date = RunningCorrelation.load(state_path).last_date
+        if last_date is None or since > last_date:
+            return
+    os.remove(state_path)
+
+
+def save_master(full_df, output_path=MASTER_CSV):
+    # Full rebuild: columnar store first (what the loaders read), then the
+    # optional CSV export
+    if store.pa is not None:
+        store.write_store(full_df)
+    else:
+        print("⚠️ pyarrow not installed, skipping the columnar store")
+    build_panel(full_df)
+    invalidate_correlation_state()
+    if WRITE_CSV:
+        full_df.to_csv(output_path, index=False)
+
+
+def export_master_csv(output_path=MASTER_CSV):
+    # On-demand CSV export of the columnar store (incremental runs don't rewrite it)
+    full_df = store.load_master(csv_path=output_path)
+    full_df.to_csv(output_path, index=False)
+    print(f"✅ Master exported: {output_path} ({len(full_df)} rows)")
+
+
+def write_master_csv(month_data, output_path=MASTER_CSV):
+    full_df = build_master(month_data)
+    save_master(full_df, output_path)
+    print(f"✅ Master saved: {output_path} / {store.STORE_DIR}/ ({len(full_df)} rows)")
+
+
+SINKS = {
+    "monthly": write_monthly_csvs,
+    "full_year": write_full_year_csvs,
+    "master": write_master_csv,
+}
+
+
+def parse_tree(input_dir=INPUT_DIR, workers=WORKERS, months=None):
+    # Parse every YAML file exactly once into {month: {ticker: [records]}};
+    # `months`, if given, is filled with {file_path: file_months(...)}
+    files = list_yaml_files(input_dir)
+    month_data = {}
+    for (_, path), (month_folder, file_data) in zip(files, parse_files(files, workers=workers)):
+        merge_ticker_data(month_data.setdefault(month_folder, defaultdict(list)), file_data)
+        if months is not None:
+            months[path] = file_months(file_data)
+    return month_data
+
+
+def run(sinks=tuple(SINKS), input_dir=INPUT_DIR, workers=WORKERS):
+    unknown = set(sinks) - set(SINKS)
+    if unknown:
+        raise ValueError(f"Unknown sink(s): {sorted(unknown)}; choose from {list(SINKS)}")
+
+    months = {} if "master" in sinks else None
+    month_data = parse_tree(input_dir, workers=workers, months=months)
+    print(f"📂 Parsed {sum(len(t) for t in month_data.values())} month/ticker buckets "
+          f"from {len(month_data)} month folders")
+    for sink in sinks:
+        SINKS[sink](month_data)
+    if months is not None:
+        # A full master rebuild is where the next --incremental run picks up from
+        _, manifest = diff_manifest([f for f in list_yaml_files(input_dir) if f[1] in months], {})
+        save_manifest({path: {**entry, "months": months[path]} for path, entry in manifest.items()})
+    return month_data
+
+
+# ----------- INCREMENTAL INGESTION -----------
+
+def file_hash(file_path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_manifest(manifest_path=MANIFEST_PATH):
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, manifest_path=MANIFEST_PATH):
+    # Write to a temp file first so an interrupted run never leaves a half manifest
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+
+def diff_manifest(files, manifest):
+    # Returns (new or changed files, manifest for the current tree).
+    # size + mtime is the cheap check; the content hash is only computed when
+    # those differ, so touched-but-identical files are not re-parsed.
+    changed = []
+    current = {}
+    for month_folder, file_path in files:
+        st = os.stat(file_path)
+        entry = manifest.get(file_path)
+        if entry and entry["size"] == st.st_size and entry["mtime"] == st.st_mtime_ns:
+            current[file_path] = entry
+            continue
+        digest = file_hash(file_path)
+        if entry and entry["sha256"] == digest:
+            current[file_path] = {**entry, "size": st.st_size, "mtime": st.st_mtime_ns}
+            continue
+        current[file_path] = {"size": st.st_size, "mtime": st.st_mtime_ns, "sha256": digest}
+        changed.append((month_folder, file_path))
+    return changed, current
+
+
+def file_months(ticker_data):
+    # "YYYY-MM" months a parsed file has rows in
+    dates = pd.to_datetime(pd.Series([r["date"] for records in ticker_data.values() for r in records],
+                                     dtype=object), errors='coerce').dropna()
+    return sorted(dates.dt.strftime("%Y-%m").unique())
+
+
+def merge_into_master(existing_df, delta_df):
+    # Same (ticker, date) dedup and sort as comb_load.clean_master, except that
+    # re-ingested rows replace the ones already in the master
+    merged = pd.concat([existing_df, delta_df], ignore_index=True)
+    merged.drop_duplicates(subset=['ticker', 'date'], keep='last', inplace=True)
+    merged.sort_values(['ticker', 'date'], inplace=True)
+    merged.reset_index(drop=True, inplace=True)
+    return merged
+
+
+def replace_master_months(rows, months, master_path=MASTER_CSV):
+    # `rows` holds every row the given months should keep. The store and panel
+    # only rewrite those months; without pyarrow the master CSV is the master
+    # and is rewritten in full.
+    if store.pa is not None:
+        store.replace_months(rows, months)
+        if not update_panel(rows, months):
+            build_panel(store.load_master(csv_path=master_path))
+    else:
+        full_df = rows
+        if os.path.exists(master_path):
+            kept = store.read_master_csv(master_path)
+            full_df = merge_into_master(kept[~kept['date'].dt.to_period('M').isin(list(months))], rows)
+        full_df.to_csv(master_path, index=False)
+        build_panel(full_df)
+    invalidate_correlation_state(min(months).start_time)
+
+
+def run_incremental(input_dir=INPUT_DIR, master_path=MASTER_CSV,
+                    manifest_path=MANIFEST_PATH, workers=WORKERS):
+    # Parsing and the store are delta-sized: only the year/month partitions the
+    # delta touches are read, merged and written back. The panel is not: every
+    # refresh writes a new version, copying the kept ticker x date cells of the
+    # old one (a sequential copy, but O(history) I/O; see panel.update_panel).
+    # The manifest records the months each file has rows in: a month that lost
+    # a file (removed, or changed so that some of its rows may be gone) is
+    # rebuilt from the files that are still in it.
+    has_master = os.path.exists(master_path) or store.has_store()
+    if store.pa is not None and not store.has_store() and os.path.exists(master_path):
+        # CSV-only master from before the columnar store: convert it once
+        store.write_store(store.read_master_csv(master_path))
+    manifest = load_manifest(manifest_path) if has_master else {}
+    files = list_yaml_files(input_dir)
+    changed, current = diff_manifest(files, manifest)
+    removed = sorted(set(manifest) - set(current))
+    legacy = [path for path in removed if "months" not in manifest[path]]
+    if legacy:
+        raise RuntimeError(f"{len(legacy)} removed file(s) predate per-file month tracking, so their rows "
+                           f"can't be located (e.g. {legacy[0]}); rebuild with `python ingest.py master`")
+
+    changed_paths = {path for _, path in changed}
+    stale = set()
+    for path in removed + sorted(changed_paths & set(manifest)):
+        stale.update(manifest[path].get("months", ()))
+    # Changed files, plus unchanged ones in a rebuilt month or not yet tracked by month
+    reparse = [(m, p) for m, p in files if p in changed_paths or "months" not in current[p]
+               or stale.intersection(current[p]["months"])]
+    if not reparse and not removed:
+        save_manifest(current, manifest_path)
+        print("✅ Master is up to date, no new or changed YAML files")
+        return None
+
+    month_data = {}
+    for (month_folder, path), (_, file_data) in zip(reparse, parse_files(reparse, workers=workers)):
+        current[path] = {**current[path], "months": file_months(file_data)}
+        merge_ticker_data(month_data.setdefault(month_folder, defaultdict(list)), file_data)
+    delta_df = build_master(month_data)
+
+    stale = {pd.Period(m, 'M') for m in stale}
+    months = stale | set(delta_df['date'].dt.to_period('M').unique())
+    merged = sorted(months - stale)
+    rows = delta_df
+    if merged and store.has_store():
+        rows = merge_into_master(store.read_months(merged), delta_df)
+    if months:
+        replace_master_months(rows, months, master_path)
+
+    # Only record the files once their rows are safely in the master
+    save_manifest(current, manifest_path)
+    print(f"✅ Ingested {len(changed)} new/changed and {len(removed)} removed file(s): "
+          f"{len(months)} month(s) rewritten, {len(rows)} rows")
+    return rows
+
+
+if __name__ == '__main__':
+    # python ingest.py [monthly] [full_year] [master]   (default: all sinks)
+    # python ingest.py --incremental                    (merge new/changed files into the master)
+    # python ingest.py --export-csv                     (write the master CSV from the store)
+    args = sys.argv[1:]
+    if "--incremental" in args:
+        run_incremental()
+    elif "--export-csv" in args:
+        export_master_csv()
+    else:
+        run(args or tuple(SINKS))
+    print("🎉 Ingestion complete")
@@ -0,0 +1,178 @@
+import os
+import sys
+import json
+import time
+import logging
+import threading
+import tracemalloc
+from functools import wraps
+
+# Spans: wall time, rows processed and peak allocation of a block of code, each
+# emitted as one JSON log line. Off by default: span() then hands back a shared
+# no-op and @traced functions pay a single flag check per call.
+#   STOCKS_TRACE=1          log every span (time and rows)
+#   STOCKS_TRACE=memory     also trace allocations for per-span peak memory (slower)
+#   STOCKS_TRACE_LOG=<path> append the JSON lines to a file instead of stderr
+# app.py's debug panel collects the spans of one rerun with start_collecting(),
+# which works with STOCKS_TRACE off. Peak memory is only recorded while
+# tracemalloc is tracing; it is process-wide, so spans running at the same time
+# in other threads (other Streamlit sessions) add to it.
+
+TRACE = os.environ.get("STOCKS_TRACE", "").lower()
+ENABLED = TRACE not in ("", "0", "false", "off")
+LOG_PATH = os.environ.get("STOCKS_TRACE_LOG")
+
+logger = logging.getLogger("stocks.trace")
+
+
+class _ThreadState(threading.local):
+    # Class defaults keep the disabled-path lookup cheap (no AttributeError)
+    stack = None
+    records = None
+
+
+_local = _ThreadState()
+
+
+def _configure_logger():
+    if logger.handlers:
+        return
+    handler = logging.FileHandler(LOG_PATH) if LOG_PATH else logging.StreamHandler(sys.stderr)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+if ENABLED:
+    _configure_logger()
+    if TRACE == "memory" and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def _stack():
+    stack = _local.stack
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def _fold_peak(spans):
+    # tracemalloc keeps one peak per process: hand it to every open span, then
+    # reset it so the next span starts from the current allocation
+    current, peak = tracemalloc.get_traced_memory()
+    for s in spans:
+        if s.peak is not None:
+            s.peak = max(s.peak, peak)
+    tracemalloc.reset_peak()
+    return current
+
+
+def _emit(record):
+    if ENABLED:
+        logger.info(json.dumps(record, default=str))
+    if _local.records is not None:
+        _local.records.append(record)
+
+
+class Span:
+    # with span("name") as s: ...; s.rows = len(frame)
+    def __init__(self, name, rows=None, fields=None):
+        self.name = name
+        self.rows = rows
+        self.fields = fields or {}
+        self.base = self.peak = None
+
+    def annotate(self, **fields):
+        self.fields.update(fields)
+
+    def __enter__(self):
+        stack = _stack()
+        self.parent = stack[-1].name if stack else None
+        self.depth = len(stack)
+        if tracemalloc.is_tracing():
+            self.base = self.peak = _fold_peak(stack)
+        stack.append(self)
+        self.ts = time.time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self.start
+        stack = _stack()
+        record = {"span": self.name, "parent": self.parent, "depth": self.depth, "ts": round(self.ts, 6),
+                  "seconds": round(seconds, 6), "rows": self.rows}
+        if self.base is not None and tracemalloc.is_tracing():
+            _fold_peak(stack)
+            record["peak_mb"] = round((self.peak - self.base) / 2**20, 3)
+        if exc_type is not None:
+            record["error"] = exc_type.__name__
+        record.update(self.fields)
+        stack.pop()
+        _emit(record)
+        return False
+
+
+class _NoopSpan:
+    rows = None
+
+    def annotate(self, **fields):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+def active():
+    return ENABLED or _local.records is not None
+
+
+def span(name, rows=None, **fields):
+    if not active():
+        return _NOOP
+    return Span(name, rows, fields)
+
+
+def _rows(args, result):
+    # Rows processed: the first frame-like argument, else the frame returned
+    for value in (*args, result):
+        shape = getattr(value, "shape", None)
+        if shape:
+            return int(shape[0])
+    return None
+
+
+def traced(name=None):
+    # Decorator: one span per call, named module.function unless given
+    def decorate(func):
+        label = name or f"{func.__module__}.{func.__qualname__}"
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not active():
+                return func(*args, **kwargs)
+            with Span(label) as s:
+                result = func(*args, **kwargs)
+                s.rows = _rows(args, result)
+            return result
+        return wrapper
+    return decorate
+
+
+def start_collecting():
+    # Keep this thread's finished spans (also with STOCKS_TRACE off) in the
+    # returned list until stop_collecting()
+    _local.records = []
+    return _local.records
+
+
+def stop_collecting():
+    records = _local.records or []
+    _local.records = None
+    return records
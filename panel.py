@@ -0,0 +1,150 @@
+import os
+import time
+import shutil
+import numpy as np
+import pandas as pd
+
+# Dense OHLCV panel built from the cleaned master: one (ticker x date) float64
+# .npy file per field plus ticker/date sidecars. Readers np.load them with
+# mmap_mode='r', so every process shares the same page-cache copy and a
+# close-price "pivot" is a view instead of a fresh df.pivot().
+#
+# Every build writes a new version directory (price_panel/v<ns>/) and then
+# atomically replaces the CURRENT pointer file naming it, so there is never a
+# moment without a panel and no file a reader has mapped is ever overwritten.
+# Older versions are removed once they are neither current nor the one just
+# replaced; a version still mapped on Windows is left for a later build.
+PANEL_DIR = "price_panel"
+POINTER = "CURRENT"
+FIELDS = ['open', 'high', 'low', 'close', 'volume']
+
+
+def _positions(df, tickers, dates):
+    ticker_idx = np.searchsorted(tickers, df['ticker'].to_numpy().astype(str))
+    date_idx = np.searchsorted(dates, df['date'].to_numpy().astype('datetime64[ns]'))
+    return ticker_idx, date_idx
+
+
+def panel_version(panel_dir=PANEL_DIR):
+    # Name of the current version directory, "" for a panel written before
+    # versioning (files directly in panel_dir), None when there is no panel
+    try:
+        with open(os.path.join(panel_dir, POINTER)) as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return "" if os.path.exists(os.path.join(panel_dir, "close.npy")) else None
+
+
+def _remove_old_versions(panel_dir, keep):
+    for name in os.listdir(panel_dir):
+        path = os.path.join(panel_dir, name)
+        if name in keep:
+            continue
+        try:
+            if name.startswith("v") and os.path.isdir(path):
+                shutil.rmtree(path)
+            elif name.endswith(".npy"):
+                os.remove(path)   # unversioned panel files
+        except OSError:
+            pass   # still memory-mapped somewhere (Windows); retried on the next build
+
+
+def _write_panel(panel_dir, tickers, dates, fill):
+    # fill(field, out) writes one (ticker x date) field into the mapped output
+    previous = panel_version(panel_dir)
+    version = f"v{time.time_ns()}"
+    version_dir = os.path.join(panel_dir, version)
+    os.makedirs(version_dir)
+    np.save(os.path.join(version_dir, "tickers.npy"), tickers)
+    np.save(os.path.join(version_dir, "dates.npy"), dates)
+    for field in FIELDS:
+        arr = np.lib.format.open_memmap(os.path.join(version_dir, f"{field}.npy"), mode='w+',
+                                        dtype='float64', shape=(len(tickers), len(dates)))
+        fill(field, arr)
+        arr.flush()
+        del arr
+
+    pointer = os.path.join(panel_dir, POINTER)
+    with open(pointer + ".tmp", "w") as f:
+        f.write(version)
+    os.replace(pointer + ".tmp", pointer)
+    # Keep the version just replaced: a reader may have resolved the pointer
+    # an instant before the swap and not mapped its files yet
+    _remove_old_versions(panel_dir, {version, previous, POINTER})
+
+
+def build_panel(df, panel_dir=PANEL_DIR):
+    tickers = np.sort(df['ticker'].unique()).astype(str)
+    dates = np.sort(df['date'].unique()).astype('datetime64[ns]')
+    ticker_idx, date_idx = _positions(df, tickers, dates)
+
+    def fill(field, out):
+        out[:] = np.nan
+        out[ticker_idx, date_idx] = df[field].to_numpy(dtype='float64')
+
+    _write_panel(panel_dir, tickers, dates, fill)
+
+
+def update_panel(df, months, panel_dir=PANEL_DIR):
+    # Replaces the given months (pd.Period, freq M) with the rows of `df`, which
+    # must hold every row of those months; all other dates are copied from the
+    # current panel, so the full master never has to be loaded. The copy is
+    # still O(tickers x dates): the fields are ticker-major, so new dates widen
+    # every row and the files can't be appended to in place. Tickers left
+    # without any price are dropped, as build_panel would. Returns False when
+    # there is no panel yet (build_panel the full frame instead).
+    old = open_panel(panel_dir)
+    if old is None:
+        return False
+    kept = ~old.dates.to_period('M').isin(list(months))
+    has_data = np.isfinite(old.fields['close'][:, kept]).any(axis=1)
+    old_tickers = old.tickers.to_numpy().astype(str)[has_data]
+    old_dates = old.dates[kept].to_numpy().astype('datetime64[ns]')
+    tickers = np.union1d(old_tickers, np.asarray(df['ticker'].unique()).astype(str))
+    dates = np.union1d(old_dates, np.asarray(df['date'].unique()).astype('datetime64[ns]'))
+    old_rows = np.searchsorted(tickers, old_tickers)
+    old_cols = np.searchsorted(dates, old_dates)
+    ticker_idx, date_idx = _positions(df, tickers, dates)
+
+    def fill(field, out):
+        out[:] = np.nan
+        out[np.ix_(old_rows, old_cols)] = old.fields[field][np.ix_(has_data, kept)]
+        out[ticker_idx, date_idx] = df[field].to_numpy(dtype='float64')
+
+    _write_panel(panel_dir, tickers, dates, fill)
+    return True
+
+
+class PricePanel:
+    def __init__(self, panel_dir=PANEL_DIR, version=""):
+        self.version = version
+        panel_dir = os.path.join(panel_dir, version)
+        self.tickers = pd.Index(np.load(os.path.join(panel_dir, "tickers.npy")), name='ticker')
+        self.dates = pd.DatetimeIndex(np.load(os.path.join(panel_dir, "dates.npy")), name='date')
+        self.fields = {field: np.load(os.path.join(panel_dir, f"{field}.npy"), mmap_mode='r')
+                       for field in FIELDS}
+
+    def frame(self, field='close', tickers=None, start=None, end=None):
+        # Same shape as df.pivot(index='date', columns='ticker', values=field).
+        # A date window over all tickers is a zero-copy view of the mapped file;
+        # a ticker subset copies only the selected rows.
+        arr = self.fields[field]
+        dates = self.dates
+        lo = 0 if start is None else dates.searchsorted(pd.Timestamp(start), side='left')
+        hi = len(dates) if end is None else dates.searchsorted(pd.Timestamp(end), side='right')
+        arr = arr[:, lo:hi]
+        columns = self.tickers
+        if tickers is not None:
+            columns = self.tickers[self.tickers.isin(list(tickers))]
+            arr = arr[self.tickers.get_indexer(columns)]
+        # Stored ticker-major, so the transpose is exactly pandas' block layout
+        return pd.DataFrame(arr.T, index=dates[lo:hi], columns=columns, copy=False)
+
+
+def open_panel(panel_dir=PANEL_DIR):
+    # Maps the current version; None when no panel has been built yet
+    # (callers then pivot the long frame)
+    version = panel_version(panel_dir)
+    if version is None:
+        return None
+    return PricePanel(panel_dir, version)
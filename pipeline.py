@@ -0,0 +1,299 @@
+import os
+import ast
+import sys
+import json
+import time
+import hashlib
+import inspect
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+
+import store
+from instrument import span
+from panel import PANEL_DIR, POINTER, FIELDS
+from features import SECTOR_CSV, load_sector_map, return_features, close_correlation
+
+# One entry point for ingest -> clean -> features -> exports. Every stage has a
+# key: a content hash of its input files, its own code and config, and the keys
+# of the stages it depends on. A stage whose key matches the last run is not
+# executed: data stages reload their pickled output from CACHE_DIR (only if a
+# later stage needs it), export stages are skipped while their files exist.
+# Stages whose dependencies are ready run side by side in a thread pool.
+# Input files are read once: CACHE_DIR/fingerprints.json keeps each file's
+# content hash with its size and mtime, and it is only rehashed when those change.
+
+CACHE_DIR = ".pipeline_cache"
+WORKERS = int(os.environ.get("PIPELINE_WORKERS", "4"))
+HERE = os.path.dirname(os.path.abspath(__file__))   # code inputs live next to this file
+
+
+def fingerprint(path):
+    # Content hash of a file, or of every file under a directory
+    if os.path.isfile(path):
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        return h.hexdigest()
+    if os.path.isdir(path):
+        h = hashlib.sha256()
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                full = os.path.join(root, name)
+                h.update(os.path.relpath(full, path).encode())
+                h.update(fingerprint(full).encode())
+        return h.hexdigest()
+    return "missing"
+
+
+class FingerprintCache:
+    # fingerprint() with a per-file (size, mtime_ns) -> content hash memo, so a
+    # cached re-run stats its inputs instead of reading the whole history.
+    # Gives the same values as fingerprint(); Pipeline.run saves it to `path`.
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.entries = json.load(f)
+
+    def _file(self, path):
+        st = os.stat(path)
+        key = os.path.abspath(path)
+        entry = self.entries.get(key)
+        if entry is None or entry[:2] != [st.st_size, st.st_mtime_ns]:
+            entry = [st.st_size, st.st_mtime_ns, fingerprint(path)]
+            self.entries[key] = entry
+        return entry[2]
+
+    def __call__(self, path):
+        if os.path.isfile(path):
+            return self._file(path)
+        if os.path.isdir(path):
+            h = hashlib.sha256()
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    full = os.path.join(root, name)
+                    h.update(os.path.relpath(full, path).encode())
+                    h.update(self._file(full).encode())
+            return h.hexdigest()
+        return "missing"
+
+    def save(self):
+        # Files that no longer exist drop out
+        self.entries = {p: e for p, e in self.entries.items() if os.path.exists(p)}
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path + ".tmp", "w") as f:
+            json.dump(self.entries, f)
+        os.replace(self.path + ".tmp", self.path)
+
+
+def code(*names):
+    # The given module files plus every module of this project they import,
+    # directly or through each other, so a stage's key covers its whole code path
+    files, todo = set(), list(names)
+    while todo:
+        path = os.path.join(HERE, todo.pop())
+        if path in files or not os.path.isfile(path):
+            continue
+        files.add(path)
+        with open(path) as f:
+            tree = ast.parse(f.read())
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                todo += [alias.name.split(".")[0] + ".py" for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                todo.append(node.module.split(".")[0] + ".py")
+    return sorted(files)
+
+
+class Stage:
+    # func(*outputs of deps) -> output. Data stages return a picklable value;
+    # export stages (export=True) write files and return their paths.
+    def __init__(self, name, func, deps=(), inputs=(), config=None, export=False):
+        self.name = name
+        self.func = func
+        self.deps = list(deps)
+        self.inputs = list(inputs)
+        self.config = config or {}
+        self.export = export
+
+    def key(self, dep_keys, fingerprint=fingerprint):
+        h = hashlib.sha256(self.name.encode())
+        h.update(inspect.getsource(self.func).encode())
+        h.update(json.dumps(self.config, sort_keys=True, default=str).encode())
+        for path in self.inputs:
+            h.update(f"{path}={fingerprint(path)}".encode())
+        for dep in self.deps:
+            h.update(f"{dep}={dep_keys[dep]}".encode())
+        return h.hexdigest()
+
+
+class Pipeline:
+    def __init__(self, stages, cache_dir=CACHE_DIR, workers=WORKERS):
+        self.stages = {s.name: s for s in stages}
+        self.cache_dir = cache_dir
+        self.workers = workers
+        self.keys = {}
+        self.outputs = {}
+        self.report = []
+        self.fingerprints = FingerprintCache(os.path.join(cache_dir, "fingerprints.json"))
+
+    def _cache_path(self, stage, key):
+        return os.path.join(self.cache_dir, f"{stage.name}-{key[:16]}.pkl")
+
+    def _marker_path(self, stage):
+        return os.path.join(self.cache_dir, f"{stage.name}.json")
+
+    def _is_cached(self, stage, key):
+        if stage.export:
+            marker = self._marker_path(stage)
+            if not os.path.exists(marker):
+                return False
+            with open(marker) as f:
+                done = json.load(f)
+            return done.get("key") == key and all(os.path.exists(p) for p in done.get("paths", []))
+        return os.path.exists(self._cache_path(stage, key))
+
+    def _store(self, stage, key, output):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        if stage.export:
+            path = self._marker_path(stage)
+            with open(path + ".tmp", "w") as f:
+                json.dump({"key": key, "paths": list(output or [])}, f)
+        else:
+            path = self._cache_path(stage, key)
+            pd.to_pickle(output, path + ".tmp")
+        os.replace(path + ".tmp", path)
+        # Keep only the newest cached output of each data stage
+        for name in os.listdir(self.cache_dir):
+            if name.startswith(f"{stage.name}-") and name.endswith(".pkl") and \
+                    os.path.join(self.cache_dir, name) != self._cache_path(stage, key):
+                os.remove(os.path.join(self.cache_dir, name))
+
+    def _output(self, name):
+        # Output of an upstream stage: computed this run, else loaded from cache
+        if name not in self.outputs:
+            stage = self.stages[name]
+            self.outputs[name] = pd.read_pickle(self._cache_path(stage, self.keys[name]))
+        return self.outputs[name]
+
+    def _run_stage(self, name):
+        stage = self.stages[name]
+        start = time.perf_counter()
+        with span(f"pipeline.{name}"):
+            output = stage.func(*(self._output(d) for d in stage.deps))
+        self._store(stage, self.keys[name], output)
+        if not stage.export:
+            self.outputs[name] = output
+        return time.perf_counter() - start
+
+    def _needed(self, targets):
+        # Targets plus everything upstream of them, in dependency order
+        order, seen = [], set()
+
+        def visit(name):
+            if name in seen:
+                return
+            seen.add(name)
+            for dep in self.stages[name].deps:
+                visit(dep)
+            order.append(name)
+
+        for name in targets:
+            visit(name)
+        return order
+
+    def run(self, targets=None, force=False):
+        targets = targets or [s.name for s in self.stages.values() if s.export]
+        order = self._needed(targets)
+        # A stage runs when its key changed; downstream keys then change too,
+        # so stale work never hides behind a cache hit
+        done = set()
+        while len(done) < len(order):
+            wave = [n for n in order if n not in done and all(d in done for d in self.stages[n].deps)]
+            todo = []
+            for name in wave:
+                self.keys[name] = self.stages[name].key(self.keys, self.fingerprints)
+                if force or not self._is_cached(self.stages[name], self.keys[name]):
+                    todo.append(name)
+                else:
+                    self.report.append((name, "cached", 0.0))
+            # Upstream outputs the wave needs are loaded before fanning out
+            for name in todo:
+                for dep in self.stages[name].deps:
+                    self._output(dep)
+            with ThreadPoolExecutor(max_workers=max(1, min(self.workers, len(todo) or 1))) as pool:
+                for name, elapsed in zip(todo, pool.map(self._run_stage, todo)):
+                    self.report.append((name, "ran", elapsed))
+            done.update(wave)
+        self.fingerprints.save()
+        for name, status, elapsed in self.report:
+            print(f"   {name:<16} {status:<7} {elapsed:6.2f}s")
+        return self.report
+
+
+def default_stages():
+    # Imported here so `python pipeline.py` only pays for what it uses
+    import ingest
+    import powerBI_data
+    import xl_combine
+
+    def run_ingest():
+        # Incremental YAML -> master (store and panel); files only
+        ingest.run_incremental()
+        return True
+
+    def clean(*_):
+        return store.load_master(csv_path=ingest.MASTER_CSV)
+
+    def sector_map():
+        return load_sector_map(SECTOR_CSV)
+
+    def returns(df, sectors):
+        return return_features(df, sectors)
+
+    def correlation(df):
+        return close_correlation(df)
+
+    def export_powerbi(returns_out, corr):
+        return powerBI_data.export({**returns_out, 'corr': corr})
+
+    def export_excel(returns_out, corr):
+        return xl_combine.export({**returns_out, 'corr': corr})
+
+    stages = []
+    master_inputs = [store.STORE_DIR, ingest.MASTER_CSV]
+    # Panel versions are never rewritten in place, so the CURRENT pointer names
+    # the content; the files of a panel written before versioning are hashed
+    # themselves (both are "missing" when absent)
+    panel_inputs = [os.path.join(PANEL_DIR, name) for name in
+                    [POINTER, "tickers.npy", "dates.npy"] + [f"{field}.npy" for field in FIELDS]]
+    if os.path.isdir(ingest.INPUT_DIR):
+        stages.append(Stage("ingest", run_ingest, inputs=[ingest.INPUT_DIR] + code("ingest.py")))
+    stages += [
+        Stage("clean", clean, deps=[s.name for s in stages], inputs=master_inputs + code("store.py")),
+        Stage("sector_map", sector_map, inputs=[SECTOR_CSV] + code("features.py")),
+        Stage("returns", returns, deps=["clean", "sector_map"], inputs=code("features.py")),
+        Stage("correlation", correlation, deps=["clean"], inputs=panel_inputs + code("features.py")),
+        Stage("export_powerbi", export_powerbi, deps=["returns", "correlation"], export=True,
+              inputs=code("powerBI_data.py"),
+              config={"mode": powerBI_data.EXPORT_MODE, "flat_partition_by_month": powerBI_data.FLAT_PARTITION_BY_MONTH}),
+        Stage("export_excel", export_excel, deps=["returns", "correlation"], export=True,
+              inputs=code("xl_combine.py"), config={"mode": xl_combine.EXPORT_MODE}),
+    ]
+    return stages
+
+
+if __name__ == '__main__':
+    # python pipeline.py [stage ...] [--force]
+    args = [a for a in sys.argv[1:] if a != "--force"]
+    pipeline = Pipeline(default_stages())
+    unknown = [a for a in args if a not in pipeline.stages]
+    if unknown:
+        sys.exit(f"Unknown stage(s): {', '.join(unknown)}. Choose from: {', '.join(pipeline.stages)}")
+    start = time.perf_counter()
+    pipeline.run(args or None, force="--force" in sys.argv)
+    print(f"✅ Pipeline finished in {time.perf_counter() - start:.2f}s")
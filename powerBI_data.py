@@ -1,61 +1,229 @@
 import pandas as pd
 import numpy as np
 import os
+import json
+import shutil
+import hashlib
+
+from store import load_master
+from features import load_sector_map, build_features, flat_analytics
+from instrument import traced
 
 # File paths
 master_csv = "cleaned_master_stock_data.csv"
 sector_csv = "Sector_data - Sheet1.csv"
 analytics_csv = "nifty50_master_analytics.csv"
 corr_csv = "nifty50_correlation_matrix.csv"
+star_dir = "powerbi_star"
+flat_dir = "powerbi_flat"
+
+# Export mode
+#   "flat": denormalized analytics CSV (per-ticker stats repeated on every
+#           daily row) plus the square correlation matrix CSV
+#   "star": compressed Parquet star schema in star_dir/ (needs pyarrow):
+#           fact_daily, fact_monthly, dim_ticker, dim_month, ticker_stats, correlation
+EXPORT_MODE = "flat"
+PARQUET_COMPRESSION = "zstd"
+# Star mode: one fact_daily / fact_monthly file per month (fact_daily/month=2024-01.parquet).
+# star_dir/manifest.json records every file's row count and content hash, and a
+# file is only rewritten when its hash changes, so Power BI incremental refresh
+# reloads just the new or restated months
+PARTITION_BY_MONTH = True
+# Flat mode, opt-in: the analytics CSV as one file per month in flat_dir/
+# (analytics/month=2024-01.csv) under the same kind of manifest. yearly_return
+# and volatility move to flat_dir/ticker_stats.csv (join on ticker), and the
+# matrix to flat_dir/correlation_matrix.csv. Only one layout exists at a time:
+# switching deletes the other one, so a report left on it fails instead of
+# reading stale files. False (default) writes analytics_csv and corr_csv.
+FLAT_PARTITION_BY_MONTH = False
+MANIFEST_NAME = "manifest.json"
+
+
+def frame_hash(df):
+    # Content hash of a table: column names, dtypes and every value
+    h = hashlib.sha256(json.dumps([list(map(str, df.columns)), list(map(str, df.dtypes))]).encode())
+    h.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+def write_outputs(outputs, out_dir=star_dir):
+    # Write {relative path: frame} as Parquet or CSV (by extension), skipping
+    # files whose content hash matches the manifest, and drop files that are no
+    # longer produced. Returns (manifest, paths written).
+    manifest_path = os.path.join(out_dir, MANIFEST_NAME)
+    previous = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            previous = json.load(f)
+
+    manifest, written = {}, []
+    for rel, table in outputs.items():
+        digest = frame_hash(table)
+        path = os.path.join(out_dir, rel)
+        manifest[rel] = {"rows": len(table), "sha256": digest}
+        if previous.get(rel, {}).get("sha256") == digest and os.path.exists(path):
+            continue
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if rel.endswith(".csv"):
+            table.to_csv(path + ".tmp", index=False)
+        else:
+            table.to_parquet(path + ".tmp", index=False, compression=PARQUET_COMPRESSION)
+        os.replace(path + ".tmp", path)
+        written.append(rel)
+    for rel in set(previous) - set(manifest):
+        if os.path.exists(os.path.join(out_dir, rel)):
+            os.remove(os.path.join(out_dir, rel))
+
+    with open(manifest_path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(manifest_path + ".tmp", manifest_path)
+    return manifest, written
+
+
+def ticker_ids(tickers, out_dir=star_dir):
+    # Keep the ids of the previous dim_ticker so unchanged partitions hash the
+    # same; tickers seen for the first time get the next free ids
+    path = os.path.join(out_dir, "dim_ticker.parquet")
+    known = pd.Series(dtype='int32')
+    if os.path.exists(path):
+        previous = pd.read_parquet(path, columns=['ticker_id', 'ticker'])
+        known = pd.Series(previous['ticker_id'].to_numpy(dtype='int32'), index=previous['ticker'])
+    new = [t for t in tickers if t not in known.index]
+    start = int(known.max()) + 1 if len(known) else 1
+    ids = pd.concat([known, pd.Series(np.arange(start, start + len(new), dtype='int32'), index=new)])
+    return ids.reindex(tickers).astype('int32').rename_axis('ticker')
+
+
+def write_star_schema(features, out_dir=star_dir, partition_by_month=PARTITION_BY_MONTH):
+    # Per-ticker and per-month values are stored once and joined in Power BI on
+    # integer keys (ticker_id, month_id = yyyymm) instead of repeated on every row
+    os.makedirs(out_dir, exist_ok=True)
+    daily = features['daily']
+    tickers = pd.Index(sorted(daily['ticker'].unique()), name='ticker')
+    ticker_id = ticker_ids(tickers, out_dir)
+
+    dim_ticker = pd.DataFrame({'ticker_id': ticker_id.to_numpy(), 'ticker': tickers})
+    dim_ticker = dim_ticker.merge(daily[['ticker', 'sector']].drop_duplicates('ticker'), on='ticker', how='left')
+
+    df = features['daily']
+    months = pd.period_range(df['date'].min(), df['date'].max(), freq='M')
+    dim_month = pd.DataFrame({'month_id': (months.year * 100 + months.month).astype('int32'),
+                              'month': months.astype(str), 'year': months.year.astype('int16'),
+                              'month_number': months.month.astype('int8'), 'month_start': months.start_time})
+
+    fact_daily = pd.DataFrame({
+        'date': df['date'].to_numpy(),
+        'ticker_id': df['ticker'].map(ticker_id).to_numpy(),
+        'month_id': (df['date'].dt.year * 100 + df['date'].dt.month).astype('int32').to_numpy(),
+    })
+    for col in ['open', 'high', 'low', 'close', 'volume', 'daily_return', 'cumulative_return']:
+        fact_daily[col] = df[col].to_numpy()
+
+    monthly_return = features['monthly']
+    fact_monthly = pd.DataFrame({
+        'ticker_id': monthly_return['ticker'].map(ticker_id).to_numpy(),
+        'month_id': (monthly_return['month'].dt.year * 100 + monthly_return['month'].dt.month).astype('int32').to_numpy(),
+        'monthly_return': monthly_return['monthly_return'].to_numpy(),
+    })
+    stats = features['ticker_stats'].set_index('ticker').reindex(tickers)
+    ticker_stats = pd.DataFrame({'ticker_id': ticker_id.to_numpy(),
+                                 'yearly_return': stats['yearly_return'].to_numpy(),
+                                 'volatility': stats['volatility'].to_numpy()})
+
+    # Long (ticker_id_a, ticker_id_b, corr) table, both directions, no empty pairs
+    long_corr = features['corr'].rename_axis(index='ticker_a', columns='ticker_b').stack().rename('corr').reset_index()
+    correlation = pd.DataFrame({'ticker_id_a': long_corr['ticker_a'].map(ticker_id).to_numpy(),
+                                'ticker_id_b': long_corr['ticker_b'].map(ticker_id).to_numpy(),
+                                'corr': long_corr['corr'].to_numpy()}).dropna()
+
+    tables = {'fact_daily': fact_daily, 'fact_monthly': fact_monthly, 'dim_ticker': dim_ticker,
+              'dim_month': dim_month, 'ticker_stats': ticker_stats, 'correlation': correlation}
+    outputs = {}
+    for name, table in tables.items():
+        if partition_by_month and name.startswith('fact_'):
+            for month_id, part in table.groupby('month_id', sort=True):
+                outputs[f"{name}/month={month_id // 100:04d}-{month_id % 100:02d}.parquet"] = part.reset_index(drop=True)
+        else:
+            outputs[f"{name}.parquet"] = table
+    manifest, written = write_outputs(outputs, out_dir)
+    return tables, manifest, written
+
+
+def write_flat_partitions(features, out_dir=flat_dir):
+    # The flat analytics split into one CSV per month, plus the correlation
+    # matrix laid out like corr.to_csv, through the manifest. yearly_return and
+    # volatility cover a ticker's whole history, so repeated on every row they
+    # would change every month file on each new day: they go to
+    # ticker_stats.csv instead (joined on ticker)
+    os.makedirs(out_dir, exist_ok=True)
+    stats = ['yearly_return', 'volatility']
+    analytics = flat_analytics(features).drop(columns=stats)
+    corr = features['corr']
+    outputs = {f"analytics/month={month}.csv": part.reset_index(drop=True)
+               for month, part in analytics.groupby('month', sort=True)}
+    outputs["ticker_stats.csv"] = features['ticker_stats'][['ticker'] + stats].reset_index(drop=True)
+    outputs["correlation_matrix.csv"] = corr.rename_axis(corr.index.name or '').reset_index()
+    manifest, written = write_outputs(outputs, out_dir)
+    return analytics, manifest, written
+
+
+@traced()
+def export_flat(features, analytics_csv=analytics_csv, corr_csv=corr_csv, out_dir=flat_dir,
+                partition_by_month=FLAT_PARTITION_BY_MONTH):
+    # Master analytics (per-ticker stats mapped onto every row) and the square
+    # correlation matrix as the two single CSVs, or per-month files plus
+    # ticker_stats.csv in out_dir/ (the other layout is deleted)
+    if partition_by_month:
+        for file in [analytics_csv, corr_csv]:
+            if os.path.exists(file):
+                os.remove(file)
+                print(f"Deleted single-file output {file}: the analytics are now in {out_dir}/")
+        analytics, manifest, written = write_flat_partitions(features, out_dir)
+        print(f"✅ Master analytics CSVs ready in {out_dir}/analytics/ ({len(analytics)} rows), "
+              f"with {out_dir}/ticker_stats.csv and {out_dir}/correlation_matrix.csv")
+        print(f"   {len(written)} of {len(manifest)} files rewritten"
+              + (f": {', '.join(sorted(written))}" if len(written) <= 10 else ""))
+        return [os.path.join(out_dir, rel) for rel in manifest]
+
+    if os.path.isdir(out_dir):
+        shutil.rmtree(out_dir)
+        print(f"Deleted partitioned output {out_dir}/: the analytics are now in {analytics_csv}")
+    flat_analytics(features).to_csv(analytics_csv, index=False)
+    print(f"✅ Master analytics CSV ready: {analytics_csv}")
+    features['corr'].to_csv(corr_csv)
+    print(f"✅ Correlation matrix CSV ready: {corr_csv}")
+    return [analytics_csv, corr_csv]
+
+
+@traced()
+def export_star(features, out_dir=star_dir):
+    tables, manifest, written = write_star_schema(features, out_dir)
+    print(f"✅ Power BI star schema ready in {out_dir}/: "
+          + ", ".join(f"{name} ({len(tables[name])} rows)" for name in tables))
+    print(f"   {len(written)} of {len(manifest)} files rewritten"
+          + (f": {', '.join(sorted(written))}" if len(written) <= 10 else ""))
+    return [os.path.join(out_dir, rel) for rel in manifest]
+
+
+def export(features, mode=EXPORT_MODE):
+    # Returns the paths written (pipeline.py checks they still exist)
+    return export_star(features) if mode == "star" else export_flat(features)
+
+
+if __name__ == '__main__':
+    # 1. Remove previous outputs if they exist (to avoid duplication)
+    for file in [analytics_csv, corr_csv] if EXPORT_MODE == "flat" else []:
+        if os.path.exists(file):
+            os.remove(file)
+            print(f"Deleted existing file: {file}")
+
+    # 2. Load master data and sector map
+    df = load_master(csv_path=master_csv)
+    sector_map = load_sector_map(sector_csv)
+
+    # 3. Sector, daily/cumulative returns, yearly return and volatility, monthly
+    #    return and the closing-price correlation (features.py)
+    features = build_features(df, sector_map)
 
-# 1. Remove previous outputs if they exist (to avoid duplication)
-for file in [analytics_csv, corr_csv]:
-    if os.path.exists(file):
-        os.remove(file)
-        print(f"Deleted existing file: {file}")
-
-# 2. Load master data and sector map
-df = pd.read_csv(master_csv, parse_dates=["date"])
-sector_map = pd.read_csv(sector_csv)
-sector_map['ticker'] = sector_map['Symbol'].apply(lambda x: x.split(': ')[-1])
-sector_map = sector_map[['ticker', 'sector']]
-
-# 3. Merge sector info
-df = df.merge(sector_map, on="ticker", how="left")
-
-# 4. Compute daily return per ticker
-df['daily_return'] = df.groupby('ticker')['close'].pct_change()
-
-# 5. Compute cumulative return per ticker
-df['cumulative_return'] = df.groupby('ticker')['daily_return'].transform(lambda x: (1 + x.fillna(0)).cumprod() - 1)
-
-# 6. Compute yearly return and volatility for each ticker
-def get_yearly_return(x):
-    if len(x) < 2:
-        return np.nan
-    return (x.iloc[-1] - x.iloc[0]) / x.iloc[0]
-
-yearly_return = df.groupby('ticker')['close'].apply(get_yearly_return)
-volatility = df.groupby('ticker')['daily_return'].std()
-
-# 7. Map yearly return and volatility to all rows of that ticker
-df['yearly_return'] = df['ticker'].map(yearly_return) * 100  # as percent
-df['volatility'] = df['ticker'].map(volatility)
-
-# 8. Compute monthly return (per month per ticker)
-df['month'] = df['date'].dt.to_period('M')
-monthly_first = df.groupby(['ticker', 'month'])['close'].first()
-monthly_last = df.groupby(['ticker', 'month'])['close'].last()
-monthly_return = ((monthly_last - monthly_first) / monthly_first).rename('monthly_return')
-monthly_return = (monthly_return * 100).reset_index()
-df = pd.merge(df, monthly_return, on=['ticker', 'month'], how='left')
-
-# 9. Save master analytics file (overwrite old if exists)
-df.to_csv(analytics_csv, index=False)
-print(f"✅ Master analytics CSV ready: {analytics_csv}")
-
-# 10. Save correlation matrix (closing price)
-close_pivot = df.pivot(index="date", columns="ticker", values="close")
-corr = close_pivot.corr()
-corr.to_csv(corr_csv)
-print(f"✅ Correlation matrix CSV ready: {corr_csv}")
+    # 4. Write the flat CSVs or the star schema
+    export(features)
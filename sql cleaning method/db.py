@@ -0,0 +1,170 @@
+import os
+import sys
+import time
+import threading
+import pandas as pd
+from sqlalchemy import create_engine, text, bindparam
+from urllib.parse import quote_plus
+
+# dashboard_cache.py lives in the project root, one level up
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+from dashboard_cache import LRUCache
+from store import STORE_DIR, has_store
+
+# Backend, chosen with STOCKS_DB_BACKEND:
+#   "mysql":  the MySQL server below
+#   "sqlite": an embedded database file (STOCKS_DB_PATH, default stocks.db)
+#   "duckdb": an embedded DuckDB file (default stocks.duckdb); stock_raw is a view
+#             over the Parquet master store, queried in place (needs duckdb_engine)
+BACKENDS = ("mysql", "sqlite", "duckdb")
+BACKEND = os.environ.get("STOCKS_DB_BACKEND", "mysql").lower()
+DB_PATH = os.environ.get("STOCKS_DB_PATH")
+DEFAULT_PATHS = {"sqlite": "stocks.db", "duckdb": "stocks.duckdb"}
+
+# Configure MySQL credentials
+DB_USER = "root"
+DB_PASS = quote_plus("Visagan@7")  # Encode special characters
+DB_HOST = "localhost"
+DB_PORT = 3306
+DB_NAME = "stocks_db"
+
+# Connection pool shared by every Streamlit session of the process
+POOL_SIZE = 5
+MAX_OVERFLOW = 10
+POOL_RECYCLE = 3600        # seconds, below MySQL's wait_timeout
+
+QUERY_CACHE_SIZE = 64      # cached result sets
+VERSION_TTL = 5.0          # seconds between data-version probes
+
+# loaded_files entry whose sha256 column holds a token that load.py rewrites
+# after every refresh; any change of it invalidates cached results
+REFRESH_KEY = ("__refresh__", "")
+PARQUET_KEY = ("__parquet__", "")      # Parquet store digest stock_raw last read (DuckDB)
+VERSION_SQL = "SELECT sha256 FROM loaded_files WHERE source_month = :m AND ticker = :t"
+# Databases loaded before loaded_files existed: fall back to the size of stock_clean
+FALLBACK_VERSION_SQL = "SELECT COUNT(*), MAX(trade_date) FROM stock_clean"
+
+
+def database_url(backend=BACKEND, path=DB_PATH):
+    if backend not in BACKENDS:
+        raise ValueError(f"STOCKS_DB_BACKEND must be one of {', '.join(BACKENDS)}, got {backend!r}")
+    if backend == "mysql":
+        return f"mysql+pymysql://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+    return f"{backend}:///{path or DEFAULT_PATHS[backend]}"
+
+
+def make_engine(url=None, **kwargs):
+    url = url or database_url()
+    if url.startswith("mysql"):
+        # pool_pre_ping replaces connections the server dropped while idle
+        kwargs = {"pool_size": POOL_SIZE, "max_overflow": MAX_OVERFLOW,
+                  "pool_recycle": POOL_RECYCLE, "pool_pre_ping": True, **kwargs}
+    return create_engine(url, **kwargs)
+
+
+def parquet_source(store_dir=STORE_DIR):
+    # DuckDB scan of the Parquet master store, shaped like stock_raw (absolute
+    # path, so the view works whatever directory the dashboards start in)
+    pattern = os.path.join(os.path.abspath(store_dir), "**", "*.parquet").replace("'", "''")
+    return (f"SELECT date, open, high, low, close, volume, ticker, strftime(date, '%Y-%m') AS source_month "
+            f"FROM read_parquet('{pattern}', hive_partitioning = true, union_by_name = true)")
+
+
+def relation_type(conn, name):
+    # "table", "view" or None for a relation in the current database/schema
+    if conn.dialect.name == "sqlite":
+        kind = conn.execute(text("SELECT type FROM sqlite_master WHERE name = :n AND type IN ('table', 'view')"),
+                            {"n": name}).scalar()
+    else:
+        schema = "DATABASE()" if conn.dialect.name == "mysql" else "current_schema()"
+        kind = conn.execute(text(f"SELECT table_type FROM information_schema.tables "
+                                 f"WHERE table_name = :n AND table_schema = {schema}"), {"n": name}).scalar()
+    if kind is None:
+        return None
+    return "view" if "VIEW" in kind.upper() else "table"
+
+
+def _forget_loaded_files(conn):
+    # The per-file load records and the Parquet store's record describe the
+    # stock_raw being dropped; the other bookkeeping entries stay
+    if relation_type(conn, "loaded_files") == "table":
+        conn.execute(text("DELETE FROM loaded_files WHERE SUBSTR(source_month, 1, 2) <> '__' "
+                          "OR (source_month = :m AND ticker = :t)"), {"m": PARQUET_KEY[0], "t": PARQUET_KEY[1]})
+
+
+def attach_parquet_store(engine, store_dir=STORE_DIR):
+    # On DuckDB, (re)define stock_raw as a view over the Parquet store so no
+    # copy is loaded; returns False on other backends or without a store. A
+    # stock_raw table loaded while there was no store is dropped first.
+    if engine.dialect.name != "duckdb" or not has_store(store_dir):
+        return False
+    with engine.begin() as conn:
+        if relation_type(conn, "stock_raw") == "table":
+            conn.execute(text("DROP TABLE stock_raw"))
+            _forget_loaded_files(conn)
+        conn.execute(text(f"CREATE OR REPLACE VIEW stock_raw AS {parquet_source(store_dir)}"))
+    return True
+
+
+def detach_parquet_store(conn):
+    # Back to a loaded stock_raw table (the store is gone, or another backend):
+    # drop a leftover view so the table, its unique index and a fresh set of
+    # load records can be created. Returns whether there was one.
+    if relation_type(conn, "stock_raw") != "view":
+        return False
+    conn.execute(text("DROP VIEW stock_raw"))
+    _forget_loaded_files(conn)
+    return True
+
+
+def statement(sql, params=None):
+    # List-valued parameters are rendered as IN (...) lists
+    stmt = text(sql)
+    expanding = [bindparam(name, expanding=True) for name, value in (params or {}).items() if isinstance(value, list)]
+    return stmt.bindparams(*expanding) if expanding else stmt
+
+
+def _freeze(params):
+    return tuple(sorted((k, tuple(v) if isinstance(v, list) else v) for k, v in (params or {}).items()))
+
+
+class QueryCache:
+    # Result sets keyed on (data version, SQL text, parameters). The version is
+    # a cheap probe re-run at most every `version_ttl` seconds, so a reload by
+    # load.py changes every key and stale entries simply age out of the LRU.
+    # Returned frames are shared between sessions: treat them as read-only.
+    def __init__(self, engine, maxsize=QUERY_CACHE_SIZE, version_ttl=VERSION_TTL):
+        self.engine = engine
+        self.cache = LRUCache(maxsize)
+        self.version_ttl = version_ttl
+        self._version = None
+        self._probed_at = None
+        self._lock = threading.Lock()
+
+    def probe_version(self):
+        with self.engine.connect() as conn:
+            try:
+                return conn.execute(text(VERSION_SQL), {"m": REFRESH_KEY[0], "t": REFRESH_KEY[1]}).scalar()
+            except Exception:
+                conn.rollback()
+                return tuple(conn.execute(text(FALLBACK_VERSION_SQL)).one())
+
+    def version(self):
+        now = time.monotonic()
+        with self._lock:
+            if self._probed_at is not None and now - self._probed_at < self.version_ttl:
+                return self._version
+        version = self.probe_version()
+        with self._lock:
+            self._version, self._probed_at = version, now
+        return version
+
+    def read_sql(self, sql, params=None):
+        key = (self.version(), sql, _freeze(params))
+        return self.cache.get_or_compute(
+            key, lambda: pd.read_sql(statement(sql, params), con=self.engine, params=params or {}))
+
+    def stats(self):
+        return self.cache.stats()
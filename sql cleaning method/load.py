@@ -1,60 +1,617 @@
 import os
+import json
+import time
+import uuid
+import hashlib
+import tempfile
+import numpy as np
 import pandas as pd
-from sqlalchemy import create_engine, text
-from urllib.parse import quote_plus
-
-# Configure MySQL credentials
-DB_USER = "root"
-DB_PASS = quote_plus("Visagan@7")  # Encode special characters
-DB_HOST = "localhost"
-DB_PORT = 3306
-DB_NAME = "stocks_db"
+from sqlalchemy import text, inspect
+from db import (PARQUET_KEY, REFRESH_KEY, STORE_DIR, attach_parquet_store, detach_parquet_store,
+                make_engine, relation_type, statement)
 
 # Define paths
 CSV_ROOT = "CSV_data"  # Monthly folders
 SECTOR_CSV = "data/Sector_data - Sheet1.csv"
 
-# Create SQLAlchemy engine
-engine = create_engine(f"mysql+pymysql://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}")
+# Load settings
+#   INCREMENTAL = True: only new/changed monthly files (by content hash) are upserted
+#   INCREMENTAL = False: stock_raw is rebuilt from every file
+INCREMENTAL = True
+# Bulk insert path for full loads
+#   "executemany": one executemany per chunk (pymysql rewrites it into multi-row INSERTs)
+#   "multi":       pandas multi-row INSERT ... VALUES (...), (...) statements
+#   "infile":      MySQL LOAD DATA LOCAL INFILE from a temporary CSV (server must allow local_infile)
+BULK_MODE = "executemany"
+CHUNK_SIZE = 10000        # rows per INSERT batch
+SQLITE_MAX_VARIABLES = 32766
+
+KEY_COLUMNS = ["ticker", "date"]
+SECTOR_FILE_KEY = ("__sector__", "")   # loaded_files entry for the sector CSV
+
+# Explicit DDL so (ticker, date) can carry a unique index (MySQL can't index TEXT).
+# {table} is stock_raw / loaded_files, or their _new staging copies on MySQL
+STOCK_RAW_DDL = """
+CREATE TABLE IF NOT EXISTS {table} (
+    date DATETIME,
+    open DOUBLE,
+    high DOUBLE,
+    low DOUBLE,
+    close DOUBLE,
+    volume BIGINT,
+    ticker VARCHAR(32),
+    source_month VARCHAR(16)
+)"""
+LOADED_FILES_DDL = """
+CREATE TABLE IF NOT EXISTS {table} (
+    source_month VARCHAR(16),
+    ticker VARCHAR(32),
+    sha256 CHAR(64),
+    n_rows BIGINT,
+    loaded_at DATETIME
+)"""
+
+
+def file_hash(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def list_monthly_csvs(csv_root=CSV_ROOT):
+    # (source_month, ticker, path) for every monthly per-ticker CSV
+    files = []
+    for month in os.listdir(csv_root):
+        month_path = os.path.join(csv_root, month)
+        if not os.path.isdir(month_path):
+            continue
+        for file in os.listdir(month_path):
+            if file.endswith(".csv"):
+                files.append((month, file.replace(".csv", ""), os.path.join(month_path, file)))
+    return files
+
+
+def read_monthly_csvs(csv_root=CSV_ROOT, files=None):
+    # All (or the given) monthly CSVs in one frame, tagged with ticker and source month
+    files = list_monthly_csvs(csv_root) if files is None else files
+    dataframes = []
+    for month, ticker, path in files:
+        df = pd.read_csv(path)
+        df["ticker"] = ticker
+        df["source_month"] = month
+        dataframes.append(df)
+
+    if not dataframes:
+        return pd.DataFrame(columns=["date", "open", "high", "low", "close", "volume", "ticker", "source_month"])
+    df = pd.concat(dataframes, ignore_index=True)
+    df["date"] = pd.to_datetime(df["date"])
+    print(f"📂 Read {len(dataframes)} files, {len(df)} rows from {csv_root}/")
+    return df
+
+
+RAW_COLUMNS = ["date", "open", "high", "low", "close", "volume", "ticker", "source_month"]
+RAW_INDEX = "ux_stock_raw_ticker_date"
+
+
+def _index_names(conn, table):
+    # Reflection doesn't work on DuckDB (duckdb_engine): ask its catalog instead
+    if conn.dialect.name == "duckdb":
+        return set(conn.execute(text("SELECT index_name FROM duckdb_indexes() WHERE table_name = :t"),
+                                {"t": table}).scalars())
+    return {ix["name"] for ix in inspect(conn).get_indexes(table)}
+
+
+def legacy_stock_raw(conn):
+    # True when stock_raw is a table that STOCK_RAW_DDL did not create: the
+    # original loader's to_sql table (TEXT ticker, which MySQL can't put a
+    # unique index on) or any other layout without the (ticker, date) index
+    if not inspect(conn).has_table("stock_raw"):
+        return False
+    columns = list(conn.execute(text("SELECT * FROM stock_raw LIMIT 0")).keys())
+    return columns != RAW_COLUMNS or RAW_INDEX not in _index_names(conn, "stock_raw")
+
+
+def _create_unique_index(conn, name, table, columns):
+    # MySQL has no CREATE INDEX IF NOT EXISTS: look the index up there instead
+    if conn.dialect.name == "mysql":
+        if name in _index_names(conn, table):
+            return
+        conn.execute(text(f"CREATE UNIQUE INDEX {name} ON {table} ({columns})"))
+    else:
+        conn.execute(text(f"CREATE UNIQUE INDEX IF NOT EXISTS {name} ON {table} ({columns})"))
+
+
+def ensure_tables(conn, raw=True, suffix=""):
+    # raw=False when stock_raw is a view over the Parquet store (DuckDB).
+    # suffix="_new" creates the MySQL staging tables; index names are per table
+    # there, so they keep the names the swapped-in tables must carry.
+    conn.execute(text(LOADED_FILES_DDL.format(table=f"loaded_files{suffix}")))
+    _create_unique_index(conn, "ux_loaded_files", f"loaded_files{suffix}", "source_month, ticker")
+    if raw:
+        conn.execute(text(STOCK_RAW_DDL.format(table=f"stock_raw{suffix}")))
+        _create_unique_index(conn, RAW_INDEX, f"stock_raw{suffix}", "ticker, date")
+
+
+def _upsert_rows(pd_table, conn, keys, data_iter, key_columns=KEY_COLUMNS):
+    # pandas to_sql `method`: INSERT ... ON DUPLICATE KEY UPDATE (MySQL) or
+    # INSERT ... ON CONFLICT DO UPDATE (SQLite/PostgreSQL), sent as one
+    # executemany; DuckDB upserts from a registered frame in one statement
+    rows = [dict(zip(keys, row)) for row in data_iter]
+    if not rows:
+        return
+    table = pd_table.table
+    updates = [k for k in keys if k not in key_columns]
+    if conn.dialect.name == "duckdb":
+        columns = ", ".join(f'"{k}"' for k in keys)
+        assignments = ", ".join(f'"{k}" = excluded."{k}"' for k in updates)
+        duck = conn.connection.driver_connection
+        duck.register("_upsert_frame", pd.DataFrame(rows, columns=list(keys)))
+        try:
+            duck.execute(f'INSERT INTO {table.name} ({columns}) SELECT {columns} FROM _upsert_frame '
+                         f'ON CONFLICT ({", ".join(key_columns)}) DO UPDATE SET {assignments}')
+        finally:
+            duck.unregister("_upsert_frame")
+    elif conn.dialect.name == "mysql":
+        from sqlalchemy.dialects.mysql import insert
+        stmt = insert(table)
+        stmt = stmt.on_duplicate_key_update({k: stmt.inserted[k] for k in updates})
+        conn.execute(stmt, rows)
+    else:
+        if conn.dialect.name == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(index_elements=key_columns,
+                                          set_={k: stmt.excluded[k] for k in updates})
+        conn.execute(stmt, rows)
+
+
+def _upsert_loaded_files(pd_table, conn, keys, data_iter):
+    _upsert_rows(pd_table, conn, keys, data_iter, key_columns=["source_month", "ticker"])
+
+
+def _load_data_infile(conn, df, table):
+    # Let the server parse a temporary CSV straight into the (already created) table
+    with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as f:
+        df.to_csv(f, index=False, header=False, na_rep="\\N", date_format="%Y-%m-%d %H:%M:%S")
+        path = f.name
+    try:
+        columns = ", ".join(f"`{c}`" for c in df.columns)
+        conn.execute(text(
+            f"LOAD DATA LOCAL INFILE :path INTO TABLE `{table}` "
+            f"FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' "
+            f"LINES TERMINATED BY '\\n' ({columns})"
+        ), {"path": path})
+    finally:
+        os.remove(path)
+
+
+def append_frame(conn, df, table, chunk_size=CHUNK_SIZE):
+    # DuckDB scans a registered DataFrame in one vectorized INSERT ... SELECT
+    # (row-by-row executemany is slow there); other backends go through to_sql
+    if conn.dialect.name != "duckdb":
+        df.to_sql(table, con=conn, if_exists="append", index=False, chunksize=chunk_size)
+        return
+    duck = conn.connection.driver_connection
+    duck.register("_append_frame", df)
+    try:
+        if inspect(conn).has_table(table):
+            columns = ", ".join(f'"{c}"' for c in df.columns)
+            duck.execute(f'INSERT INTO {table} ({columns}) SELECT {columns} FROM _append_frame')
+        else:
+            duck.execute(f"CREATE TABLE {table} AS SELECT * FROM _append_frame")
+    finally:
+        duck.unregister("_append_frame")
+
+
+def bulk_insert(conn, df, table, mode=BULK_MODE, chunk_size=CHUNK_SIZE):
+    if mode == "infile" and conn.dialect.name == "mysql":
+        _load_data_infile(conn, df, table)
+        return
+    if mode == "multi":
+        # One bind parameter per cell: stay under SQLite's variable limit
+        if conn.dialect.name == "sqlite":
+            chunk_size = min(chunk_size, SQLITE_MAX_VARIABLES // len(df.columns))
+        df.to_sql(table, con=conn, if_exists="append", index=False, chunksize=chunk_size, method="multi")
+    else:
+        append_frame(conn, df, table, chunk_size)
+
+
+def _file_records(files, hashes, df):
+    counts = df.groupby(["source_month", "ticker"]).size() if len(df) else pd.Series(dtype=int)
+    now = pd.Timestamp.now().floor("s")
+    return pd.DataFrame([
+        {"source_month": month, "ticker": ticker, "sha256": hashes[path],
+         "n_rows": int(counts.get((month, ticker), 0)), "loaded_at": now}
+        for month, ticker, path in files
+    ])
+
+
+def _swap_in_staged(engine, tables=("stock_raw", "loaded_files")):
+    # MySQL: replace each table with its fully loaded <table>_new copy in one
+    # RENAME TABLE, which is atomic (readers see the old or the new tables)
+    with engine.begin() as conn:
+        existing = [t for t in tables if inspect(conn).has_table(t)]
+        conn.execute(text("DROP TABLE IF EXISTS " + ", ".join(f"{t}_old" for t in tables)))
+        renames = [f"{t} TO {t}_old" for t in existing] + [f"{t}_new TO {t}" for t in tables]
+        conn.execute(text("RENAME TABLE " + ", ".join(renames)))
+        if existing:
+            conn.execute(text("DROP TABLE " + ", ".join(f"{t}_old" for t in existing)))
+
+
+def load_stock_raw(engine, csv_root=CSV_ROOT, mode=BULK_MODE, chunk_size=CHUNK_SIZE):
+    # Full rebuild. SQLite and DuckDB have transactional DDL: drop + reload run
+    # in ONE transaction, readers see the old tables until commit. MySQL
+    # commits implicitly on DROP/CREATE TABLE and CREATE INDEX, so there the
+    # rows go into stock_raw_new / loaded_files_new and are swapped in with one
+    # RENAME TABLE; a failed load leaves the old tables untouched.
+    # Returns None (= every ticker affected).
+    files = list_monthly_csvs(csv_root)
+    hashes = {path: file_hash(path) for _, _, path in files}
+    df = read_monthly_csvs(csv_root, files)
+    df = df.drop_duplicates(subset=KEY_COLUMNS, keep="last")
+    staged = engine.dialect.name == "mysql"
+    suffix = "_new" if staged else ""
+
+    start = time.perf_counter()
+    try:
+        with engine.begin() as conn:
+            detach_parquet_store(conn)
+            conn.execute(text(f"DROP TABLE IF EXISTS stock_raw{suffix}"))
+            conn.execute(text(f"DROP TABLE IF EXISTS loaded_files{suffix}"))
+            ensure_tables(conn, suffix=suffix)
+            bulk_insert(conn, df, f"stock_raw{suffix}", mode=mode, chunk_size=chunk_size)
+            _file_records(files, hashes, df).to_sql(f"loaded_files{suffix}", con=conn,
+                                                    if_exists="append", index=False)
+    except Exception:
+        if staged:
+            with engine.begin() as conn:
+                conn.execute(text("DROP TABLE IF EXISTS stock_raw_new, loaded_files_new"))
+        raise
+    if staged:
+        _swap_in_staged(engine)
+    elapsed = time.perf_counter() - start
+    print(f"✅ Loaded {len(df)} rows into stock_raw in {elapsed:.2f}s "
+          f"({len(df) / max(elapsed, 1e-9):,.0f} rows/s, mode={mode}, chunk={chunk_size})")
+    return None
+
+
+def load_incremental(engine, csv_root=CSV_ROOT, chunk_size=CHUNK_SIZE):
+    # Upsert only files whose content hash is new or changed. Returns the
+    # sorted list of affected tickers (empty when nothing changed).
+    with engine.begin() as conn:
+        detach_parquet_store(conn)
+        legacy = legacy_stock_raw(conn)
+    if legacy:
+        # Created by the original full-reload loader: rebuild it once with the
+        # incremental schema (and loaded_files) instead of indexing it in place
+        print("♻️ stock_raw predates the incremental schema, rebuilding it")
+        return load_stock_raw(engine, csv_root, chunk_size=chunk_size)
+
+    with engine.begin() as conn:
+        ensure_tables(conn)
+        loaded = pd.read_sql("SELECT source_month, ticker, sha256 FROM loaded_files", con=conn)
+    known = {(m, t): h for m, t, h in loaded.itertuples(index=False)}
+
+    files = list_monthly_csvs(csv_root)
+    hashes = {path: file_hash(path) for _, _, path in files}
+    changed = [(m, t, p) for m, t, p in files if known.get((m, t)) != hashes[p]]
+    # Files loaded before that are gone now (bookkeeping entries start with "__")
+    on_disk = {(m, t) for m, t, _ in files}
+    removed = [(m, t) for m, t in known if (m, t) not in on_disk and not m.startswith("__")]
+    if not changed and not removed:
+        print("✅ stock_raw is up to date, no new or changed files")
+        return []
+
+    df = read_monthly_csvs(csv_root, changed)
+    df = df.drop_duplicates(subset=KEY_COLUMNS, keep="last")
+    # A changed file replaces everything it loaded before, so rows dropped from
+    # it (and all rows of removed files) leave stock_raw instead of lingering
+    stale = [{"m": m, "t": t} for m, t, _ in changed if (m, t) in known] + \
+            [{"m": m, "t": t} for m, t in removed]
+    start = time.perf_counter()
+    with engine.begin() as conn:
+        if stale:
+            conn.execute(text("DELETE FROM stock_raw WHERE source_month = :m AND ticker = :t"), stale)
+        if removed:
+            conn.execute(text("DELETE FROM loaded_files WHERE source_month = :m AND ticker = :t"),
+                         [{"m": m, "t": t} for m, t in removed])
+        df.to_sql("stock_raw", con=conn, if_exists="append", index=False,
+                  chunksize=chunk_size, method=_upsert_rows)
+        if changed:
+            _file_records(changed, hashes, df).to_sql("loaded_files", con=conn, if_exists="append",
+                                                      index=False, method=_upsert_loaded_files)
+    elapsed = time.perf_counter() - start
+    affected = sorted(set(df["ticker"]) | {t for _, t in removed})
+    print(f"✅ Upserted {len(df)} rows from {len(changed)} new/changed files, dropped {len(removed)} "
+          f"removed files ({len(affected)} tickers) in {elapsed:.2f}s")
+    return affected
+
+
+def store_digest(store_dir=STORE_DIR):
+    # Cheap fingerprint of the Parquet store: every file's path, size and mtime
+    listing = []
+    for root, _, files in os.walk(store_dir):
+        for name in files:
+            if name.endswith(".parquet"):
+                path = os.path.join(root, name)
+                st = os.stat(path)
+                listing.append((os.path.relpath(path, store_dir), st.st_size, st.st_mtime_ns))
+    return hashlib.sha256(json.dumps(sorted(listing)).encode()).hexdigest()
+
+
+def load_parquet_store(engine, store_dir=STORE_DIR):
+    # DuckDB: point stock_raw at the Parquet store in place instead of copying
+    # rows in. Returns None (refresh every ticker) when the store changed since
+    # the last run, [] when it didn't, and False when the backend can't do it.
+    with engine.begin() as conn:
+        ensure_tables(conn, raw=False)
+        current = conn.execute(
+            text("SELECT sha256 FROM loaded_files WHERE source_month = :m AND ticker = :t"),
+            {"m": PARQUET_KEY[0], "t": PARQUET_KEY[1]}).scalar()
+    if not attach_parquet_store(engine, store_dir):
+        return False
+    digest = store_digest(store_dir)
+    if current == digest and inspect(engine).has_table("stock_clean"):
+        print(f"✅ stock_raw reads {store_dir}/ in place, no changes since the last run")
+        return []
+
+    record = pd.DataFrame([{"source_month": PARQUET_KEY[0], "ticker": PARQUET_KEY[1], "sha256": digest,
+                            "n_rows": 0, "loaded_at": pd.Timestamp.now().floor("s")}])
+    with engine.begin() as conn:
+        record.to_sql("loaded_files", con=conn, if_exists="append", index=False, method=_upsert_loaded_files)
+    print(f"✅ stock_raw now reads {store_dir}/ in place")
+    return None
+
+
+def load_sector(engine, sector_csv=SECTOR_CSV):
+    # Replaced only when the sector CSV's content hash changes; returns whether it was
+    digest = file_hash(sector_csv)
+    with engine.begin() as conn:
+        ensure_tables(conn, raw=False)
+        current = conn.execute(
+            text("SELECT sha256 FROM loaded_files WHERE source_month = :m AND ticker = :t"),
+            {"m": SECTOR_FILE_KEY[0], "t": SECTOR_FILE_KEY[1]}).scalar()
+    if current == digest and inspect(engine).has_table("stock_sector"):
+        print("✅ stock_sector is up to date.")
+        return False
+
+    df_sector = pd.read_csv(sector_csv)
+    df_sector.columns = [col.strip().lower() for col in df_sector.columns]  # Normalize column names
+    df_sector = df_sector.rename(columns={"stock": "ticker", "sector": "sector"})
+
+    record = pd.DataFrame([{"source_month": SECTOR_FILE_KEY[0], "ticker": SECTOR_FILE_KEY[1], "sha256": digest,
+                            "n_rows": len(df_sector), "loaded_at": pd.Timestamp.now().floor("s")}])
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE IF EXISTS stock_sector"))
+        df_sector.to_sql("stock_sector", con=conn, if_exists="replace", index=False)
+        record.to_sql("loaded_files", con=conn, if_exists="append", index=False, method=_upsert_loaded_files)
+    print("✅ Uploaded sector mapping to stock_sector table.")
+    return True
 
-# -------------------------------
-# ✅ 1. Drop table to avoid duplicates
-# -------------------------------
-with engine.begin() as conn:
-    conn.execute(text("DROP TABLE IF EXISTS stock_raw"))
-    print("🧹 Dropped existing stock_raw table.")
 
 # -------------------------------
-# ✅ 2. Load monthly CSV data
+# Derived tables, refreshed per ticker
 # -------------------------------
-for month in os.listdir(CSV_ROOT):
-    month_path = os.path.join(CSV_ROOT, month)
-    if not os.path.isdir(month_path):
-        continue
 
-    for file in os.listdir(month_path):
-        if file.endswith(".csv"):
-            path = os.path.join(month_path, file)
-            ticker = file.replace(".csv", "")
+def _trade_date(conn):
+    # DATE() in MySQL/SQLite, a cast elsewhere (CAST AS DATE is numeric in SQLite)
+    return "DATE(date)" if conn.dialect.name in ("mysql", "sqlite") else "CAST(date AS DATE)"
+
+
+def _ticker_filter(tickers):
+    if tickers is None:
+        return "", {}
+    return " WHERE ticker IN :tickers", {"tickers": list(tickers)}
+
+
+def _execute(conn, sql, params):
+    conn.execute(statement(sql, params), params)
+
+
+def _read(conn, sql, params=None):
+    params = params or {}
+    return pd.read_sql(statement(sql, params), con=conn, params=params)
+
+
+def _replace_rows(conn, table, df, tickers):
+    # Delete the affected tickers' rows and append the recomputed ones
+    if inspect(conn).has_table(table):
+        where, params = _ticker_filter(tickers)
+        _execute(conn, f"DELETE FROM {table}{where}", params)
+    append_frame(conn, df, table)
+
+
+def refresh_derived(engine, tickers=None):
+    # stock_clean, stock_volatility and stock_cumulative_returns for `tickers`
+    # (None = all). An empty list means nothing changed.
+    if tickers is not None and len(tickers) == 0:
+        return
+    where, params = _ticker_filter(tickers)
+    with engine.begin() as conn:
+        clean_select = (f"SELECT ticker, {_trade_date(conn)} AS trade_date, open, high, low, close, volume "
+                        f"FROM stock_raw{where}{' AND' if where else ' WHERE'} close IS NOT NULL")
+        if not inspect(conn).has_table("stock_clean"):
+            conn.execute(text(f"CREATE TABLE stock_clean AS SELECT ticker, {_trade_date(conn)} AS trade_date, "
+                              f"open, high, low, close, volume FROM stock_raw WHERE close IS NOT NULL"))
+        else:
+            _execute(conn, f"DELETE FROM stock_clean{where}", params)
+            _execute(conn, f"INSERT INTO stock_clean (ticker, trade_date, open, high, low, close, volume) "
+                           f"{clean_select}", params)
+
+        clean = _read(conn, f"SELECT ticker, trade_date, close FROM stock_clean{where} ORDER BY ticker, trade_date",
+                      params)
+
+        daily_return = clean.groupby("ticker")["close"].pct_change()
+        vol = daily_return.groupby(clean["ticker"]).std().rename("volatility").reset_index()
+        cum = clean[["ticker", "trade_date"]].copy()
+        cum["cumulative_return"] = (1 + daily_return.fillna(0)).groupby(clean["ticker"]).cumprod() - 1
 
-            df = pd.read_csv(path)
-            df["ticker"] = ticker
-            df["source_month"] = month
-            df["date"] = pd.to_datetime(df["date"])
+        _replace_rows(conn, "stock_volatility", vol, tickers)
+        _replace_rows(conn, "stock_cumulative_returns", cum, tickers)
+    print(f"✅ Refreshed derived tables for {'all' if tickers is None else len(tickers)} tickers")
 
-            df.to_sql("stock_raw", con=engine, if_exists="append", index=False)
-            print(f"✅ Uploaded: {file} from {month}")
 
 # -------------------------------
-# ✅ 3. Load sector mapping table
+# Materialized summaries, so the dashboards only fetch the rows they plot
 # -------------------------------
-df_sector = pd.read_csv(SECTOR_CSV)
-df_sector.columns = [col.strip().lower() for col in df_sector.columns]  # Normalize column names
-df_sector = df_sector.rename(columns={"stock": "ticker", "sector": "sector"})
 
-# Drop and recreate stock_sector table
-with engine.begin() as conn:
-    conn.execute(text("DROP TABLE IF EXISTS stock_sector"))
+# Per-ticker stats over the full history, with the first-to-last close return
+TICKER_STATS_SQL = """
+SELECT s.ticker, s.n_days, s.first_date, s.last_date, s.avg_close, s.min_close, s.max_close, s.avg_volume,
+       f.close AS first_close, l.close AS last_close, (l.close - f.close) / f.close * 100 AS yearly_return_pct
+FROM (SELECT ticker, COUNT(*) AS n_days, MIN(trade_date) AS first_date, MAX(trade_date) AS last_date,
+             AVG(close) AS avg_close, MIN(close) AS min_close, MAX(close) AS max_close, AVG(volume) AS avg_volume
+      FROM stock_clean{where}
+      GROUP BY ticker) s
+JOIN stock_clean f ON f.ticker = s.ticker AND f.trade_date = s.first_date
+JOIN stock_clean l ON l.ticker = s.ticker AND l.trade_date = s.last_date"""
+
+# Tables the dashboards read that the MySQL cleaning SQL normally creates;
+# an embedded database gets them as views over stock_ticker_stats
+SUMMARY_VIEWS = {
+    "stock_market_summary": "SELECT ticker, avg_close, avg_volume FROM stock_ticker_stats",
+    "top_10_green": "SELECT ticker, yearly_return_pct FROM stock_ticker_stats ORDER BY yearly_return_pct DESC LIMIT 10",
+    "top_10_red": "SELECT ticker, yearly_return_pct FROM stock_ticker_stats ORDER BY yearly_return_pct ASC LIMIT 10",
+}
+
+# Last cumulative return of each ticker (what groupby('ticker').last() gave)
+LAST_RETURN_SQL = """
+SELECT c.ticker, c.trade_date, c.cumulative_return
+FROM stock_cumulative_returns c
+JOIN (SELECT ticker, MAX(trade_date) AS last_date FROM stock_cumulative_returns{where} GROUP BY ticker) m
+  ON c.ticker = m.ticker AND c.trade_date = m.last_date"""
+
+# Tickers with a close on every trading day: the columns pivot.dropna(axis=1) keeps
+COMPLETE_TICKERS_SQL = """
+SELECT ticker FROM stock_ticker_stats
+WHERE n_days = (SELECT COUNT(DISTINCT trade_date) FROM stock_clean)"""
+
+# Closing prices of the fully populated tickers: pivoted to date x ticker they
+# have no gaps, so every pair's correlation runs over all dates
+COMPLETE_CLOSE_SQL = "SELECT ticker, trade_date, close FROM stock_clean WHERE ticker IN :complete"
+CORR_BLOCK = 256   # ticker_a rows per block of the correlation product
+
+
+def _materialize(conn, table, select_sql, tickers):
+    # CREATE TABLE ... AS on first run, then delete + re-insert the affected tickers' rows
+    if not inspect(conn).has_table(table):
+        conn.execute(text(f"CREATE TABLE {table} AS {select_sql.format(where='')}"))
+        return
+    where, params = _ticker_filter(tickers)
+    _execute(conn, f"DELETE FROM {table}{where}", params)
+    _execute(conn, f"INSERT INTO {table} {select_sql.format(where=where)}", params)
+
+
+def _pair_correlation(wide, rows, block_size=CORR_BLOCK):
+    # Yields the long (ticker_a, ticker_b, corr) table of every ticker_a in
+    # `rows` against all columns of the gap-free date x ticker frame `wide`,
+    # one block of ticker_a at a time: standardized columns multiplied block x
+    # N, so memory is O(block_size * N) instead of a tickers^2 x dates join
+    tickers = wide.columns.to_numpy()
+    values = wide.to_numpy(dtype="float64")
+    centered = values - values.mean(axis=0)
+    norm = np.sqrt((centered * centered).sum(axis=0))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = centered / norm                     # constant series -> NaN, as before
+    positions = wide.columns.get_indexer(rows)
+    for start in range(0, len(positions), block_size):
+        block = positions[start:start + block_size]
+        corr = np.clip(z[:, block].T @ z, -1.0, 1.0)
+        corr[np.arange(len(block)), block] = 1.0
+        yield pd.DataFrame({"ticker_a": np.repeat(tickers[block], len(tickers)),
+                            "ticker_b": np.tile(tickers, len(block)), "corr": corr.ravel()})
+
+
+def _refresh_pair_correlation(conn, complete, affected=None):
+    # stock_price_corr holds both (a, b) and (b, a); with `affected` only the
+    # pairs touching those tickers are recomputed
+    close = _read(conn, COMPLETE_CLOSE_SQL, {"complete": list(complete)})
+    close = close.drop_duplicates(["ticker", "trade_date"], keep="last")
+    wide = close.pivot(index="trade_date", columns="ticker", values="close")
+    rows = wide.columns if affected is None else wide.columns[wide.columns.isin(list(affected))]
+
+    if affected is None:
+        conn.execute(text("DROP TABLE IF EXISTS stock_price_corr"))
+        append_frame(conn, pd.DataFrame({"ticker_a": pd.Series(dtype=str), "ticker_b": pd.Series(dtype=str),
+                                         "corr": pd.Series(dtype="float64")}), "stock_price_corr")
+    else:
+        _execute(conn, "DELETE FROM stock_price_corr WHERE ticker_a IN :affected OR ticker_b IN :affected",
+                 {"affected": list(affected)})
+    for corr in _pair_correlation(wide, rows, CORR_BLOCK):
+        if affected is not None:
+            mirror = corr[~corr["ticker_b"].isin(affected)]
+            mirror = mirror.rename(columns={"ticker_a": "ticker_b", "ticker_b": "ticker_a"})
+            corr = pd.concat([corr, mirror[["ticker_a", "ticker_b", "corr"]]], ignore_index=True)
+        append_frame(conn, corr, "stock_price_corr")
+
+
+def refresh_summaries(engine, tickers=None):
+    # stock_ticker_stats, stock_last_return and stock_price_corr for `tickers`
+    # (None = all). Run after refresh_derived.
+    if tickers is not None and len(tickers) == 0:
+        return
+    with engine.begin() as conn:
+        _materialize(conn, "stock_ticker_stats", TICKER_STATS_SQL, tickers)
+        _materialize(conn, "stock_last_return", LAST_RETURN_SQL, tickers)
+        for view, select_sql in SUMMARY_VIEWS.items():
+            # The original cleaning SQL made these snapshot tables: replace them
+            kind = relation_type(conn, view)
+            if kind == "table":
+                conn.execute(text(f"DROP TABLE {view}"))
+            if kind != "view":
+                conn.execute(text(f"CREATE VIEW {view} AS {select_sql}"))
+
+        complete = _read(conn, COMPLETE_TICKERS_SQL)["ticker"].tolist()
+        previous = None
+        if inspect(conn).has_table("stock_price_corr"):
+            previous = set(_read(conn, "SELECT DISTINCT ticker_a FROM stock_price_corr")["ticker_a"])
+        if tickers is None or previous != set(complete):
+            # The set of fully populated tickers moved (e.g. a new trading day): recompute every pair
+            _refresh_pair_correlation(conn, complete)
+        else:
+            affected = [t for t in tickers if t in previous]
+            if affected:
+                _refresh_pair_correlation(conn, complete, affected)
+    print(f"✅ Refreshed summary tables for {'all' if tickers is None else len(tickers)} tickers")
+
+
+def mark_refreshed(engine):
+    # New random token in loaded_files: db.QueryCache keys every cached result
+    # on it, so the dashboards drop results computed before this load
+    record = pd.DataFrame([{"source_month": REFRESH_KEY[0], "ticker": REFRESH_KEY[1], "sha256": uuid.uuid4().hex,
+                            "n_rows": 0, "loaded_at": pd.Timestamp.now().floor("s")}])
+    with engine.begin() as conn:
+        ensure_tables(conn, raw=False)
+        record.to_sql("loaded_files", con=conn, if_exists="append", index=False, method=_upsert_loaded_files)
+
+
+if __name__ == '__main__':
+    # Create SQLAlchemy engine (local_infile is only needed for BULK_MODE = "infile")
+    connect_args = {"local_infile": True} if BULK_MODE == "infile" else {}
+    engine = make_engine(connect_args=connect_args)
+
+    # -------------------------------
+    # ✅ 1-2. Load monthly CSV data (upsert new/changed files, or full bulk reload);
+    #        on DuckDB with a Parquet master store, query the store in place
+    # -------------------------------
+    affected = load_parquet_store(engine)
+    if affected is False:
+        affected = load_incremental(engine) if INCREMENTAL else load_stock_raw(engine)
+
+    # -------------------------------
+    # ✅ 3. Load sector mapping table (only when the file changed)
+    # -------------------------------
+    sector_changed = load_sector(engine)
+
+    # -------------------------------
+    # ✅ 4. Refresh derived and summary tables for the affected tickers only
+    # -------------------------------
+    refresh_derived(engine, affected)
+    refresh_summaries(engine, affected)
 
-df_sector.to_sql("stock_sector", con=engine, if_exists="replace", index=False)
-print("✅ Uploaded sector mapping to stock_sector table.")
+    # -------------------------------
+    # ✅ 5. Invalidate the dashboards' query caches
+    # -------------------------------
+    if affected != [] or sector_changed:
+        mark_refreshed(engine)
@@ -0,0 +1,70 @@
+import pandas as pd
+from db import QueryCache, statement
+
+# Server-side queries for the SQL dashboards and visuals.py. Each one returns
+# only the rows a chart or table shows; the heavy aggregation lives in the
+# summary tables that load.refresh_summaries materializes. `db` is an engine
+# or a db.QueryCache wrapping one.
+
+TOP_VOLATILE_SQL = "SELECT ticker, volatility FROM stock_volatility ORDER BY volatility DESC LIMIT :n"
+TOP_LAST_RETURN_SQL = "SELECT ticker FROM stock_last_return ORDER BY cumulative_return DESC LIMIT :n"
+CUMULATIVE_SQL = """
+SELECT ticker, trade_date, cumulative_return FROM stock_cumulative_returns
+WHERE ticker IN :tickers
+ORDER BY ticker, trade_date"""
+CORR_TICKER_COUNT_SQL = "SELECT COUNT(DISTINCT ticker_a) AS n FROM stock_price_corr"
+CORR_SQL = "SELECT ticker_a, ticker_b, corr FROM stock_price_corr"
+# k most (DESC) / least (ASC) correlated peers of every ticker
+PEERS_SQL = """
+SELECT ticker_a AS ticker, peer_rank, ticker_b AS peer, corr FROM (
+    SELECT ticker_a, ticker_b, corr,
+           ROW_NUMBER() OVER (PARTITION BY ticker_a ORDER BY corr {order}, ticker_b) AS peer_rank
+    FROM stock_price_corr
+    WHERE ticker_a <> ticker_b
+) ranked
+WHERE peer_rank <= :k
+ORDER BY ticker, peer_rank"""
+TOP_PAIRS_SQL = """
+SELECT ticker_a, ticker_b, corr FROM stock_price_corr
+WHERE ticker_a < ticker_b
+ORDER BY corr DESC
+LIMIT :n"""
+
+
+def read(db, sql, params=None):
+    if isinstance(db, QueryCache):
+        return db.read_sql(sql, params)
+    return pd.read_sql(statement(sql, params), con=db, params=params or {})
+
+
+def top_volatile(db, n=10):
+    return read(db, TOP_VOLATILE_SQL, {"n": n})
+
+
+def top_cumulative_returns(db, n=5):
+    # (top-n tickers by last cumulative return, their full cumulative series)
+    top = read(db, TOP_LAST_RETURN_SQL, {"n": n})["ticker"].tolist()
+    if not top:
+        return top, pd.DataFrame(columns=["ticker", "trade_date", "cumulative_return"])
+    return top, read(db, CUMULATIVE_SQL, {"tickers": top})
+
+
+def correlation_ticker_count(db):
+    return int(read(db, CORR_TICKER_COUNT_SQL)["n"].iloc[0])
+
+
+def correlation_matrix(db):
+    # Square matrix laid out like pivot.corr(): tickers sorted on both axes
+    corr = read(db, CORR_SQL)
+    matrix = corr.pivot(index="ticker_a", columns="ticker_b", values="corr")
+    matrix.index.name = matrix.columns.name = "ticker"
+    return matrix.sort_index().sort_index(axis=1)
+
+
+def correlated_peers(db, k=5, n_pairs=20):
+    # Same {'most', 'least', 'pairs'} frames as correlation.top_correlated
+    def peers(order):
+        return read(db, PEERS_SQL.format(order=order), {"k": k}).rename(columns={"peer_rank": "rank"})
+
+    pairs = read(db, TOP_PAIRS_SQL, {"n": n_pairs})
+    return {"most": peers("DESC"), "least": peers("ASC"), "pairs": pairs}
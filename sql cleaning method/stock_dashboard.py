@@ -1,21 +1,27 @@
 import streamlit as st
-import pandas as pd
 import seaborn as sns
 import matplotlib.pyplot as plt
-from sqlalchemy import create_engine
-from urllib.parse import quote_plus
+import os
+import sys
+
+# correlation.py lives in the project root, one level up
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from correlation import LARGE_UNIVERSE
+from db import QueryCache, make_engine
+from queries import (read, top_volatile, top_cumulative_returns, correlation_ticker_count,
+                     correlation_matrix, correlated_peers)
+
+# DB connection: one pooled engine and query cache shared by every session and rerun
+@st.cache_resource
+def get_db():
+    return QueryCache(make_engine())
 
-# DB connection
-user = "root"
-password = quote_plus("Visagan@7")
-host = "localhost"
-port = 3306
-db = "stocks_db"
-engine = create_engine(f"mysql+pymysql://{user}:{password}@{host}:{port}/{db}")
 
 st.set_page_config(layout="wide")
 st.title("📈 Nifty 50 Stock Performance Dashboard")
 
+db = get_db()
+
 # Tabs
 tabs = st.tabs([
     "Top Gainers & Losers", "Market Summary", 
@@ -25,7 +31,7 @@ tabs = st.tabs([
 # Tab 1: Gainers & Losers
 with tabs[0]:
     st.subheader("Top 10 Green Stocks")
-    green = pd.read_sql("SELECT * FROM top_10_green", con=engine)
+    green = read(db, "SELECT * FROM top_10_green")
     st.dataframe(green)
     plt.figure(figsize=(10, 5))
     sns.barplot(x='ticker', y='yearly_return_pct', data=green, palette='Greens_r')
@@ -35,7 +41,7 @@ with tabs[0]:
     plt.clf()
 
     st.subheader("Top 10 Red Stocks")
-    red = pd.read_sql("SELECT * FROM top_10_red", con=engine)
+    red = read(db, "SELECT * FROM top_10_red")
     st.dataframe(red)
     plt.figure(figsize=(10, 5))
     sns.barplot(x='ticker', y='yearly_return_pct', data=red, palette='Reds')
@@ -47,7 +53,7 @@ with tabs[0]:
 # Tab 2: Market Summary
 with tabs[1]:
     st.subheader("Market Summary")
-    df = pd.read_sql("SELECT * FROM stock_market_summary", con=engine)
+    df = read(db, "SELECT * FROM stock_market_summary")
     st.dataframe(df)
 
     st.markdown("### Average Closing Price per Stock")
@@ -67,8 +73,7 @@ with tabs[1]:
 # Tab 3: Volatility
 with tabs[2]:
     st.subheader("Top 10 Most Volatile Stocks")
-    vol = pd.read_sql("SELECT * FROM stock_volatility", con=engine)
-    top_vol = vol.sort_values(by='volatility', ascending=False).head(10)
+    top_vol = top_volatile(db, 10)
     st.dataframe(top_vol)
 
     plt.figure(figsize=(10, 5))
@@ -81,8 +86,7 @@ with tabs[2]:
 # Tab 4: Cumulative Returns
 with tabs[3]:
     st.subheader("Cumulative Returns Over Time")
-    cum = pd.read_sql("SELECT * FROM stock_cumulative_returns", con=engine)
-    top_5 = cum.groupby('ticker').last().sort_values('cumulative_return', ascending=False).head(5).index
+    top_5, cum = top_cumulative_returns(db, 5)
 
     fig, ax = plt.subplots(figsize=(12, 6))
     for ticker in top_5:
@@ -99,12 +103,23 @@ with tabs[3]:
 # Tab 5: Correlation Heatmap
 with tabs[4]:
     st.subheader("Correlation Heatmap of Closing Prices")
-    df = pd.read_sql("SELECT ticker, trade_date, close FROM stock_clean", con=engine)
-    pivot = df.pivot(index='trade_date', columns='ticker', values='close')
-    pivot = pivot.dropna(axis=1)
-    corr = pivot.corr()
-
-    fig, ax = plt.subplots(figsize=(14, 10))
-    sns.heatmap(corr, cmap='coolwarm', center=0, square=True, ax=ax, annot=False)
-    ax.set_title("Stock Price Correlation Matrix")
-    st.pyplot(fig)
+    n_tickers = correlation_ticker_count(db)
+
+    if n_tickers > LARGE_UNIVERSE:
+        # Too many stocks for a readable heatmap: top-k peers, ranked in the database
+        top_corr = correlated_peers(db)
+        st.caption(f"{n_tickers} stocks: showing the most and least correlated peers instead of the heatmap.")
+        st.markdown("### Most Correlated Pairs")
+        st.dataframe(top_corr['pairs'])
+        col1, col2 = st.columns(2)
+        col1.markdown("### Most Correlated Peers")
+        col1.dataframe(top_corr['most'])
+        col2.markdown("### Least Correlated Peers")
+        col2.dataframe(top_corr['least'])
+    else:
+        corr = correlation_matrix(db)
+
+        fig, ax = plt.subplots(figsize=(14, 10))
+        sns.heatmap(corr, cmap='coolwarm', center=0, square=True, ax=ax, annot=False)
+        ax.set_title("Stock Price Correlation Matrix")
+        st.pyplot(fig)
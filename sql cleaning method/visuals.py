@@ -1,16 +1,9 @@
-from sqlalchemy import create_engine
-from urllib.parse import quote_plus
 import pandas as pd
+from db import make_engine
+from queries import top_volatile, top_cumulative_returns, correlation_matrix
 
-# Encode the password properly
-user = "root"
-password = quote_plus("Visagan@7")  # This becomes Visagan%407
-host = "localhost"
-port = 3306
-db = "stocks_db"
-
-# Safe connection string
-engine = create_engine(f"mysql+pymysql://{user}:{password}@{host}:{port}/{db}")
+# Connection settings live in db.py
+engine = make_engine()
 
 # Optional: test connection
 try:
@@ -27,7 +20,6 @@ except Exception as e:
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
-from sqlalchemy import create_engine
 
 
 # Load data
@@ -64,8 +56,7 @@ plt.xticks(rotation=90)
 plt.show()
 
 #Top 10 voilatile stocks
-vol = pd.read_sql("SELECT * FROM stock_volatility", con=engine)
-top_vol = vol.sort_values(by='volatility', ascending=False).head(10)
+top_vol = top_volatile(engine, 10)
 
 plt.figure(figsize=(10, 5))
 sns.barplot(x='ticker', y='volatility', data=top_vol, palette='coolwarm')
@@ -74,8 +65,7 @@ plt.ylabel("Volatility (Std Dev of Returns)")
 plt.show()
 
 #Line chart for cummlative returns 
-cum = pd.read_sql("SELECT * FROM stock_cumulative_returns", con=engine)
-top_5 = cum.groupby('ticker').last().sort_values('cumulative_return', ascending=False).head(5).index
+top_5, cum = top_cumulative_returns(engine, 5)
 
 plt.figure(figsize=(14, 6))
 for ticker in top_5:
@@ -90,15 +80,8 @@ plt.grid(True)
 plt.show()
 
 #Heat map for closing price
-# Build ticker-date-close pivot
-df = pd.read_sql("SELECT ticker, trade_date, close FROM stock_clean", con=engine)
-pivot = df.pivot(index='trade_date', columns='ticker', values='close')
-
-# Drop columns with NaNs if needed
-pivot = pivot.dropna(axis=1)
-
-# Correlation matrix
-corr = pivot.corr()
+# Correlation matrix, from the stock_price_corr pairs the loader computes
+corr = correlation_matrix(engine)
 
 plt.figure(figsize=(14, 10))
 sns.heatmap(corr, cmap='coolwarm', center=0, square=True)
@@ -0,0 +1,169 @@
+import os
+import json
+import shutil
+import hashlib
+from urllib.parse import unquote
+import pandas as pd
+
+from instrument import traced
+
+# pyarrow is optional: without it (or without a written store) every loader
+# falls back to parsing the master CSV exactly as before.
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+except ImportError:
+    pa = None
+    ds = None
+
+MASTER_CSV = "cleaned_master_stock_data.csv"
+STORE_DIR = "master_store"   # Parquet dataset, hive-partitioned year=YYYY/month=M[/ticker=X]
+BY_TICKER = False            # also partition by ticker (many small files, fastest single-ticker reads)
+COLUMNS = ['date', 'open', 'high', 'low', 'close', 'volume', 'ticker']
+NUMERIC_COLS = ['open', 'high', 'low', 'close', 'volume']
+
+
+def has_store(store_dir=STORE_DIR):
+    return ds is not None and os.path.isdir(store_dir)
+
+
+def master_version(store_dir=STORE_DIR, csv_path=MASTER_CSV):
+    # Cheap identity of what load_master reads: path, size and mtime of every
+    # store file (or of the CSV), so it changes whenever the master is rewritten
+    path = store_dir if has_store(store_dir) else csv_path
+    listing = []
+    if os.path.isdir(path):
+        for root, dirs, files in os.walk(path):
+            for name in files:
+                st = os.stat(os.path.join(root, name))
+                listing.append((os.path.relpath(os.path.join(root, name), path), st.st_size, st.st_mtime_ns))
+    elif os.path.exists(path):
+        st = os.stat(path)
+        listing.append((path, st.st_size, st.st_mtime_ns))
+    return hashlib.sha256(json.dumps(sorted(listing)).encode()).hexdigest()[:16]
+
+
+def _partition_schema(by_ticker):
+    fields = [pa.field('year', pa.int16()), pa.field('month', pa.int8())]
+    if by_ticker:
+        fields.append(pa.field('ticker', pa.string()))
+    return pa.schema(fields)
+
+
+def write_store(df, store_dir=STORE_DIR, by_ticker=BY_TICKER, replace=True):
+    # replace=True rebuilds the whole dataset; replace=False only rewrites the
+    # year/month (and ticker) partitions that appear in `df`, which is what the
+    # incremental ingestion uses.
+    if pa is None:
+        raise ImportError("Writing the columnar store requires pyarrow (pip install pyarrow)")
+    if replace and os.path.isdir(store_dir):
+        shutil.rmtree(store_dir)
+
+    out = df[COLUMNS].copy()
+    out['year'] = out['date'].dt.year.astype('int16')
+    out['month'] = out['date'].dt.month.astype('int8')
+    table = pa.Table.from_pandas(out, preserve_index=False)
+    ds.write_dataset(
+        table, store_dir, format='parquet',
+        partitioning=ds.partitioning(_partition_schema(by_ticker), flavor='hive'),
+        existing_data_behavior='delete_matching',
+        basename_template='part-{i}.parquet',
+    )
+
+
+def replace_months(df, months, store_dir=STORE_DIR, by_ticker=BY_TICKER):
+    # Rewrites the given months (pd.Period, freq M) with the rows of `df`,
+    # which must hold every row those months should keep. Partitions of those
+    # months that `df` has no rows for (a month or ticker that disappeared from
+    # the input) are removed.
+    if len(df):
+        write_store(df, store_dir, by_ticker, replace=False)
+    periods = df['date'].dt.to_period('M')
+    for month in months:
+        month_dir = os.path.join(store_dir, f"year={month.year}", f"month={month.month}")
+        if not os.path.isdir(month_dir):
+            continue
+        rows = df[periods == month]
+        if rows.empty:
+            shutil.rmtree(month_dir)
+        elif by_ticker:
+            present = set(rows['ticker'])
+            for name in os.listdir(month_dir):
+                if name.startswith("ticker=") and unquote(name[len("ticker="):]) not in present:
+                    shutil.rmtree(os.path.join(month_dir, name))
+
+
+def read_months(months, store_dir=STORE_DIR):
+    # Every row of the given months (pd.Period, freq M), straight from their partitions
+    if not months:
+        return pd.DataFrame(columns=COLUMNS)
+    expr = None
+    for month in months:
+        cond = (ds.field('year') == month.year) & (ds.field('month') == month.month)
+        expr = cond if expr is None else expr | cond
+    dataset = ds.dataset(store_dir, format='parquet', partitioning='hive')
+    return dataset.to_table(columns=COLUMNS, filter=expr).to_pandas()
+
+
+def _month_filter(start, end):
+    # Bounds on the partition keys, so whole year/month directories are skipped
+    expr = None
+    if start is not None:
+        start = pd.Timestamp(start)
+        expr = (ds.field('year') > start.year) | (
+            (ds.field('year') == start.year) & (ds.field('month') >= start.month))
+    if end is not None:
+        end = pd.Timestamp(end)
+        upper = (ds.field('year') < end.year) | (
+            (ds.field('year') == end.year) & (ds.field('month') <= end.month))
+        expr = upper if expr is None else expr & upper
+    return expr
+
+
+def read_store(columns=None, tickers=None, start=None, end=None, store_dir=STORE_DIR):
+    # Column projection + ticker/date predicate pushdown. `end` is inclusive,
+    # matching Series.between in app.py.
+    dataset = ds.dataset(store_dir, format='parquet', partitioning='hive')
+    columns = list(columns or COLUMNS)
+
+    expr = _month_filter(start, end)
+    conditions = []
+    if tickers is not None:
+        conditions.append(ds.field('ticker').isin(list(tickers)))
+    if start is not None:
+        conditions.append(ds.field('date') >= pd.Timestamp(start))
+    if end is not None:
+        conditions.append(ds.field('date') <= pd.Timestamp(end))
+    for cond in conditions:
+        expr = cond if expr is None else expr & cond
+
+    df = dataset.to_table(columns=columns, filter=expr).to_pandas()
+    sort_cols = [c for c in ['ticker', 'date'] if c in df.columns]
+    if sort_cols:
+        df = df.sort_values(sort_cols, kind='stable').reset_index(drop=True)
+    return df
+
+
+def read_master_csv(csv_path=MASTER_CSV):
+    df = pd.read_csv(csv_path, parse_dates=['date'])
+    for col in NUMERIC_COLS:
+        df[col] = pd.to_numeric(df[col], errors='coerce')
+    return df.dropna(subset=['date', 'close']).sort_values(['ticker', 'date'])
+
+
+@traced()
+def load_master(columns=None, tickers=None, start=None, end=None,
+                csv_path=MASTER_CSV, store_dir=STORE_DIR):
+    # Cleaned master frame sorted by (ticker, date), from the columnar store
+    # when it exists and from the CSV otherwise.
+    if has_store(store_dir):
+        return read_store(columns, tickers, start, end, store_dir)
+
+    df = read_master_csv(csv_path)
+    if tickers is not None:
+        df = df[df['ticker'].isin(list(tickers))]
+    if start is not None:
+        df = df[df['date'] >= pd.Timestamp(start)]
+    if end is not None:
+        df = df[df['date'] <= pd.Timestamp(end)]
+    return df[list(columns)] if columns else df
@@ -0,0 +1,10 @@
+import os
+import sys
+
+# The project is a set of top-level scripts, not a package: make them (and the
+# SQL pipeline's modules) importable
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SQL_DIR = os.path.join(ROOT, "sql cleaning method")
+for path in (SQL_DIR, ROOT):
+    if path not in sys.path:
+        sys.path.insert(0, path)
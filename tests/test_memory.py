@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import analysis
+import benchmark
+import dashboard_metrics
+
+# Small synthetic market, but large enough that RERUN_PEAK_RATIO x the compact
+# dataset (about 3.7 MB here) is above the benchmark's MIN_MB noise floor
+N_TICKERS = 100
+N_DAYS = 500
+RERUN_STAGES = ["ingest.save_master", "load_clean_data", "sector_map",
+                "app.CompactDataset", "app.PrefixIndex", "app.rerun"]
+
+
+@pytest.fixture
+def bench_dir(tmp_path, monkeypatch):
+    # The project's scripts use paths relative to the working directory
+    benchmark.generate(str(tmp_path), N_TICKERS, N_DAYS, yaml_tree=False)
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def reference_cumulative_return(df):
+    # compute_cumulative_return before it stopped copying its input
+    df = df.copy()
+    df['daily_return'] = df.groupby('ticker')['close'].pct_change().fillna(0)
+    df['cumulative_return'] = (1 + df['daily_return']).groupby(df['ticker']).cumprod() - 1
+    return df
+
+
+def test_full_rerun_peak_memory(bench_dir):
+    # benchmark's app.rerun (every ticker, the whole history) measured under
+    # tracemalloc stays within RERUN_PEAK_RATIO x the compact dataset
+    results, ctx = benchmark.run(repeat=1, only=RERUN_STAGES)
+    limit = benchmark.rerun_peak_limit(ctx)
+    assert limit is not None and limit > benchmark.MIN_MB
+    assert results['app.rerun']['peak_mb'] <= limit
+
+    returns_df = ctx['app.rerun'][0]
+    assert len(returns_df) == N_TICKERS
+
+
+@pytest.mark.parametrize("func", [analysis.compute_cumulative_return, dashboard_metrics.cumulative_return])
+def test_cumulative_return_is_narrow(bench_dir, func):
+    df = analysis.load_clean_data()
+    before = df.copy()
+    result = func(df)
+
+    assert list(result.columns) == ['ticker', 'date', 'daily_return', 'cumulative_return']
+    pd.testing.assert_frame_equal(df, before)
+    # Joining the returns back on the shared index rebuilds the old wide frame
+    expected = reference_cumulative_return(df)
+    joined = df.join(result[['daily_return', 'cumulative_return']])
+    pd.testing.assert_frame_equal(joined, expected, check_exact=False, rtol=1e-12)
+    assert np.isfinite(result['cumulative_return']).all()
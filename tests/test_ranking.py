@@ -0,0 +1,114 @@
+import numpy as np
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+
+import analysis
+import dashboard_metrics
+
+
+# The per-ticker / per-month loops these functions replaced, kept as the
+# reference the vectorized versions must reproduce. The only edit is
+# kind='stable' in the monthly ranking: the loop used numpy's default
+# quicksort, whose order for tied returns is arbitrary (it differs between
+# SIMD and scalar builds), while the vectorized ranking keeps tied tickers in
+# ticker order, which is what a stable sort of the loop gives.
+
+def reference_compute_yearly_returns(df):
+    results = []
+    for ticker, group in df.groupby('ticker'):
+        group = group.sort_values('date')
+        first = group.iloc[0]['close']
+        last = group.iloc[-1]['close']
+        y_return = (last - first) / first * 100
+        results.append({'ticker': ticker, 'yearly_return': y_return, 'first_close': first, 'last_close': last})
+    return pd.DataFrame(results)
+
+
+def reference_app_yearly_returns(df):
+    results = []
+    for ticker, group in df.groupby('ticker'):
+        group = group.sort_values('date')
+        if len(group) < 2:
+            continue
+        first = group.iloc[0]['close']
+        last = group.iloc[-1]['close']
+        y_return = (last - first) / first * 100
+        results.append({'ticker': ticker, 'yearly_return': y_return})
+    return pd.DataFrame(results)
+
+
+def reference_monthly_gainers_losers(df):
+    df = df.copy()
+    df['month'] = df['date'].dt.to_period('M')
+    monthly = df.groupby(['ticker', 'month']).agg({'close': ['first', 'last']})
+    monthly.columns = ['first_close', 'last_close']
+    monthly = monthly.reset_index()
+    monthly['monthly_return'] = (monthly['last_close'] - monthly['first_close']) / monthly['first_close'] * 100
+    results = {}
+    for m in monthly['month'].unique():
+        this_month = monthly[monthly['month'] == m]
+        top5 = this_month.sort_values('monthly_return', ascending=False, kind='stable').head(5)
+        bottom5 = this_month.sort_values('monthly_return', kind='stable').head(5)
+        results[str(m)] = {
+            'top5': top5[['ticker', 'monthly_return']],
+            'bottom5': bottom5[['ticker', 'monthly_return']]
+        }
+    return results
+
+
+def market(n_tickers=24, n_days=70, seed=0):
+    # Long (date, ticker, close) frame in the master's (ticker, date) order, with
+    # exact ties (every third ticker repeats the previous one's closes), a
+    # ticker with a single row, a ticker whose closes are all equal, and NaN
+    # closes at the start, middle and end of some series and over a whole month
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range("2024-01-01", periods=n_days)
+    close = 100 * np.cumprod(1 + rng.normal(0, 0.02, (n_tickers, n_days)), axis=1)
+    close[2::3] = close[1::3][:len(close[2::3])]
+    close[3] = 50.0
+    close[4, 0] = close[5, 30] = close[6, -1] = np.nan
+    close[7, :25] = np.nan   # a whole month without a close: NaN monthly return
+    tickers = [f"T{i:02d}" for i in range(n_tickers)]
+    df = pd.DataFrame({'date': np.tile(dates, n_tickers), 'ticker': np.repeat(tickers, n_days),
+                       'close': close.ravel()})
+    single = pd.DataFrame({'date': [dates[10]], 'ticker': ['SOLO'], 'close': [42.0]})
+    return pd.concat([df, single], ignore_index=True).sort_values(['ticker', 'date'], ignore_index=True)
+
+
+@pytest.fixture(params=[0, 1, 2], ids=lambda seed: f"seed{seed}")
+def df(request):
+    return market(seed=request.param)
+
+
+def test_compute_yearly_returns_matches_loop(df):
+    assert_frame_equal(analysis.compute_yearly_returns(df), reference_compute_yearly_returns(df))
+
+
+def test_compute_yearly_returns_ignores_row_order(df):
+    shuffled = df.sample(frac=1, random_state=0)
+    assert_frame_equal(analysis.compute_yearly_returns(shuffled), reference_compute_yearly_returns(df))
+
+
+def test_app_yearly_returns_matches_loop(df):
+    result = dashboard_metrics.yearly_returns(df)
+    assert 'SOLO' not in set(result['ticker'])
+    assert_frame_equal(result, reference_app_yearly_returns(df))
+
+
+@pytest.mark.parametrize("n_tickers", [8, 24, 40])
+def test_monthly_gainers_losers_matches_loop(n_tickers):
+    df = market(n_tickers=n_tickers)
+    expected = reference_monthly_gainers_losers(df)
+    result = analysis.monthly_gainers_losers(df)
+    assert list(result) == list(expected)
+    for month, ranks in expected.items():
+        for side in ('top5', 'bottom5'):
+            assert_frame_equal(result[month][side].reset_index(drop=True), ranks[side].reset_index(drop=True),
+                               check_dtype=False)
+
+
+def test_monthly_gainers_losers_leaves_input_untouched(df):
+    before = df.copy()
+    analysis.monthly_gainers_losers(df)
+    assert_frame_equal(df, before)
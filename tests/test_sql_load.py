@@ -0,0 +1,190 @@
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import text
+
+import load
+from db import make_engine
+
+# Bulk modes SQLite runs natively ("infile" is MySQL's LOAD DATA)
+SQLITE_MODES = ["executemany", "multi"]
+N_TICKERS = 40
+MONTHS = ["2024-01", "2024-02", "2024-03"]
+
+
+def write_monthly_csvs(root):
+    # CSV_data/<month>/<ticker>.csv as ingest.py writes them; returns the
+    # expected {(month, ticker): rows}
+    rng = np.random.default_rng(0)
+    expected = {}
+    for month in MONTHS:
+        dates = pd.bdate_range(f"{month}-01", pd.Period(month, 'M').end_time.normalize())
+        os.makedirs(os.path.join(root, month))
+        for i in range(N_TICKERS):
+            ticker = f"T{i:02d}"
+            close = 100 + rng.normal(0, 1, len(dates)).cumsum()
+            pd.DataFrame({'date': dates + pd.Timedelta(hours=5, minutes=30), 'open': close, 'high': close + 1,
+                          'low': close - 1, 'close': close, 'volume': rng.integers(1000, 10**6, len(dates))}
+                         ).to_csv(os.path.join(root, month, f"{ticker}.csv"), index=False)
+            expected[(month, ticker)] = len(dates)
+    return expected
+
+
+@pytest.fixture
+def csv_root(tmp_path):
+    root = tmp_path / "CSV_data"
+    return str(root), write_monthly_csvs(str(root))
+
+
+@pytest.mark.parametrize("mode", SQLITE_MODES)
+def test_load_stock_raw_sqlite(tmp_path, csv_root, mode):
+    root, expected = csv_root
+    engine = make_engine(f"sqlite:///{tmp_path / 'stocks.db'}")
+    load.load_stock_raw(engine, csv_root=root, mode=mode, chunk_size=500)
+    with engine.connect() as conn:
+        n_raw = conn.execute(text("SELECT COUNT(*) FROM stock_raw")).scalar()
+        n_keys = conn.execute(text("SELECT COUNT(*) FROM (SELECT DISTINCT ticker, date FROM stock_raw)")).scalar()
+        files = pd.read_sql("SELECT source_month, ticker, n_rows FROM loaded_files", con=conn)
+    assert n_raw == n_keys == sum(expected.values())
+    assert {(m, t): n for m, t, n in files.itertuples(index=False)} == expected
+
+
+def test_load_stock_raw_replaces_previous_load(tmp_path, csv_root):
+    # A second full load rebuilds the table instead of appending to it
+    root, expected = csv_root
+    engine = make_engine(f"sqlite:///{tmp_path / 'stocks.db'}")
+    load.load_stock_raw(engine, csv_root=root)
+    load.load_stock_raw(engine, csv_root=root, mode="multi")
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT COUNT(*) FROM stock_raw")).scalar() == sum(expected.values())
+        assert conn.execute(text("SELECT COUNT(*) FROM loaded_files")).scalar() == len(expected)
+
+
+def test_incremental_rebuilds_legacy_stock_raw(tmp_path, csv_root):
+    # The original loader created stock_raw with to_sql (TEXT ticker, no unique
+    # index) and no loaded_files: the first incremental run rebuilds it
+    root, expected = csv_root
+    engine = make_engine(f"sqlite:///{tmp_path / 'stocks.db'}")
+    legacy = load.read_monthly_csvs(root)
+    legacy.to_sql("stock_raw", con=engine, index=False)
+    legacy.head(10).to_sql("stock_raw", con=engine, index=False, if_exists="append")   # duplicates
+
+    assert load.load_incremental(engine, csv_root=root) is None   # None = every ticker affected
+    with engine.connect() as conn:
+        assert not load.legacy_stock_raw(conn)
+        assert conn.execute(text("SELECT COUNT(*) FROM stock_raw")).scalar() == sum(expected.values())
+        assert conn.execute(text("SELECT COUNT(*) FROM loaded_files")).scalar() == len(expected)
+    assert load.load_incremental(engine, csv_root=root) == []
+
+
+def test_incremental_drops_rows_gone_from_files(tmp_path, csv_root):
+    root, expected = csv_root
+    engine = make_engine(f"sqlite:///{tmp_path / 'stocks.db'}")
+    load.load_incremental(engine, csv_root=root)
+
+    # T00's February file loses its last 5 rows; T01's March file is deleted
+    path = os.path.join(root, "2024-02", "T00.csv")
+    pd.read_csv(path).iloc[:-5].to_csv(path, index=False)
+    os.remove(os.path.join(root, "2024-03", "T01.csv"))
+
+    assert load.load_incremental(engine, csv_root=root) == ["T00", "T01"]
+    with engine.connect() as conn:
+        counts = dict(conn.execute(text(
+            "SELECT ticker, COUNT(*) FROM stock_raw WHERE ticker IN ('T00', 'T01', 'T02') GROUP BY ticker")).all())
+        files = pd.read_sql("SELECT source_month, ticker, n_rows FROM loaded_files", con=conn)
+    per_ticker = sum(n for (m, t), n in expected.items() if t == "T02")
+    assert counts == {"T00": per_ticker - 5, "T01": per_ticker - expected[("2024-03", "T01")], "T02": per_ticker}
+    files = {(m, t): n for m, t, n in files.itertuples(index=False)}
+    assert ("2024-03", "T01") not in files
+    assert files[("2024-02", "T00")] == expected[("2024-02", "T00")] - 5
+
+
+def test_pair_correlation_matches_pandas(tmp_path, csv_root, monkeypatch):
+    # Blocked correlation (3 tickers per block here) on a full and an
+    # incremental refresh equals pivot.corr() over the fully populated tickers
+    monkeypatch.setattr(load, "CORR_BLOCK", 3)
+    root, _ = csv_root
+    engine = make_engine(f"sqlite:///{tmp_path / 'stocks.db'}")
+
+    def check():
+        with engine.connect() as conn:
+            corr = pd.read_sql("SELECT ticker_a, ticker_b, corr FROM stock_price_corr", con=conn)
+            clean = pd.read_sql("SELECT ticker, trade_date, close FROM stock_clean", con=conn)
+        expected = clean.pivot(index="trade_date", columns="ticker", values="close").corr()
+        result = corr.pivot(index="ticker_a", columns="ticker_b", values="corr")
+        assert len(corr) == len(expected) ** 2
+        pd.testing.assert_frame_equal(result, expected, check_names=False, rtol=1e-9)
+
+    load.load_incremental(engine, csv_root=root)
+    load.refresh_derived(engine)
+    load.refresh_summaries(engine)
+    check()
+
+    path = os.path.join(root, "2024-02", "T03.csv")
+    prices = pd.read_csv(path)
+    prices.loc[3, "close"] += 5
+    prices.to_csv(path, index=False)
+    affected = load.load_incremental(engine, csv_root=root)
+    assert affected == ["T03"]
+    load.refresh_derived(engine, affected)
+    load.refresh_summaries(engine, affected)
+    check()
+
+
+def test_duckdb_switches_between_table_and_parquet_store(tmp_path, csv_root):
+    # stock_raw is a table while there is no Parquet store, a view over the
+    # store once one is written, and a table again after the store is removed
+    pytest.importorskip("duckdb_engine")
+    pytest.importorskip("pyarrow")
+    import store
+    from db import relation_type
+    root, expected = csv_root
+    store_dir = str(tmp_path / "master_store")
+    engine = make_engine(f"duckdb:///{tmp_path / 'stocks.duckdb'}")
+
+    def run():
+        affected = load.load_parquet_store(engine, store_dir)
+        if affected is False:
+            affected = load.load_incremental(engine, csv_root=root)
+        load.refresh_derived(engine, affected)
+        load.refresh_summaries(engine, affected)
+        with engine.connect() as conn:
+            return (relation_type(conn, "stock_raw"),
+                    conn.execute(text("SELECT COUNT(*) FROM stock_raw")).scalar(),
+                    conn.execute(text("SELECT COUNT(*) FROM stock_clean")).scalar())
+
+    total = sum(expected.values())
+    assert run() == ("table", total, total)
+
+    df = load.read_monthly_csvs(root)
+    df = df[df['date'] < "2024-03-01"].drop(columns="source_month")
+    store.write_store(df, store_dir)
+    assert run() == ("view", len(df), len(df))
+
+    shutil.rmtree(store_dir)
+    assert run() == ("table", total, total)
+
+
+def test_summary_views_replace_legacy_snapshot_tables(tmp_path, csv_root):
+    # The original cleaning SQL left top_10_green / top_10_red /
+    # stock_market_summary as tables: the refresh replaces them with views
+    from db import relation_type
+    root, _ = csv_root
+    engine = make_engine(f"sqlite:///{tmp_path / 'stocks.db'}")
+    with engine.begin() as conn:
+        for table in load.SUMMARY_VIEWS:
+            conn.execute(text(f"CREATE TABLE {table} (ticker TEXT, stale INTEGER)"))
+            conn.execute(text(f"INSERT INTO {table} VALUES ('OLD', 1)"))
+
+    load.load_incremental(engine, csv_root=root)
+    load.refresh_derived(engine)
+    load.refresh_summaries(engine)
+    with engine.connect() as conn:
+        assert {relation_type(conn, view) for view in load.SUMMARY_VIEWS} == {"view"}
+        green = pd.read_sql("SELECT * FROM top_10_green", con=conn)
+        stats = pd.read_sql("SELECT ticker, yearly_return_pct FROM stock_ticker_stats", con=conn)
+    assert len(green) == 10 and "OLD" not in set(green["ticker"])
+    assert list(green["ticker"]) == list(stats.nlargest(10, "yearly_return_pct")["ticker"])
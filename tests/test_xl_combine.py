@@ -0,0 +1,43 @@
+import pandas as pd
+import pytest
+
+import benchmark
+import xl_combine
+from features import SECTOR_CSV, build_features, flat_analytics, flat_analytics_chunks, load_sector_map
+from store import read_master_csv
+
+N_TICKERS = 5
+N_DAYS = 60        # 300 analytics rows
+MAX_ROWS = 101     # 100 data rows per sheet: three Analytics sheets
+
+
+@pytest.fixture
+def features(tmp_path, monkeypatch):
+    benchmark.generate(str(tmp_path), N_TICKERS, N_DAYS, yaml_tree=False)
+    monkeypatch.chdir(tmp_path)
+    return build_features(read_master_csv(), load_sector_map(SECTOR_CSV))
+
+
+@pytest.mark.parametrize("chunk_rows", [7, 100, 1000])
+def test_chunks_match_flat_analytics(features, chunk_rows):
+    chunks = list(flat_analytics_chunks(features, chunk_rows))
+    assert max(len(c) for c in chunks) <= chunk_rows
+    pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True), flat_analytics(features))
+
+
+@pytest.mark.parametrize("writer", [xl_combine.write_excel_streaming, xl_combine.write_excel_pandas])
+def test_writers_roll_over_to_extra_sheets(features, writer):
+    expected = flat_analytics(features)
+    n_rows = writer(flat_analytics_chunks(features, 7), list(expected.columns), features['corr'],
+                    "out.xlsx", max_rows=MAX_ROWS)
+
+    sheets = pd.read_excel("out.xlsx", sheet_name=None)
+    assert list(sheets) == ['Analytics', 'Analytics_2', 'Analytics_3', 'Correlation']
+    assert n_rows == len(expected)
+    analytics = pd.concat([sheets[name] for name in ['Analytics', 'Analytics_2', 'Analytics_3']],
+                          ignore_index=True)
+    assert [len(sheets[name]) for name in ['Analytics', 'Analytics_2', 'Analytics_3']] == [100, 100, 100]
+    assert list(analytics.columns) == list(expected.columns)
+    assert (analytics['ticker'] == expected['ticker']).all()
+    pd.testing.assert_series_equal(analytics['close'], expected['close'], check_names=False)
+    assert (analytics['month'].astype(str) == expected['month'].astype(str)).all()
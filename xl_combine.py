@@ -1,57 +1,142 @@
 import pandas as pd
 import numpy as np
 import os
+import time
+from itertools import chain
+
+from store import load_master
+from features import load_sector_map, build_features, flat_analytics_chunks
+from instrument import traced
+
+# xlsxwriter is optional: without it the streaming mode falls back to the
+# pandas writer (openpyxl).
+try:
+    import xlsxwriter
+except ImportError:
+    xlsxwriter = None
 
 # File paths
 master_csv = "cleaned_master_stock_data.csv"
 sector_csv = "Sector_data - Sheet1.csv"
 excel_out = "nifty50_master_analytics_and_corr.xlsx"
 
-# Remove old output to avoid duplication
-if os.path.exists(excel_out):
-    os.remove(excel_out)
-    print(f"Deleted existing file: {excel_out}")
-
-# 1. Load data and sector map
-df = pd.read_csv(master_csv, parse_dates=["date"])
-sector_map = pd.read_csv(sector_csv)
-sector_map['ticker'] = sector_map['Symbol'].apply(lambda x: x.split(': ')[-1])
-sector_map = sector_map[['ticker', 'sector']]
-
-# 2. Merge sector info
-df = df.merge(sector_map, on="ticker", how="left")
-
-# 3. Compute daily return
-df['daily_return'] = df.groupby('ticker')['close'].pct_change()
-
-# 4. Compute cumulative return
-df['cumulative_return'] = df.groupby('ticker')['daily_return'].transform(lambda x: (1 + x.fillna(0)).cumprod() - 1)
-
-# 5. Yearly return and volatility
-def get_yearly_return(x):
-    if len(x) < 2:
-        return np.nan
-    return (x.iloc[-1] - x.iloc[0]) / x.iloc[0]
-yearly_return = df.groupby('ticker')['close'].apply(get_yearly_return)
-volatility = df.groupby('ticker')['daily_return'].std()
-df['yearly_return'] = df['ticker'].map(yearly_return) * 100
-df['volatility'] = df['ticker'].map(volatility)
-
-# 6. Monthly return
-df['month'] = df['date'].dt.to_period('M')
-monthly_first = df.groupby(['ticker', 'month'])['close'].first()
-monthly_last = df.groupby(['ticker', 'month'])['close'].last()
-monthly_return = ((monthly_last - monthly_first) / monthly_first).rename('monthly_return')
-monthly_return = (monthly_return * 100).reset_index()
-df = pd.merge(df, monthly_return, on=['ticker', 'month'], how='left')
-
-# 7. Correlation matrix
-close_pivot = df.pivot(index="date", columns="ticker", values="close")
-corr = close_pivot.corr()
-
-# 8. Write both tables to single Excel file (two sheets)
-with pd.ExcelWriter(excel_out) as writer:
-    df.to_excel(writer, sheet_name='Analytics', index=False)
-    corr.to_excel(writer, sheet_name='Correlation')
-
-print(f"✅ Analytics and correlation written to {excel_out}")
+# Export mode. Both build the analytics CHUNK_ROWS rows at a time and add
+# Analytics_2, Analytics_3, ... sheets past Excel's row limit.
+#   "streaming": xlsxwriter in constant_memory mode, each chunk written as it is built
+#   "pandas":    df.to_excel per chunk through the default writer (openpyxl,
+#                which keeps the workbook in memory), also used when xlsxwriter
+#                is not installed
+EXPORT_MODE = "streaming"
+CHUNK_ROWS = 50000            # rows built, converted and written per chunk
+EXCEL_MAX_ROWS = 1048576      # per sheet, header row included
+
+
+def _excel_values(chunk):
+    # Cell values for xlsxwriter: missing values become None (left blank, as
+    # to_excel does) and periods are written as text ('2024-01')
+    values = chunk.astype(object)
+    for col in chunk.columns:
+        if isinstance(chunk[col].dtype, pd.PeriodDtype):
+            values[col] = chunk[col].astype(str)
+    return values.where(chunk.notna(), None)
+
+
+def _sheet_name(n):
+    return 'Analytics' if n == 1 else f'Analytics_{n}'
+
+
+def _sheet_pieces(chunks, rows_per_sheet):
+    # (sheet number, data rows already in that sheet, rows) pieces of the
+    # chunks, split so each piece fits in one sheet
+    sheet, row = 1, 0
+    for chunk in chunks:
+        start = 0
+        while start < len(chunk):
+            if row == rows_per_sheet:
+                sheet, row = sheet + 1, 0
+            piece = chunk.iloc[start:start + rows_per_sheet - row]
+            yield sheet, row, piece
+            row += len(piece)
+            start += len(piece)
+
+
+def write_excel_streaming(chunks, columns, corr, path, max_rows=EXCEL_MAX_ROWS):
+    # constant_memory flushes each row to disk as soon as the next one starts,
+    # so memory stays flat however many rows are written; rows must therefore
+    # go out in order, one sheet after the other. Returns the data rows written.
+    workbook = xlsxwriter.Workbook(path, {'constant_memory': True,
+                                          'default_date_format': 'yyyy-mm-dd hh:mm:ss'})
+    sheet, current, total = None, 0, 0
+    for n, row, piece in _sheet_pieces(chunks, max_rows - 1):
+        if n != current:
+            sheet, current = workbook.add_worksheet(_sheet_name(n)), n
+            sheet.write_row(0, 0, columns)
+        for i, values in enumerate(_excel_values(piece).itertuples(index=False, name=None), start=row + 1):
+            sheet.write_row(i, 0, values)
+        total += len(piece)
+    if sheet is None:
+        workbook.add_worksheet('Analytics').write_row(0, 0, columns)
+
+    # Correlation matrix on its own sheet, laid out like corr.to_excel
+    corr_sheet = workbook.add_worksheet('Correlation')
+    corr_sheet.write_row(0, 0, [corr.index.name or ''] + [str(c) for c in corr.columns])
+    for i, (ticker, row) in enumerate(zip(corr.index, corr.to_numpy()), start=1):
+        corr_sheet.write(i, 0, ticker)
+        corr_sheet.write_row(i, 1, [None if np.isnan(v) else v for v in row])
+    workbook.close()
+    return total
+
+
+def write_excel_pandas(chunks, columns, corr, path, max_rows=EXCEL_MAX_ROWS):
+    # to_excel per chunk into the default writer, with the same sheet rollover
+    # (one to_excel call past the row limit raises). Returns the data rows written.
+    total = 0
+    with pd.ExcelWriter(path) as writer:
+        for n, row, piece in _sheet_pieces(chunks, max_rows - 1):
+            piece.to_excel(writer, sheet_name=_sheet_name(n), index=False,
+                           header=row == 0, startrow=0 if row == 0 else row + 1)
+            total += len(piece)
+        if total == 0:
+            pd.DataFrame(columns=columns).to_excel(writer, sheet_name='Analytics', index=False)
+        corr.to_excel(writer, sheet_name='Correlation')
+    return total
+
+
+@traced()
+def export(features, path=excel_out, mode=EXPORT_MODE):
+    # Analytics sheet(s) + Correlation sheet in one workbook; returns the paths written
+    corr = features['corr']
+    if mode == "streaming" and xlsxwriter is None:
+        print("⚠️ xlsxwriter not installed, writing the workbook with the pandas writer")
+        mode = "pandas"
+    start = time.perf_counter()
+    chunks = flat_analytics_chunks(features, CHUNK_ROWS)
+    first = next(chunks)
+    columns = list(first.columns)
+    writer = write_excel_streaming if mode == "streaming" else write_excel_pandas
+    n_rows = writer(chain([first], chunks), columns, corr, path)
+    elapsed = time.perf_counter() - start
+
+    size_mb = os.path.getsize(path) / 1e6
+    print(f"✅ Analytics and correlation written to {path}")
+    print(f"   {n_rows} rows x {len(columns)} columns in {elapsed:.2f}s "
+          f"({n_rows / max(elapsed, 1e-9):,.0f} rows/s, {size_mb / max(elapsed, 1e-9):.1f} MB/s, mode={mode})")
+    return [path]
+
+
+if __name__ == '__main__':
+    # Remove old output to avoid duplication
+    if os.path.exists(excel_out):
+        os.remove(excel_out)
+        print(f"Deleted existing file: {excel_out}")
+
+    # 1. Load data and sector map
+    df = load_master(csv_path=master_csv)
+    sector_map = load_sector_map(sector_csv)
+
+    # 2. Sector, daily/cumulative returns, yearly return and volatility, monthly
+    #    return and the closing-price correlation (features.py)
+    features = build_features(df, sector_map)
+
+    # 3. Write both tables to single Excel file (Analytics sheet(s) + Correlation sheet)
+    export(features)